@@ -0,0 +1,75 @@
+"""
+Mide cuánto tarda un login (bcrypt) según el coste configurado.
+
+Sirve para elegir el valor de FACTURAX_BCRYPT_ROUNDS en el ordenador donde se
+va a usar la aplicación: lo normal es quedarse con el coste más alto que siga
+dejando el login por debajo de un cuarto de segundo más o menos.
+
+Uso:
+    python benchmarks/bench_login.py
+    python benchmarks/bench_login.py --costes 10 11 12 13 --repeticiones 10 --json login.json
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Para poder importar `facturax` ejecutando el script desde cualquier carpeta.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from facturax.seguridad import GestorContrasenas  # noqa: E402
+
+
+def medir_coste(rounds, repeticiones, contrasena="contraseña-de-prueba"):
+    """Devuelve los tiempos (en ms) de crear el hash y de comprobarlo para un coste."""
+    gestor = GestorContrasenas(rounds=rounds, max_hilos=1)
+    tiempos_hash = []
+    tiempos_login = []
+    try:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            hash_guardado = gestor.hash(contrasena)
+            tiempos_hash.append((time.perf_counter() - inicio) * 1000)
+
+            # El login es justo esto: un checkpw contra el hash guardado.
+            inicio = time.perf_counter()
+            gestor.verificar(contrasena, hash_guardado)
+            tiempos_login.append((time.perf_counter() - inicio) * 1000)
+    finally:
+        gestor.ejecutor.shutdown(wait=False)
+
+    return {
+        "rounds": rounds,
+        "repeticiones": repeticiones,
+        "hash_ms_mediana": round(statistics.median(tiempos_hash), 2),
+        "login_ms_mediana": round(statistics.median(tiempos_login), 2),
+        "login_ms_min": round(min(tiempos_login), 2),
+        "login_ms_max": round(max(tiempos_login), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latencia del login por coste de bcrypt.")
+    parser.add_argument("--costes", type=int, nargs="+", default=[8, 10, 11, 12, 13, 14])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--json", dest="salida_json", help="Guarda los resultados en este archivo JSON.")
+    args = parser.parse_args(argv)
+
+    resultados = []
+    print(f"{'coste':>5}  {'hash (ms)':>10}  {'login (ms)':>10}  {'min':>8}  {'max':>8}")
+    for rounds in args.costes:
+        r = medir_coste(rounds, args.repeticiones)
+        resultados.append(r)
+        print(f"{rounds:>5}  {r['hash_ms_mediana']:>10.1f}  {r['login_ms_mediana']:>10.1f}  "
+              f"{r['login_ms_min']:>8.1f}  {r['login_ms_max']:>8.1f}")
+
+    if args.salida_json:
+        with open(args.salida_json, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "login_bcrypt", "resultados": resultados}, f, indent=4)
+    return resultados
+
+
+if __name__ == "__main__":
+    main()
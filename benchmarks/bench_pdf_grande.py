@@ -0,0 +1,138 @@
+"""
+Mide la memoria (pico de RSS) y el tiempo de generar el PDF de facturas muy
+grandes (miles de líneas).
+
+Cada PDF se genera en un proceso nuevo: el pico de RSS de un proceso solo sube,
+así que medir varias facturas en el mismo proceso no diría nada. Se apunta el
+RSS del proceso hijo justo antes de generar el PDF (ya con todo importado) y el
+pico al terminar; la diferencia es lo que cuesta el PDF. "por 1k líneas" es
+cuánto crece ese pico por cada 1000 líneas más entre la factura más pequeña y
+la más grande: si la memoria no depende del número de líneas, sale cerca de 0.
+
+El pico de RSS se lee con el módulo `resource` (Linux y macOS); en Windows solo
+se mide el tiempo.
+
+Uso:
+    python benchmarks/bench_pdf_grande.py
+    python benchmarks/bench_pdf_grande.py --lineas 1000 5000 20000 --json pdf_grande.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Para poder importar `facturax` ejecutando el script desde cualquier carpeta.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from facturax.configuracion import CONFIG_POR_DEFECTO  # noqa: E402
+from facturax.db import DatabaseManager  # noqa: E402
+from facturax.facturas import guardar_factura_db  # noqa: E402
+from facturax.modelos import LineaFactura  # noqa: E402
+from facturax.pdf import generar_pdf_factura  # noqa: E402
+
+try:
+    import resource
+except ImportError:         # Windows
+    resource = None
+
+
+def rss_pico_kb():
+    """Pico de RSS del proceso en KB (None si no se puede saber)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # En macOS ru_maxrss va en bytes; en Linux, en KB.
+    return pico // 1024 if sys.platform == "darwin" else pico
+
+
+def crear_facturas(db_manager, tamanos):
+    """Una factura por cada número de líneas de `tamanos` (mitad productos, mitad servicios). Devuelve sus ids."""
+    db_manager.crear_tablas()
+    with db_manager.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO clientes (nombre, apellido, cif, direccion, ciudad, cp, email, telefono) "
+                       "VALUES ('Mayorista', 'Grande S.L.', 'B99999999', 'Polígono 1', 'Madrid', '28000', "
+                       "'compras@ejemplo.com', '600000000')")
+        cliente_id = cursor.lastrowid
+        ids = []
+        # El nombre y el tipo de cada línea salen de su producto: uno de cada tipo, alternando.
+        productos = []
+        for nombre, tipo, irpf in (("Cartucho de tóner compatible de alta capacidad", "Producto", 0.0),
+                                   ("Mantenimiento preventivo de equipos", "Servicio", 0.15)):
+            cursor.execute("INSERT INTO productos (nombre, descripcion, precio, tipo, iva_rate, irpf_rate) "
+                           "VALUES (?, '', 1.0, ?, 0.21, ?)", (nombre, tipo, irpf))
+            productos.append((cursor.lastrowid, nombre, tipo, irpf))
+        for n in tamanos:
+            lineas = [LineaFactura(producto_id, nombre, 1 + i % 7, 3.5 + i % 40, 0.21, irpf, tipo)
+                      for i in range(n) for producto_id, nombre, tipo, irpf in [productos[i % 2]]]
+            total = round(sum(linea.total for linea in lineas), 2)
+            ids.append(guardar_factura_db(conn, cliente_id, lineas, total, fecha="2026-01-15"))
+        conn.commit()
+    return ids
+
+
+def _hijo(db_path, factura_id, directorio):
+    # Proceso nuevo: solo genera un PDF y dice cuánta memoria y tiempo ha hecho falta.
+    db_manager = DatabaseManager(db_path)
+    inicio_kb = rss_pico_kb()
+    inicio = time.perf_counter()
+    ruta = generar_pdf_factura(db_manager, factura_id, dict(CONFIG_POR_DEFECTO), directorio, forzar=True)
+    segundos = time.perf_counter() - inicio
+    print(json.dumps({"inicio_kb": inicio_kb, "pico_kb": rss_pico_kb(), "segundos": segundos,
+                      "bytes_pdf": os.path.getsize(ruta)}))
+
+
+def medir_memoria(tamanos=(1000, 2000, 5000)):
+    """Genera el PDF de una factura de cada tamaño en un proceso aparte. Devuelve las medidas de cada una."""
+    tamanos = sorted(tamanos)
+    resultados = []
+    with tempfile.TemporaryDirectory(prefix="facturax-pdf-grande-") as carpeta:
+        db_path = os.path.join(carpeta, "pdf_grande.db")
+        ids = crear_facturas(DatabaseManager(db_path), tamanos)
+        for n, factura_id in zip(tamanos, ids):
+            salida = subprocess.run([sys.executable, __file__, "--hijo", db_path, str(factura_id), carpeta],
+                                    capture_output=True, text=True, check=True).stdout
+            medida = json.loads(salida.strip().splitlines()[-1])
+            medida["lineas"] = n
+            if medida["pico_kb"] is not None:
+                medida["pdf_mb"] = round((medida["pico_kb"] - medida["inicio_kb"]) / 1024, 1)
+                medida["pico_mb"] = round(medida["pico_kb"] / 1024, 1)
+            resultados.append(medida)
+    # Cuánto crece el pico por cada 1000 líneas más (entre la más pequeña y la más grande).
+    primera, ultima = resultados[0], resultados[-1]
+    por_1k = None
+    if len(resultados) > 1 and primera["pico_kb"] is not None:
+        por_1k = round((ultima["pico_kb"] - primera["pico_kb"]) / 1024 / (ultima["lineas"] - primera["lineas"]) * 1000, 2)
+    return resultados, por_1k
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memoria y tiempo del PDF de facturas muy grandes.")
+    parser.add_argument("--lineas", type=int, nargs="+", default=[1000, 2000, 5000])
+    parser.add_argument("--json", dest="salida_json", help="Guarda los resultados en este archivo JSON.")
+    parser.add_argument("--hijo", nargs=3, metavar=("DB", "FACTURA", "CARPETA"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.hijo:
+        _hijo(args.hijo[0], int(args.hijo[1]), args.hijo[2])
+        return None
+
+    resultados, por_1k = medir_memoria(args.lineas)
+    print(f"{'líneas':>7}  {'tiempo (s)':>10}  {'pico RSS (MB)':>13}  {'del PDF (MB)':>12}  {'PDF (KB)':>9}")
+    for r in resultados:
+        print(f"{r['lineas']:>7}  {r['segundos']:>10.2f}  {r.get('pico_mb', '-'):>13}  {r.get('pdf_mb', '-'):>12}  "
+              f"{r['bytes_pdf'] // 1024:>9}")
+    if por_1k is not None:
+        print(f"El pico de RSS crece {por_1k} MB por cada 1000 líneas.")
+
+    if args.salida_json:
+        with open(args.salida_json, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "pdf_grande", "resultados": resultados, "rss_mb_por_1k_lineas": por_1k}, f, indent=4)
+    return resultados
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Prueba de carga de la API HTTP (ver facturax/api.py).
+
+Lanza `--clientes` clientes a la vez durante `--segundos`. Cada uno abre una
+conexión keep-alive y repite una mezcla de peticiones parecida a la de la tienda
+web: listados de facturas con filtros y páginas, ver una factura, crear
+facturas, cambiar su estado y, de vez en cuando, descargar el PDF. Al final
+saca peticiones por segundo y la latencia (mediana, p95, p99) de cada tipo.
+
+Sin --url arranca la API en este mismo proceso sobre una base de datos temporal
+con datos inventados (generador.py); con --url prueba una API que ya esté en marcha.
+
+Uso:
+    python benchmarks/carga_api.py --clientes 32 --segundos 20
+    python benchmarks/carga_api.py --url http://127.0.0.1:8765 --token secreto
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from facturax.api import ServidorApi  # noqa: E402
+from facturax.db import DatabaseManager  # noqa: E402
+from facturax.seguridad import GestorContrasenas  # noqa: E402
+from generador import generar_datos  # noqa: E402
+
+# (peso, tipo de petición)
+MEZCLA = [(40, "listar"), (20, "ver"), (20, "crear"), (10, "estado"), (5, "clientes"), (5, "pdf")]
+
+
+class Cliente:
+    """Un cliente HTTP/1.1 mínimo con una conexión keep-alive."""
+
+    def __init__(self, host, puerto, token=None):
+        self.host, self.puerto, self.token = host, puerto, token
+        self.lector = self.escritor = None
+
+    async def peticion(self, metodo, ruta, datos=None):
+        if self.escritor is None:
+            self.lector, self.escritor = await asyncio.open_connection(self.host, self.puerto)
+        cuerpo = json.dumps(datos).encode("utf-8") if datos is not None else b""
+        cabeceras = [f"{metodo} {ruta} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(cuerpo)}"]
+        if datos is not None:
+            cabeceras.append("Content-Type: application/json")
+        if self.token:
+            cabeceras.append(f"Authorization: Bearer {self.token}")
+        self.escritor.write(("\r\n".join(cabeceras) + "\r\n\r\n").encode("latin-1") + cuerpo)
+        await self.escritor.drain()
+
+        estado = int((await self.lector.readline()).split()[1])
+        longitud, tipo = 0, ""
+        while True:
+            linea = await self.lector.readline()
+            if linea in (b"\r\n", b""):
+                break
+            nombre, _, valor = linea.decode("latin-1").partition(":")
+            if nombre.lower() == "content-length":
+                longitud = int(valor)
+            elif nombre.lower() == "content-type":
+                tipo = valor.strip()
+        contenido = await self.lector.readexactly(longitud)
+        return estado, json.loads(contenido) if tipo.startswith("application/json") else contenido
+
+    def cerrar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+
+
+async def un_cliente(n, host, puerto, token, fin, tiempos, errores, ids):
+    rnd = random.Random(n)
+    cliente = Cliente(host, puerto, token)
+    tipos = [tipo for peso, tipo in MEZCLA for _ in range(peso)]
+    try:
+        while time.perf_counter() < fin:
+            tipo = rnd.choice(tipos)
+            if tipo == "listar":
+                anio = rnd.randint(2020, 2025)
+                ruta = (f"/facturas?desde={anio}-01-01&hasta={anio}-12-31&pagina={rnd.randint(0, 3)}&tamano=50"
+                        + rnd.choice(["", "&estado=Pagada", "&cliente=garc", "&importe_min=500", "&orden=fecha&desc=1"]))
+                peticion = ("GET", ruta, None)
+            elif tipo == "ver":
+                peticion = ("GET", f"/facturas/{rnd.choice(ids)}", None)
+            elif tipo == "crear":
+                lineas = [{"producto_id": rnd.randint(1, 200), "cantidad": rnd.randint(1, 5)}
+                          for _ in range(rnd.randint(1, 6))]
+                peticion = ("POST", "/facturas", {"cliente_id": rnd.randint(1, 1000), "lineas": lineas})
+            elif tipo == "estado":
+                peticion = ("POST", f"/facturas/{rnd.choice(ids)}/estado",
+                            {"estado": rnd.choice(["Pagada", "Pendiente"])})
+            elif tipo == "clientes":
+                peticion = ("GET", f"/clientes?nombre={rnd.choice(['ana', 'luis', 'mar'])}&tamano=20", None)
+            else:
+                peticion = ("GET", f"/facturas/{rnd.choice(ids)}/pdf", None)
+
+            inicio = time.perf_counter()
+            estado, respuesta = await cliente.peticion(*peticion)
+            tiempos[tipo].append((time.perf_counter() - inicio) * 1000)
+            if estado >= 400:
+                errores[f"{tipo} {estado}"] += 1
+            elif tipo == "crear":
+                ids.append(respuesta["id"])
+    finally:
+        cliente.cerrar()
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+async def cargar(host, puerto, token, clientes, segundos):
+    estado, respuesta = await Cliente(host, puerto, token).peticion("GET", "/facturas?tamano=500&orden=fecha&desc=1")
+    ids = [factura["id"] for factura in respuesta["facturas"]]
+    tiempos, errores = defaultdict(list), defaultdict(int)
+    inicio = time.perf_counter()
+    await asyncio.gather(*(un_cliente(n, host, puerto, token, inicio + segundos, tiempos, errores, ids)
+                           for n in range(clientes)))
+    duracion = time.perf_counter() - inicio
+
+    total = sum(len(t) for t in tiempos.values())
+    print(f"[Carga] {clientes} clientes, {duracion:.1f} s: {total} peticiones, {total / duracion:.0f} peticiones/s")
+    print(f"  {'tipo':10} {'n':>6} {'mediana':>9} {'p95':>9} {'p99':>9}  (ms)")
+    for _peso, tipo in MEZCLA:
+        if tiempos[tipo]:
+            print(f"  {tipo:10} {len(tiempos[tipo]):>6} {statistics.median(tiempos[tipo]):>9.1f} "
+                  f"{percentil(tiempos[tipo], 95):>9.1f} {percentil(tiempos[tipo], 99):>9.1f}")
+    if errores:
+        print(f"[Carga] Errores: {dict(errores)}")
+    return not errores
+
+
+async def con_servidor_local(args):
+    with tempfile.TemporaryDirectory() as carpeta:
+        db_manager = DatabaseManager(str(Path(carpeta) / "carga.db"), GestorContrasenas(rounds=4))
+        generar_datos(db_manager, clientes=1000, productos=200, facturas=args.facturas)
+        api = ServidorApi(db_manager, hilos=args.hilos, procesos=args.procesos, directorio_pdf=str(Path(carpeta) / "pdf"))
+        servidor = await api.iniciar("127.0.0.1", 0)
+        puerto = servidor.sockets[0].getsockname()[1]
+        try:
+            return await cargar("127.0.0.1", puerto, None, args.clientes, args.segundos)
+        finally:
+            servidor.close()
+            api.cerrar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API HTTP de FacturaX.")
+    parser.add_argument("--url", help="API ya arrancada (http://host:puerto). Sin ella se arranca una temporal.")
+    parser.add_argument("--token", help="Token de la API (si lo pide).")
+    parser.add_argument("--clientes", type=int, default=16, help="Clientes a la vez.")
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--facturas", type=int, default=20000, help="Facturas de la base de datos temporal.")
+    parser.add_argument("--hilos", type=int, default=8, help="Hilos de base de datos de la API temporal.")
+    parser.add_argument("--procesos", type=int, default=2, help="Procesos de PDF de la API temporal.")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        partes = urlsplit(args.url)
+        correcto = asyncio.run(cargar(partes.hostname, partes.port or 80, args.token, args.clientes, args.segundos))
+    else:
+        correcto = asyncio.run(con_servidor_local(args))
+    return 0 if correcto else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
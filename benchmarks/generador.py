@@ -0,0 +1,132 @@
+"""
+Generador de datos de prueba para los benchmarks.
+
+Rellena una base de datos con el esquema de `DatabaseManager` con clientes,
+productos y facturas inventados. Con la misma semilla siempre salen los mismos
+datos, así los resultados de dos commits se pueden comparar.
+
+Uso (crea una base de datos suelta, por ejemplo para probar la aplicación con muchos datos):
+    python benchmarks/generador.py --salida /tmp/facturacion_grande.db --facturas 100000
+"""
+import argparse
+import random
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from facturax.db import DatabaseManager  # noqa: E402
+
+NOMBRES = ["Ana", "Luis", "María", "Carlos", "Lucía", "Javier", "Carmen", "Pablo", "Elena", "Diego",
+           "Sara", "Jorge", "Laura", "Miguel", "Paula", "Raúl", "Marta", "Alberto", "Nuria", "Sergio"]
+APELLIDOS = ["García", "Martínez", "López", "Sánchez", "Pérez", "Gómez", "Martín", "Jiménez", "Ruiz",
+             "Hernández", "Díaz", "Moreno", "Álvarez", "Muñoz", "Romero", "Alonso", "Gutiérrez", "Navarro"]
+CIUDADES = [("Madrid", "28001"), ("Barcelona", "08001"), ("Valencia", "46001"), ("Sevilla", "41001"),
+            ("Zaragoza", "50001"), ("Málaga", "29001"), ("Bilbao", "48001"), ("Móstoles", "28931")]
+CONCEPTOS_PRODUCTO = ["Teclado", "Ratón", "Monitor", "Portátil", "Impresora", "Disco SSD", "Router", "Cable HDMI"]
+CONCEPTOS_SERVICIO = ["Mantenimiento", "Instalación", "Soporte remoto", "Consultoría", "Formación", "Auditoría"]
+
+FECHA_INICIO = date(2020, 1, 1)
+DIAS = 6 * 365
+
+
+def generar_datos(db_manager, clientes=1000, productos=200, facturas=10000, lineas_por_factura=5, semilla=42):
+    """
+    Crea las tablas y las llena con datos inventados (siempre los mismos para la misma semilla).
+    Devuelve un diccionario con los volúmenes generados.
+    """
+    rnd = random.Random(semilla)
+    db_manager.crear_tablas()
+
+    with db_manager.get_db_connection() as conn:
+        cursor = conn.cursor()
+
+        filas_clientes = []
+        for i in range(1, clientes + 1):
+            ciudad, cp = rnd.choice(CIUDADES)
+            filas_clientes.append((rnd.choice(NOMBRES), f"{rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}",
+                                   f"B{i:08d}", f"Calle {rnd.randint(1, 300)}", ciudad, cp,
+                                   f"cliente{i}@ejemplo.com", f"6{rnd.randint(10000000, 99999999)}"))
+        cursor.executemany("INSERT INTO clientes (nombre, apellido, cif, direccion, ciudad, cp, email, telefono) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", filas_clientes)
+
+        filas_productos = []
+        for i in range(1, productos + 1):
+            if rnd.random() < 0.6:
+                tipo, nombre, irpf = "Producto", f"{rnd.choice(CONCEPTOS_PRODUCTO)} {i}", 0.0
+            else:
+                tipo, nombre, irpf = "Servicio", f"{rnd.choice(CONCEPTOS_SERVICIO)} {i}", 0.07
+            filas_productos.append((nombre, "", round(rnd.uniform(5, 900), 2), tipo, 0.21, irpf))
+        cursor.executemany("INSERT INTO productos (nombre, descripcion, precio, tipo, iva_rate, irpf_rate) "
+                           "VALUES (?, ?, ?, ?, ?, ?)", filas_productos)
+
+        cursor.execute("SELECT id, precio, iva_rate, irpf_rate FROM productos")
+        catalogo = cursor.fetchall()
+
+        # Las facturas se insertan por bloques para no tener millones de tuplas en memoria.
+        bloque_facturas = []
+        bloque_lineas = []
+        bloque_cobros = []
+        siguiente_id = (cursor.execute("SELECT COALESCE(MAX(id), 0) FROM facturas").fetchone()[0]) + 1
+        for factura_id in range(siguiente_id, siguiente_id + facturas):
+            total = 0.0
+            for _ in range(rnd.randint(1, 2 * lineas_por_factura - 1)):
+                producto_id, precio, iva_rate, irpf_rate = rnd.choice(catalogo)
+                cantidad = rnd.randint(1, 10)
+                subtotal = round(cantidad * precio, 2)
+                total += subtotal + round(subtotal * iva_rate, 2) - round(subtotal * irpf_rate, 2)
+                bloque_lineas.append((factura_id, producto_id, cantidad, precio, iva_rate, irpf_rate))
+            dia = FECHA_INICIO + timedelta(days=rnd.randrange(DIAS))
+            fecha, total = dia.isoformat(), round(total, 2)
+            estado = "Pagada" if rnd.random() < 0.7 else "Pendiente"
+            # Una de cada cinco pendientes lleva cobrada la mitad. Sale del id y no de `rnd`,
+            # para que el resto de los datos sean los mismos que antes de que hubiera cobros.
+            cobrado = total if estado == "Pagada" else round(total / 2, 2) if factura_id % 5 == 0 else 0.0
+            if 0 < cobrado < total:
+                estado = "Parcial"
+            if cobrado:
+                fecha_cobro = (dia + timedelta(days=factura_id % 60)).isoformat()
+                bloque_cobros.append((factura_id, fecha_cobro, cobrado, "Transferencia"))
+            bloque_facturas.append((factura_id, rnd.randint(1, clientes), total, estado, fecha,
+                                    cobrado, round(total - cobrado, 2)))
+
+            if len(bloque_facturas) >= 5000:
+                _volcar(cursor, bloque_facturas, bloque_lineas, bloque_cobros)
+        _volcar(cursor, bloque_facturas, bloque_lineas, bloque_cobros)
+        conn.commit()
+
+    return {"clientes": clientes, "productos": productos, "facturas": facturas,
+            "lineas_por_factura": lineas_por_factura, "semilla": semilla}
+
+
+def _volcar(cursor, bloque_facturas, bloque_lineas, bloque_cobros):
+    cursor.executemany("INSERT INTO facturas (id, cliente_id, total, estado, fecha, cobrado, pendiente) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)", bloque_facturas)
+    cursor.executemany("INSERT INTO detalles_factura (factura_id, producto_id, cantidad, precio_unitario, "
+                       "iva_rate_aplicado, irpf_rate_aplicado) VALUES (?, ?, ?, ?, ?, ?)", bloque_lineas)
+    cursor.executemany("INSERT INTO cobros (factura_id, fecha, importe, forma) VALUES (?, ?, ?, ?)", bloque_cobros)
+    bloque_facturas.clear()
+    bloque_lineas.clear()
+    bloque_cobros.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rellena una base de datos de FacturaX con datos inventados.")
+    parser.add_argument("--salida", required=True, help="Ruta de la base de datos a crear.")
+    parser.add_argument("--clientes", type=int, default=1000)
+    parser.add_argument("--productos", type=int, default=200)
+    parser.add_argument("--facturas", type=int, default=10000)
+    parser.add_argument("--lineas", type=int, default=5, help="Líneas por factura (de media).")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if Path(args.salida).exists():
+        parser.error(f"{args.salida} ya existe; usa otra ruta para no mezclar datos.")
+    volumenes = generar_datos(DatabaseManager(args.salida), args.clientes, args.productos,
+                              args.facturas, args.lineas, args.semilla)
+    print(f"Base de datos creada en {args.salida}: {volumenes}")
+
+
+if __name__ == "__main__":
+    main()
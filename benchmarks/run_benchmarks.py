@@ -0,0 +1,342 @@
+"""
+Benchmarks de la capa de datos de FacturaX (sin abrir ninguna ventana).
+
+Crea una base de datos temporal con datos inventados (ver generador.py) y mide
+las operaciones que más se usan en la aplicación:
+
+- la consulta de `cargar_facturas` con cada combinación de filtros,
+- el buscador de `cargar_clientes`,
+- guardar una factura como hace `guardar_factura` (nueva y editando),
+- generar el PDF de `crear_pdf_factura` (desde cero y cuando ya está generado),
+- generar de golpe las facturas recurrentes de un mes (ver facturax/recurrentes.py),
+- el informe de antigüedad de los cobros pendientes y apuntar un cobro (ver facturax/cobros.py),
+- el extracto de cuenta del cliente con más facturas: los saldos y el PDF (ver facturax/extractos.py),
+- el PDF de facturas de miles de líneas: tiempo y pico de RSS (ver bench_pdf_grande.py),
+- el hash de bcrypt del login.
+
+Los resultados salen por pantalla y, con --json, en un archivo JSON. Pasando el
+JSON de otro commit con --comparar se ve qué ha ido más rápido o más lento.
+
+Uso:
+    python benchmarks/run_benchmarks.py --json resultados.json
+    python benchmarks/run_benchmarks.py --facturas 50000 --comparar resultados.json
+    python benchmarks/run_benchmarks.py --solo facturas
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+from facturax.db import DatabaseManager  # noqa: E402
+from facturax.configuracion import CONFIG_POR_DEFECTO  # noqa: E402
+from facturax.consultas import buscar_facturas, buscar_clientes  # noqa: E402
+from facturax.facturas import guardar_factura_db  # noqa: E402
+from facturax.pdf import generar_pdf_factura  # noqa: E402
+from facturax.recurrentes import crear_plantilla, generar_facturas  # noqa: E402
+from facturax.cobros import antiguedad, registrar_cobro  # noqa: E402
+from facturax.extractos import generar_extracto, movimientos  # noqa: E402
+from facturax.seguridad import rounds_configurados  # noqa: E402
+from generador import generar_datos  # noqa: E402
+from bench_login import medir_coste  # noqa: E402
+from bench_pdf_grande import medir_memoria  # noqa: E402
+
+
+def medir(funcion, repeticiones, calentamiento=1):
+    """Ejecuta `funcion` varias veces y devuelve estadísticas de tiempo en milisegundos."""
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        "repeticiones": repeticiones,
+        "min_ms": round(tiempos[0], 3),
+        "mediana_ms": round(statistics.median(tiempos), 3),
+        "p95_ms": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 3),
+        "media_ms": round(statistics.fmean(tiempos), 3),
+    }
+
+
+def valores_de_filtro(db_manager):
+    """Elige valores de filtro que existen en los datos generados (siempre los mismos)."""
+    with db_manager.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT c.apellido FROM clientes c ORDER BY c.id LIMIT 1")
+        apellido = cursor.fetchone()[0].split()[0]
+        cursor.execute("SELECT fecha FROM facturas ORDER BY id LIMIT 1")
+        fecha_iso = cursor.fetchone()[0]
+    fecha = datetime.strptime(fecha_iso, "%Y-%m-%d").strftime("%d/%m/%Y")
+    return {
+        "cliente": {"cliente": apellido},
+        "estado": {"estado": "Pendiente"},
+        "importe": {"min_importe": "100", "max_importe": "1500"},
+        "fecha": {"fecha": fecha},
+    }
+
+
+def bench_facturas(db_manager, repeticiones):
+    """`cargar_facturas`: una medida por cada combinación de filtros (16 en total)."""
+    resultados = {}
+    filtros = valores_de_filtro(db_manager)
+    nombres = list(filtros)
+    for n in range(len(nombres) + 1):
+        for combinacion in itertools.combinations(nombres, n):
+            parametros = {}
+            for nombre in combinacion:
+                parametros.update(filtros[nombre])
+
+            def consulta():
+                with db_manager.get_db_connection() as conn:
+                    return buscar_facturas(conn.cursor(), **parametros)
+
+            clave = "cargar_facturas[" + ("+".join(combinacion) or "sin_filtros") + "]"
+            resultados[clave] = medir(consulta, repeticiones)
+            resultados[clave]["filas"] = len(consulta())
+    return resultados
+
+
+def bench_clientes(db_manager, repeticiones):
+    resultados = {}
+    for clave, texto in (("cargar_clientes[todos]", ""), ("cargar_clientes[busqueda]", "mar")):
+        def consulta():
+            with db_manager.get_db_connection() as conn:
+                return buscar_clientes(conn.cursor(), texto)
+
+        resultados[clave] = medir(consulta, repeticiones)
+        resultados[clave]["filas"] = len(consulta())
+    return resultados
+
+
+def bench_guardar(db_manager, repeticiones, lineas_por_factura):
+    """Guardar una factura como `guardar_factura`: nueva (INSERT) y editando (UPDATE + líneas)."""
+    with db_manager.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, precio FROM productos ORDER BY id LIMIT ?", (lineas_por_factura,))
+        lineas = [(producto_id, 2, precio) for producto_id, precio in cursor.fetchall()]
+        cursor.execute("SELECT MIN(id) FROM facturas")
+        factura_existente = cursor.fetchone()[0]
+
+    def nueva():
+        with db_manager.get_db_connection() as conn:
+            guardar_factura_db(conn, 1, lineas, 123.45)
+            conn.commit()
+
+    def editar():
+        with db_manager.get_db_connection() as conn:
+            guardar_factura_db(conn, 1, lineas, 123.45, factura_id=factura_existente)
+            conn.commit()
+
+    return {
+        "guardar_factura[nueva]": medir(nueva, repeticiones),
+        "guardar_factura[editar]": medir(editar, repeticiones),
+    }
+
+
+def bench_pdf(db_manager, repeticiones, carpeta):
+    with db_manager.get_db_connection() as conn:
+        factura_id = conn.execute("SELECT MIN(id) FROM facturas").fetchone()[0]
+    empresa = dict(CONFIG_POR_DEFECTO)
+    directorio = os.path.join(carpeta, "facturas")
+    return {
+        "crear_pdf_factura[render]": medir(
+            lambda: generar_pdf_factura(db_manager, factura_id, empresa, directorio, forzar=True), repeticiones),
+        "crear_pdf_factura[cacheado]": medir(
+            lambda: generar_pdf_factura(db_manager, factura_id, empresa, directorio), repeticiones),
+    }
+
+
+def bench_recurrentes(db_manager, repeticiones, plantillas, semilla):
+    """Las facturas de un mes de `plantillas` suscripciones (se deshace después de cada medida)."""
+    rnd = random.Random(semilla)
+    with db_manager.get_db_connection() as conn:
+        clientes = [fila[0] for fila in conn.execute("SELECT id FROM clientes")]
+        productos = [fila[0] for fila in conn.execute("SELECT id FROM productos")]
+        for _ in range(plantillas):
+            lineas = [(rnd.choice(productos), rnd.randint(1, 3), rnd.choice([None, 29.9, 49.0]))
+                      for _ in range(rnd.randint(1, 3))]
+            crear_plantilla(conn, rnd.choice(clientes), lineas, rnd.choice(["mensual", "mensual", "trimestral"]),
+                            f"2030-01-{rnd.randint(1, 28):02d}")
+        conn.commit()
+
+    def generar():
+        with db_manager.get_db_connection() as conn:
+            ids = generar_facturas(conn, "2030-01-31")
+            conn.rollback()
+            return ids
+
+    resultado = medir(generar, repeticiones)
+    resultado["filas"] = len(generar())
+    return {"generar_recurrentes[un_mes]": resultado}
+
+
+def bench_cobros(db_manager, repeticiones):
+    """El informe de antigüedad con todas las facturas abiertas y apuntar un cobro parcial (se deshace)."""
+    # Con estadísticas, como una base de datos con su mantenimiento hecho: sin
+    # ellas SQLite no sabe que el índice parcial es mejor que el de estado.
+    db_manager.analizar()
+    with db_manager.get_db_connection() as conn:
+        abiertas, factura_id = conn.execute("SELECT COUNT(*), MAX(id) FROM facturas "
+                                            "WHERE estado IN ('Pendiente', 'Parcial')").fetchone()
+
+    def informe():
+        with db_manager.get_db_connection() as conn:
+            return antiguedad(conn, "2026-01-01")
+
+    def cobrar():
+        with db_manager.get_db_connection() as conn:
+            registrar_cobro(conn, factura_id, 0.01, "2026-01-01")
+            conn.rollback()
+
+    resultado = medir(informe, repeticiones)
+    resultado["filas"] = abiertas
+    return {"antiguedad[facturas_abiertas]": resultado, "registrar_cobro": medir(cobrar, repeticiones)}
+
+
+def bench_extracto(db_manager, repeticiones, carpeta):
+    """Los movimientos con su saldo y el PDF del extracto del cliente con más facturas."""
+    with db_manager.get_db_connection() as conn:
+        cliente_id = conn.execute("SELECT cliente_id FROM facturas GROUP BY cliente_id "
+                                  "ORDER BY COUNT(*) DESC, cliente_id LIMIT 1").fetchone()[0]
+    empresa = dict(CONFIG_POR_DEFECTO)
+    ruta = os.path.join(carpeta, "extracto.pdf")
+
+    def saldos():
+        with db_manager.get_db_connection() as conn:
+            return sum(1 for _ in movimientos(conn, cliente_id))
+
+    resultado = medir(saldos, repeticiones)
+    resultado["filas"] = saldos()
+    pdf = medir(lambda: generar_extracto(db_manager, cliente_id, empresa, ruta), max(1, repeticiones // 5))
+    pdf["filas"] = resultado["filas"]
+    return {"extracto[saldos]": resultado, "extracto[pdf]": pdf}
+
+
+def bench_pdf_grande(tamanos=(1000, 2000, 5000)):
+    """El PDF de una factura de cada tamaño, cada uno en un proceso nuevo (una sola vez: es lento)."""
+    resultados = {}
+    medidas, por_1k = medir_memoria(tamanos)
+    for medida in medidas:
+        resultados[f"crear_pdf_factura[{medida['lineas']}_lineas]"] = {
+            "repeticiones": 1, "mediana_ms": round(medida["segundos"] * 1000, 3), "filas": medida["lineas"],
+            "pico_rss_mb": medida.get("pico_mb"), "rss_mb_por_1k_lineas": por_1k}
+    return resultados
+
+
+def bench_login(repeticiones):
+    r = medir_coste(rounds_configurados(), repeticiones)
+    return {"login_bcrypt": {"repeticiones": r["repeticiones"], "rounds": r["rounds"],
+                             "mediana_ms": r["login_ms_mediana"], "min_ms": r["login_ms_min"],
+                             "hash_mediana_ms": r["hash_ms_mediana"]}}
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, anterior):
+    """Imprime la diferencia de medianas entre dos ejecuciones."""
+    print(f"\nComparando con {anterior['meta'].get('commit')} ({anterior['meta'].get('fecha')}):")
+    for clave, r in actual["resultados"].items():
+        previo = anterior["resultados"].get(clave)
+        if not previo or not previo.get("mediana_ms"):
+            continue
+        cambio = (r["mediana_ms"] - previo["mediana_ms"]) / previo["mediana_ms"] * 100
+        aviso = "  <-- más lento" if cambio > 10 else ""
+        print(f"  {clave:<45} {previo['mediana_ms']:>10.3f} -> {r['mediana_ms']:>10.3f} ms  ({cambio:+.1f}%){aviso}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de la capa de datos de FacturaX.")
+    parser.add_argument("--clientes", type=int, default=1000)
+    parser.add_argument("--productos", type=int, default=200)
+    parser.add_argument("--facturas", type=int, default=10000)
+    parser.add_argument("--lineas", type=int, default=5, help="Líneas por factura (de media).")
+    parser.add_argument("--plantillas", type=int, default=2000, help="Plantillas de facturas recurrentes.")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--solo", choices=["facturas", "clientes", "guardar", "pdf", "recurrentes", "cobros", "extracto", "pdf_grande",
+                                               "login"],
+                        nargs="+",
+                        help="Ejecuta solo estos grupos de benchmarks.")
+    parser.add_argument("--json", dest="salida_json", help="Guarda los resultados en este archivo JSON.")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior para comparar.")
+    args = parser.parse_args(argv)
+    grupos = set(args.solo or ["facturas", "clientes", "guardar", "pdf", "recurrentes", "cobros", "extracto", "pdf_grande",
+                                               "login"])
+
+    with tempfile.TemporaryDirectory(prefix="facturax-bench-") as carpeta:
+        db_manager = DatabaseManager(os.path.join(carpeta, "bench.db"))
+        inicio = time.perf_counter()
+        volumenes = generar_datos(db_manager, args.clientes, args.productos, args.facturas, args.lineas, args.semilla)
+        print(f"Datos generados en {time.perf_counter() - inicio:.1f}s: {volumenes}")
+
+        resultados = {}
+        if "facturas" in grupos:
+            resultados.update(bench_facturas(db_manager, args.repeticiones))
+        if "clientes" in grupos:
+            resultados.update(bench_clientes(db_manager, args.repeticiones))
+        if "pdf" in grupos:
+            resultados.update(bench_pdf(db_manager, args.repeticiones, carpeta))
+        if "recurrentes" in grupos:
+            resultados.update(bench_recurrentes(db_manager, args.repeticiones, args.plantillas, args.semilla))
+        if "cobros" in grupos:
+            resultados.update(bench_cobros(db_manager, args.repeticiones))
+        if "extracto" in grupos:
+            resultados.update(bench_extracto(db_manager, args.repeticiones, carpeta))
+        if "pdf_grande" in grupos:
+            resultados.update(bench_pdf_grande())
+        # Guardar va después del resto porque añade facturas a la base de datos.
+        if "guardar" in grupos:
+            resultados.update(bench_guardar(db_manager, args.repeticiones, args.lineas))
+        if "login" in grupos:
+            resultados.update(bench_login(max(3, args.repeticiones // 3)))
+
+    salida = {
+        "meta": {
+            "commit": commit_actual(),
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+            "volumenes": volumenes,
+            "repeticiones": args.repeticiones,
+        },
+        "resultados": resultados,
+    }
+
+    for clave, r in resultados.items():
+        filas = f"  ({r['filas']} filas)" if "filas" in r else ""
+        rss = f"  pico RSS {r['pico_rss_mb']} MB" if r.get("pico_rss_mb") is not None else ""
+        print(f"{clave:<45} mediana {r['mediana_ms']:>10.3f} ms{filas}{rss}")
+
+    if args.salida_json:
+        with open(args.salida_json, "w", encoding="utf-8") as f:
+            json.dump(salida, f, indent=4, ensure_ascii=False)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(salida, json.load(f))
+    return salida
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""
+Lógica de FacturaX que no depende de la interfaz gráfica.
+
+Aquí van las piezas que se pueden usar sin abrir ninguna ventana de Tkinter
+(por ejemplo desde los benchmarks o desde otros scripts).
+"""
@@ -0,0 +1,556 @@
+# API HTTP/JSON local para que otros programas (por ejemplo la tienda web)
+# creen y consulten facturas sin pasar por las ventanas.
+#
+# Es un servidor asyncio hecho solo con la biblioteca estándar (HTTP/1.1 con
+# keep-alive). El bucle de asyncio solo lee y escribe en la red; todo lo que
+# bloquea va a otro sitio:
+# - la base de datos, a un grupo de hilos con una conexión fija por hilo (un
+#   pool: no se abre una conexión por petición; con PostgreSQL salen del pool
+#   del motor, ver facturax/almacen.py),
+# - los PDFs, a un grupo de procesos (ReportLab usa mucha CPU y con hilos se
+#   pelearía por el GIL con todo lo demás).
+# Las consultas y el guardado son los mismos que usan las ventanas
+# (facturax/consultas.py, facturax/facturas.py y facturax/pdf.py).
+#
+# Rutas:
+#   GET  /salud
+#   GET  /facturas?cliente=&estado=Pagada&desde=&hasta=&importe_min=&importe_max=&producto=&orden=fecha&desc=1&pagina=0&tamano=50
+#   POST /facturas            {"cliente_id": 1, "lineas": [{"producto_id": 3, "cantidad": 2}], "fecha": "2024-05-01"}
+#   GET  /facturas/<id>
+#   GET  /facturas/<id>/pdf
+#   POST /facturas/<id>/estado {"estado": "Pagada"}    (cobra todo lo pendiente; "Pendiente" anula los cobros)
+#   GET  /facturas/<id>/cobros      POST /facturas/<id>/cobros {"importe": 50.0, "fecha": "2024-05-01", "forma": "Tarjeta"}
+#   POST /facturas/<id>/rectificar {"motivo": "Devolución", "cantidades": [1, 0]}   (sin cantidades, entera)
+#   GET  /clientes?nombre=&pagina=&tamano=      POST /clientes {"nombre": ..., "cif": ...}
+#   GET  /productos?nombre=&tipo=Servicio
+#   GET  /antiguedad?hoy=2024-05-31     (lo pendiente por cliente y tramo de días)
+#
+# Si se define FACTURAX_API_TOKEN (o --token), todas las rutas menos /salud
+# piden la cabecera "Authorization: Bearer <token>". Por defecto solo escucha
+# en 127.0.0.1.
+#
+# Para arrancarla:
+#   python -m facturax.api --puerto 8765
+import argparse
+import asyncio
+import dataclasses
+import hmac
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from facturax import cobros, rectificativas
+from facturax.configuracion import CompanyConfig
+from facturax.consultas import (TAMANO_PAGINA, FiltroFacturas, ErrorFiltro, leer_fecha,
+                                buscar_facturas, contar_facturas, buscar_clientes, contar_clientes,
+                                buscar_productos, contar_productos)
+from facturax.facturas import ConflictoEdicion, SERIE_POR_DEFECTO, guardar_factura_db
+from facturax.metricas import metricas
+from facturax.modelos import LineaFactura, Producto, columnas, fabrica, numero_factura
+from facturax.pdf import DIRECTORIO_FACTURAS, generar_pdf_factura, leer_datos_factura
+
+PUERTO_POR_DEFECTO = 8765
+TOKEN_ENTORNO = "FACTURAX_API_TOKEN"
+MAX_CUERPO = 1024 * 1024        # bytes
+MAX_TAMANO_PAGINA = 500
+ESPERA_KEEP_ALIVE = 15.0        # segundos que se deja abierta una conexión sin peticiones
+
+
+class ErrorApi(Exception):
+    """Error que se devuelve tal cual al cliente, con su código HTTP."""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+# --- Procesos de los PDFs ---
+# Cada proceso abre su propio DatabaseManager una sola vez (al arrancar).
+
+_db_proceso = None
+
+
+def _iniciar_proceso_pdf(db_path, url, esquema):
+    global _db_proceso
+    from facturax.almacen import MotorPostgres
+    from facturax.db import DatabaseManager
+    motor = MotorPostgres(url, minimo=0, maximo=2, esquema=esquema) if url else None
+    _db_proceso = DatabaseManager(db_path, motor=motor)
+
+
+def _renderizar_pdf(factura_id, empresa, directorio):
+    return generar_pdf_factura(_db_proceso, factura_id, empresa, directorio)
+
+
+def _entero(parametros, nombre, defecto=None, minimo=0, maximo=None):
+    texto = parametros.get(nombre, [""])[0].strip()
+    if not texto:
+        return defecto
+    try:
+        valor = int(texto)
+    except ValueError:
+        raise ErrorApi(HTTPStatus.BAD_REQUEST, f"'{nombre}' tiene que ser un número entero.") from None
+    if valor < minimo or (maximo is not None and valor > maximo):
+        raise ErrorApi(HTTPStatus.BAD_REQUEST, f"'{nombre}' fuera de rango.")
+    return valor
+
+
+def _texto(parametros, nombre):
+    return parametros.get(nombre, [""])[0]
+
+
+def _paginacion(parametros):
+    return (_entero(parametros, "pagina", 0),
+            _entero(parametros, "tamano", TAMANO_PAGINA, minimo=1, maximo=MAX_TAMANO_PAGINA))
+
+
+class ServidorApi:
+    """
+    Atiende las peticiones HTTP. `hilos` es cuántas operaciones de base de datos
+    puede haber a la vez (y cuántas conexiones se quedan abiertas) y `procesos`,
+    cuántos PDFs se pueden generar a la vez.
+    """
+
+    RUTAS = (
+        ("GET", r"/salud", "salud"),
+        ("GET", r"/facturas", "listar_facturas"),
+        ("POST", r"/facturas", "crear_factura"),
+        ("GET", r"/facturas/(\d+)", "ver_factura"),
+        ("GET", r"/facturas/(\d+)/pdf", "pdf_factura"),
+        ("POST", r"/facturas/(\d+)/estado", "cambiar_estado"),
+        ("POST", r"/facturas/(\d+)/rectificar", "rectificar_factura"),
+        ("GET", r"/facturas/(\d+)/cobros", "listar_cobros"),
+        ("POST", r"/facturas/(\d+)/cobros", "registrar_cobro"),
+        ("GET", r"/antiguedad", "antiguedad"),
+        ("GET", r"/clientes", "listar_clientes"),
+        ("POST", r"/clientes", "crear_cliente"),
+        ("GET", r"/productos", "listar_productos"),
+    )
+
+    def __init__(self, db_manager, empresa=None, token=None, hilos=8, procesos=2,
+                 directorio_pdf=DIRECTORIO_FACTURAS):
+        self.db_manager = db_manager
+        self.empresa = empresa or CompanyConfig()
+        self.token = token
+        self.directorio_pdf = directorio_pdf
+        self.hilos = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="api-bd")
+        motor = db_manager.motor
+        # "spawn" también en Linux: los procesos no heredan hilos ni conexiones abiertas.
+        self.procesos = ProcessPoolExecutor(
+            max_workers=procesos, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_iniciar_proceso_pdf,
+            initargs=(db_manager.db_path, getattr(motor, "url", None), getattr(motor, "esquema", None)))
+        self._local = threading.local()
+        self._conexiones = []
+        self._rutas = [(metodo, re.compile(patron + "$"), nombre) for metodo, patron, nombre in self.RUTAS]
+        self.servidor = None
+
+    async def iniciar(self, host="127.0.0.1", puerto=PUERTO_POR_DEFECTO):
+        self.servidor = await asyncio.start_server(self._atender, host, puerto)
+        return self.servidor
+
+    def cerrar(self):
+        if self.servidor is not None:
+            self.servidor.close()
+        self.procesos.shutdown(cancel_futures=True)
+        self.hilos.shutdown()
+        for conn in self._conexiones:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass    # las de SQLite solo se pueden cerrar desde su hilo; se cierran al salir
+
+    # --- Base de datos (en los hilos) ---
+
+    def _conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.db_manager.get_db_connection()
+            self._conexiones.append(conn)
+        return conn
+
+    def _en_hilo(self, nombre, funcion, *args):
+        # Cada operación es una transacción: commit si va bien y rollback si falla.
+        conn = self._conexion()
+        with metricas.medir(f"api.{nombre}"):
+            try:
+                resultado = funcion(conn, *args)
+                conn.commit()
+                return resultado
+            except BaseException:
+                conn.rollback()
+                raise
+
+    async def _bd(self, nombre, funcion, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.hilos, self._en_hilo, nombre, funcion, *args)
+
+    # --- HTTP ---
+
+    async def _atender(self, lector, escritor):
+        try:
+            while True:
+                try:
+                    linea = await asyncio.wait_for(lector.readline(), ESPERA_KEEP_ALIVE)
+                except asyncio.TimeoutError:
+                    break
+                if not linea:
+                    break
+                try:
+                    metodo, destino, version = linea.decode("latin-1").split()
+                    cabeceras = {}
+                    while True:
+                        linea = await lector.readline()
+                        if linea in (b"\r\n", b"\n", b""):
+                            break
+                        nombre, _, valor = linea.decode("latin-1").partition(":")
+                        cabeceras[nombre.strip().lower()] = valor.strip()
+                    longitud = int(cabeceras.get("content-length") or 0)
+                except ValueError:
+                    await self._enviar(escritor, HTTPStatus.BAD_REQUEST, {"error": "Petición mal formada."}, False)
+                    break
+                if longitud > MAX_CUERPO:
+                    await self._enviar(escritor, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                       {"error": "El cuerpo es demasiado grande."}, False)
+                    break
+                cuerpo = await lector.readexactly(longitud) if longitud > 0 else b""
+
+                estado, datos, extra = await self._responder(metodo, destino, cabeceras, cuerpo)
+                seguir = version == "HTTP/1.1" and cabeceras.get("connection", "").lower() != "close"
+                await self._enviar(escritor, estado, datos, seguir, extra)
+                if not seguir:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def _enviar(self, escritor, estado, datos, seguir, extra=None):
+        extra = dict(extra or {})
+        if isinstance(datos, bytes):
+            tipo = extra.pop("Content-Type", "application/octet-stream")
+        else:
+            datos = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+            tipo = "application/json; charset=utf-8"
+        cabeceras = [f"HTTP/1.1 {estado.value} {estado.phrase}", f"Content-Type: {tipo}",
+                     f"Content-Length: {len(datos)}", f"Connection: {'keep-alive' if seguir else 'close'}"]
+        cabeceras += [f"{nombre}: {valor}" for nombre, valor in extra.items()]
+        escritor.write(("\r\n".join(cabeceras) + "\r\n\r\n").encode("latin-1") + datos)
+        await escritor.drain()
+
+    async def _responder(self, metodo, destino, cabeceras, cuerpo):
+        """Devuelve (estado HTTP, datos JSON o bytes, cabeceras extra)."""
+        partes = urlsplit(destino)
+        ruta = partes.path.rstrip("/") or "/"
+        try:
+            if ruta != "/salud" and self.token and not hmac.compare_digest(
+                    cabeceras.get("authorization", ""), f"Bearer {self.token}"):
+                raise ErrorApi(HTTPStatus.UNAUTHORIZED, "Falta el token o no es válido.")
+            metodos = []
+            for metodo_ruta, patron, nombre in self._rutas:
+                encontrada = patron.match(ruta)
+                if encontrada is None:
+                    continue
+                metodos.append(metodo_ruta)
+                if metodo_ruta == metodo:
+                    parametros = parse_qs(partes.query)
+                    datos = None
+                    if metodo == "POST":
+                        try:
+                            datos = json.loads(cuerpo or b"{}")
+                        except ValueError:
+                            raise ErrorApi(HTTPStatus.BAD_REQUEST, "El cuerpo no es JSON válido.") from None
+                        if not isinstance(datos, dict):
+                            raise ErrorApi(HTTPStatus.BAD_REQUEST, "El cuerpo tiene que ser un objeto JSON.")
+                    respuesta = await getattr(self, nombre)(*encontrada.groups(), parametros=parametros, datos=datos)
+                    return respuesta if isinstance(respuesta, tuple) else (HTTPStatus.OK, respuesta, None)
+            if metodos:
+                raise ErrorApi(HTTPStatus.METHOD_NOT_ALLOWED, f"Usa {' o '.join(metodos)} en {ruta}.")
+            raise ErrorApi(HTTPStatus.NOT_FOUND, f"No existe la ruta {ruta}.")
+        except ErrorApi as e:
+            return e.estado, {"error": str(e)}, None
+        except (ErrorFiltro, ValueError) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}, None
+        except (ConflictoEdicion, sqlite3.IntegrityError) as e:
+            return HTTPStatus.CONFLICT, {"error": str(e)}, None
+        except Exception as e:
+            traceback.print_exc()
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Error interno: {e}"}, None
+
+    # --- Rutas ---
+
+    async def salud(self, parametros, datos):
+        return {"estado": "ok", "motor": self.db_manager.motor.nombre}
+
+    async def listar_facturas(self, parametros, datos):
+        filtro = FiltroFacturas.desde_texto(
+            cliente=_texto(parametros, "cliente"), estados=parametros.get("estado", []),
+            fecha_desde=_texto(parametros, "desde"), fecha_hasta=_texto(parametros, "hasta"),
+            importe_min=_texto(parametros, "importe_min"), importe_max=_texto(parametros, "importe_max"),
+            producto=_texto(parametros, "producto"))
+        filtro.cliente_id = _entero(parametros, "cliente_id")
+        orden, descendente = _texto(parametros, "orden") or "id", _texto(parametros, "desc") in ("1", "true")
+        pagina, tamano = _paginacion(parametros)
+
+        def leer(conn):
+            # Igual que cargar_facturas: si las fechas llegan a años archivados, se miran también.
+            archivos = self.db_manager.adjuntar_archivos(conn, filtro)
+            cursor = conn.cursor()
+            total = contar_facturas(cursor, filtro, archivos=archivos)
+            filas = buscar_facturas(cursor, orden, descendente, pagina, tamano, filtro=filtro, archivos=archivos)
+            return total, filas
+
+        total, filas = await self._bd("facturas", leer)
+        return {"pagina": pagina, "tamano": tamano, "total": total, "facturas": [
+            {"id": factura_id, "numero": numero_factura(factura_id, serie, numero, fecha), "cliente": cliente,
+             "total": importe, "estado": estado, "fecha": fecha}
+            for factura_id, cliente, importe, estado, fecha, serie, numero in filas]}
+
+    async def ver_factura(self, factura_id, parametros, datos):
+        def leer(conn):
+            esquema = self.db_manager.localizar_factura(conn, int(factura_id))
+            return leer_datos_factura(conn.cursor(), int(factura_id), esquema) if esquema else None
+
+        factura = await self._bd("factura", leer)
+        if factura is None:
+            raise ErrorApi(HTTPStatus.NOT_FOUND, f"No existe la factura {factura_id}.")
+        resultado = dataclasses.asdict(factura)
+        resultado["numero"] = factura.numero_completo
+        for linea, datos_linea in zip(factura.lineas, resultado["lineas"]):
+            datos_linea.update(subtotal=linea.subtotal, iva=linea.iva, irpf=linea.irpf, total=linea.total)
+        if factura.rectifica:
+            resultado["rectifica"] = dict(zip(("numero", "fecha", "motivo"), factura.rectifica))
+        resultado["rectificaciones"] = [dict(zip(("numero", "fecha", "importe", "motivo"), rectificacion))
+                                        for rectificacion in factura.rectificaciones]
+        resultado["neto"] = factura.neto
+        return resultado
+
+    async def crear_factura(self, parametros, datos):
+        cliente_id = datos.get("cliente_id")
+        lineas_pedidas = datos.get("lineas")
+        if not isinstance(cliente_id, int) or not isinstance(lineas_pedidas, list) or not lineas_pedidas:
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, "Hacen falta 'cliente_id' y una lista 'lineas' no vacía.")
+        for linea in lineas_pedidas:
+            if (not isinstance(linea, dict) or not isinstance(linea.get("producto_id"), int)
+                    or not isinstance(linea.get("cantidad"), int) or linea["cantidad"] <= 0
+                    or not isinstance(linea.get("precio_unitario", 0), (int, float))):
+                raise ErrorApi(HTTPStatus.BAD_REQUEST,
+                               "Cada línea necesita 'producto_id' y 'cantidad' (enteros, cantidad > 0).")
+        fecha = leer_fecha(datos.get("fecha")) if isinstance(datos.get("fecha"), str) else None
+        serie = datos.get("serie") or SERIE_POR_DEFECTO
+        if not isinstance(serie, str) or not re.fullmatch(r"[A-Z]{1,4}", serie):
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, "'serie' tiene que ser de 1 a 4 letras mayúsculas.")
+        if serie == rectificativas.SERIE_RECTIFICATIVA:
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, "La serie R es de las rectificativas: usa /facturas/<id>/rectificar.")
+
+        def guardar(conn):
+            if conn.execute("SELECT 1 FROM clientes WHERE id = ?", (cliente_id,)).fetchone() is None:
+                raise ErrorApi(HTTPStatus.UNPROCESSABLE_ENTITY, f"No existe el cliente {cliente_id}.")
+            ids = sorted({linea["producto_id"] for linea in lineas_pedidas})
+            cursor = conn.cursor()
+            cursor.row_factory = fabrica(Producto)
+            productos = {p.id: p for p in cursor.execute(
+                f"SELECT {columnas(Producto)} FROM productos WHERE id IN ({', '.join('?' * len(ids))})", ids)}
+            faltan = [producto_id for producto_id in ids if producto_id not in productos]
+            if faltan:
+                raise ErrorApi(HTTPStatus.UNPROCESSABLE_ENTITY, f"No existen los productos {faltan}.")
+            # Como en la ventana: las tasas y (si no se indica otro) el precio salen del producto.
+            lineas = []
+            for pedida in lineas_pedidas:
+                linea = LineaFactura.de_producto(productos[pedida["producto_id"]], pedida["cantidad"])
+                if "precio_unitario" in pedida:
+                    linea.precio_unitario = float(pedida["precio_unitario"])
+                lineas.append(linea)
+            total = round(sum(linea.total for linea in lineas), 2)
+            factura_id = guardar_factura_db(conn, cliente_id, lineas, total, fecha=fecha, serie=serie)
+            serie_guardada, numero, fecha_guardada = conn.execute(
+                "SELECT serie, numero, fecha FROM facturas WHERE id = ?", (factura_id,)).fetchone()
+            return {"id": factura_id, "numero": numero_factura(factura_id, serie_guardada, numero, fecha_guardada),
+                    "total": total, "fecha": fecha_guardada}
+
+        creada = await self._bd("crear_factura", guardar)
+        return HTTPStatus.CREATED, creada, {"Location": f"/facturas/{creada['id']}"}
+
+    async def cambiar_estado(self, factura_id, parametros, datos):
+        # El estado sale de los cobros (ver facturax/cobros.py): "Pagada" cobra todo lo
+        # pendiente y "Pendiente" anula los cobros. Para cobros parciales, /cobros.
+        estado = datos.get("estado")
+        if estado not in ("Pagada", "Pendiente"):
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, "'estado' tiene que ser 'Pagada' o 'Pendiente' "
+                                                   "(los cobros parciales van por /facturas/<id>/cobros).")
+
+        def cambiar(conn):
+            if conn.execute("SELECT 1 FROM facturas WHERE id = ?", (int(factura_id),)).fetchone() is None:
+                raise ErrorApi(HTTPStatus.NOT_FOUND, f"No existe la factura {factura_id} (o está archivada).")
+            if estado == "Pagada":
+                cobros.cobrar_pendiente(conn, int(factura_id))
+            else:
+                cobros.anular_cobros(conn, int(factura_id))
+            return conn.execute("SELECT estado FROM facturas WHERE id = ?", (int(factura_id),)).fetchone()[0]
+
+        return {"id": int(factura_id), "estado": await self._bd("estado_factura", cambiar)}
+
+    async def listar_cobros(self, factura_id, parametros, datos):
+        def leer(conn):
+            fila = conn.execute("SELECT total, cobrado, pendiente, estado FROM facturas WHERE id = ?",
+                                (int(factura_id),)).fetchone()
+            return fila, cobros.cobros_de(conn, int(factura_id))
+
+        factura, filas = await self._bd("cobros", leer)
+        if factura is None:
+            raise ErrorApi(HTTPStatus.NOT_FOUND, f"No existe la factura {factura_id} (o está archivada).")
+        total, cobrado, pendiente, estado = factura
+        return {"id": int(factura_id), "total": total, "cobrado": round(cobrado, 2), "pendiente": round(pendiente, 2),
+                "estado": estado, "cobros": [dict(zip(("id", "fecha", "importe", "forma", "nota"), fila))
+                                             for fila in filas]}
+
+    async def registrar_cobro(self, factura_id, parametros, datos):
+        importe = datos.get("importe")
+        if not isinstance(importe, (int, float)) or isinstance(importe, bool):
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, "Hace falta 'importe' (un número).")
+        forma = datos.get("forma")
+        if forma is not None and forma not in cobros.FORMAS_PAGO:
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, f"'forma' tiene que ser una de {list(cobros.FORMAS_PAGO)}.")
+        fecha = leer_fecha(datos.get("fecha")) if isinstance(datos.get("fecha"), str) else None
+        nota = datos.get("nota") if isinstance(datos.get("nota"), str) else ""
+
+        def registrar(conn):
+            # Los ValueError (no existe, importe de más...) salen como 400.
+            cobro_id = cobros.registrar_cobro(conn, int(factura_id), importe, fecha, forma, nota)
+            pendiente, estado = conn.execute("SELECT pendiente, estado FROM facturas WHERE id = ?",
+                                             (int(factura_id),)).fetchone()
+            return {"id": cobro_id, "factura": int(factura_id), "pendiente": round(pendiente, 2), "estado": estado}
+
+        creado = await self._bd("registrar_cobro", registrar)
+        return HTTPStatus.CREATED, creado, None
+
+    async def antiguedad(self, parametros, datos):
+        hoy = leer_fecha(_texto(parametros, "hoy")) if _texto(parametros, "hoy") else None
+        filas = await self._bd("antiguedad", cobros.antiguedad, hoy)
+        tramos = cobros.nombres_tramos()
+        return {"tramos": tramos, "clientes": [
+            {"cliente_id": cliente_id, "cliente": nombre, "tramos": dict(zip(tramos, importes)), "total": total,
+             "facturas": facturas, "mas_antigua": mas_antigua}
+            for cliente_id, nombre, importes, total, facturas, mas_antigua in filas]}
+
+    async def rectificar_factura(self, factura_id, parametros, datos):
+        cantidades = datos.get("cantidades")
+        if cantidades is not None and (not isinstance(cantidades, list)
+                                       or not all(isinstance(cantidad, int) for cantidad in cantidades)):
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, "'cantidades' tiene que ser una lista de enteros (una por línea).")
+        motivo = datos.get("motivo") or ""
+        if not isinstance(motivo, str):
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, "'motivo' tiene que ser un texto.")
+        fecha = leer_fecha(datos.get("fecha")) if isinstance(datos.get("fecha"), str) else None
+
+        def rectificar(conn):
+            # Los ValueError (no existe, ya es rectificativa, se abona de más...) salen como 400.
+            rectificativa_id = rectificativas.rectificar_factura(conn, int(factura_id), cantidades, motivo, fecha)
+            numero, fecha_guardada, importe = conn.execute(
+                "SELECT numero, fecha, importe FROM rectificaciones WHERE rectificativa_id = ?",
+                (rectificativa_id,)).fetchone()
+            return {"id": rectificativa_id, "numero": numero, "fecha": fecha_guardada, "total": importe,
+                    "original": int(factura_id), "neto": rectificativas.saldo_factura(conn, int(factura_id))[2]}
+
+        creada = await self._bd("rectificar_factura", rectificar)
+        return HTTPStatus.CREATED, creada, {"Location": f"/facturas/{creada['id']}"}
+
+    async def pdf_factura(self, factura_id, parametros, datos):
+        loop = asyncio.get_running_loop()
+        ruta = await loop.run_in_executor(self.procesos, _renderizar_pdf, int(factura_id),
+                                          self.empresa.cargar_configuracion(), self.directorio_pdf)
+        if ruta is None:
+            raise ErrorApi(HTTPStatus.NOT_FOUND, f"No existe la factura {factura_id} (o no tiene líneas).")
+        contenido = await loop.run_in_executor(self.hilos, _leer_archivo, ruta)
+        return HTTPStatus.OK, contenido, {"Content-Type": "application/pdf",
+                                          "Content-Disposition": f'inline; filename="{os.path.basename(ruta)}"'}
+
+    async def listar_clientes(self, parametros, datos):
+        nombre = _texto(parametros, "nombre")
+        pagina, tamano = _paginacion(parametros)
+
+        def leer(conn):
+            cursor = conn.cursor()
+            return contar_clientes(cursor, nombre), buscar_clientes(cursor, nombre, pagina=pagina,
+                                                                    tamano_pagina=tamano)
+
+        total, filas = await self._bd("clientes", leer)
+        campos = ("id", "nombre", "apellido", "email", "telefono", "direccion", "ciudad", "cp", "cif")
+        return {"pagina": pagina, "tamano": tamano, "total": total,
+                "clientes": [dict(zip(campos, fila)) for fila in filas]}
+
+    async def crear_cliente(self, parametros, datos):
+        campos = ("nombre", "apellido", "cif", "direccion", "ciudad", "cp", "email", "telefono")
+        if not isinstance(datos.get("nombre"), str) or not datos["nombre"].strip():
+            raise ErrorApi(HTTPStatus.BAD_REQUEST, "Hace falta 'nombre'.")
+        valores = [datos.get(campo) or None for campo in campos]
+
+        def guardar(conn):
+            cursor = conn.cursor()
+            cursor.execute(f"INSERT INTO clientes ({', '.join(campos)}) VALUES ({', '.join('?' * len(campos))})",
+                           valores)
+            return cursor.lastrowid
+
+        cliente_id = await self._bd("crear_cliente", guardar)
+        return HTTPStatus.CREATED, {"id": cliente_id}, None
+
+    async def listar_productos(self, parametros, datos):
+        nombre, tipo = _texto(parametros, "nombre"), _texto(parametros, "tipo") or "Todos"
+        pagina, tamano = _paginacion(parametros)
+
+        def leer(conn):
+            cursor = conn.cursor()
+            return (contar_productos(cursor, nombre, tipo),
+                    buscar_productos(cursor, nombre, tipo, pagina=pagina, tamano_pagina=tamano))
+
+        total, filas = await self._bd("productos", leer)
+        return {"pagina": pagina, "tamano": tamano, "total": total,
+                "productos": [dataclasses.asdict(Producto(*fila)) for fila in filas]}
+
+
+def _leer_archivo(ruta):
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
+async def servir(db_manager, host="127.0.0.1", puerto=PUERTO_POR_DEFECTO, token=None, hilos=8, procesos=2):
+    """Arranca la API y atiende peticiones hasta que se cancele."""
+    api = ServidorApi(db_manager, token=token, hilos=hilos, procesos=procesos)
+    servidor = await api.iniciar(host, puerto)
+    direcciones = ", ".join(f"{s.getsockname()[0]}:{s.getsockname()[1]}" for s in servidor.sockets)
+    print(f"[API] Escuchando en {direcciones} ({'con' if token else 'sin'} token)")
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        api.cerrar()
+
+
+def main(argv=None):
+    from facturax.db import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="API HTTP/JSON local de FacturaX.")
+    parser.add_argument("--db", help="Base de datos (por defecto database/facturacion.db o FACTURAX_DB_URL).")
+    parser.add_argument("--host", default="127.0.0.1", help="Dirección en la que escuchar (por defecto solo local).")
+    parser.add_argument("--puerto", type=int, default=PUERTO_POR_DEFECTO)
+    parser.add_argument("--token", default=os.environ.get(TOKEN_ENTORNO), help="Token que tienen que mandar los clientes.")
+    parser.add_argument("--hilos", type=int, default=8, help="Operaciones de base de datos a la vez.")
+    parser.add_argument("--procesos", type=int, default=2, help="PDFs que se generan a la vez.")
+    args = parser.parse_args(argv)
+
+    db_manager = DatabaseManager(args.db)
+    db_manager.crear_tablas()
+    try:
+        asyncio.run(servir(db_manager, args.host, args.puerto, args.token, args.hilos, args.procesos))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# Archivo de ejercicios cerrados.
+#
+# Las facturas pagadas de los años ya cerrados se pasan a una base de datos por
+# año (database/archivo/facturacion_2021.db...), con sus líneas, sus cobros y la
+# huella de su PDF. Así la base de datos del día a día (y sus índices) no crece
+# sin fin.
+#
+# Las facturas archivadas se siguen pudiendo buscar y sacar en PDF: cuando un
+# filtro llega a un año archivado (por fechas), su archivo se adjunta a la
+# conexión con ATTACH DATABASE y la consulta lee de las dos bases de datos.
+# Los ids de factura no se repiten (AUTOINCREMENT), así que el id sigue
+# identificando la factura esté donde esté.
+#
+# Clientes y productos se quedan en la base de datos principal.
+#
+# Desde la línea de comandos:
+#   python -m facturax.archivo --listar
+#   python -m facturax.archivo --anio 2021
+import argparse
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+# Tablas que se archivan, con la condición que las une a las facturas archivadas.
+TABLAS_ARCHIVO = (
+    ("facturas", "id"),
+    ("detalles_factura", "factura_id"),
+    ("pdf_generados", "factura_id"),
+    ("cobros", "factura_id"),
+)
+INDICES_ARCHIVO = (
+    "CREATE INDEX IF NOT EXISTS {esquema}.idx_facturas_fecha ON facturas(fecha)",
+    "CREATE INDEX IF NOT EXISTS {esquema}.idx_facturas_cliente ON facturas(cliente_id)",
+    "CREATE INDEX IF NOT EXISTS {esquema}.idx_detalles_factura ON detalles_factura(factura_id)",
+    "CREATE INDEX IF NOT EXISTS {esquema}.idx_detalles_producto ON detalles_factura(producto_id, factura_id)",
+    "CREATE INDEX IF NOT EXISTS {esquema}.idx_cobros_factura ON cobros(factura_id)",
+)
+# Solo se archivan las facturas ya cobradas.
+ESTADO_ARCHIVABLE = "Pagada"
+
+
+class ErrorArchivo(ValueError):
+    """No se puede archivar ese año, o hay demasiados años para adjuntar a la vez."""
+
+
+def nombre_esquema(anio):
+    """Nombre con el que se adjunta el archivo de un año (archivo_2021)."""
+    return f"archivo_{int(anio)}"
+
+
+def ruta_archivo(directorio, prefijo, anio):
+    return os.path.join(directorio, f"{prefijo}_{int(anio)}.db")
+
+
+def anios_archivados(directorio, prefijo):
+    """Años que tienen archivo, de menor a mayor."""
+    if not os.path.isdir(directorio):
+        return []
+    anios = []
+    for nombre in os.listdir(directorio):
+        base, extension = os.path.splitext(nombre)
+        if extension == ".db" and base.startswith(prefijo + "_") and base[len(prefijo) + 1:].isdigit():
+            anios.append(int(base[len(prefijo) + 1:]))
+    return sorted(anios)
+
+
+def anios_del_filtro(filtro, anios):
+    """
+    Años archivados a los que llega un FiltroFacturas. Sin fechas no se mira el
+    archivo (la tabla normal solo enseña lo del día a día), y si el filtro no
+    incluye facturas pagadas tampoco, porque en el archivo solo hay pagadas.
+    """
+    if filtro is None or (filtro.fecha_desde is None and filtro.fecha_hasta is None):
+        return []
+    if filtro.estados and ESTADO_ARCHIVABLE not in filtro.estados:
+        return []
+    desde = int(filtro.fecha_desde[:4]) if filtro.fecha_desde else min(anios, default=0)
+    hasta = int(filtro.fecha_hasta[:4]) if filtro.fecha_hasta else max(anios, default=0)
+    return [anio for anio in anios if desde <= anio <= hasta]
+
+
+def adjuntar(conn, directorio, prefijo, anios):
+    """
+    Adjunta a `conn` los archivos de esos años (los que no estén ya) y devuelve
+    los nombres de sus esquemas. Los años sin archivo se ignoran.
+    """
+    adjuntos = {fila[1] for fila in conn.execute("PRAGMA database_list")}
+    esquemas = []
+    for anio in anios:
+        esquema = nombre_esquema(anio)
+        ruta = ruta_archivo(directorio, prefijo, anio)
+        if esquema not in adjuntos:
+            if not os.path.exists(ruta):
+                continue
+            # SQLite tiene un máximo de bases de datos adjuntas por conexión (10 normalmente).
+            if len(adjuntos - {"main", "temp"}) >= conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+                raise ErrorArchivo("El filtro abarca demasiados años archivados a la vez. Acota las fechas.")
+            conn.execute("ATTACH DATABASE ? AS " + esquema, (ruta,))
+            # Los archivos hechos antes de añadir una columna a las facturas se ponen al día.
+            _crear_tablas(conn, esquema)
+            adjuntos.add(esquema)
+        esquemas.append(esquema)
+    return esquemas
+
+
+def localizar_factura(conn, directorio, prefijo, factura_id):
+    """
+    Devuelve el esquema donde está la factura ("main" o el de su archivo, que
+    queda adjuntado a `conn`), o None si no existe en ningún sitio.
+    """
+    if conn.execute("SELECT 1 FROM main.facturas WHERE id = ?", (factura_id,)).fetchone():
+        return "main"
+    # Primero los archivos que ya están adjuntos (al exportar muchas facturas
+    # seguidas suelen ser del mismo año) y luego los demás, los más recientes antes.
+    adjuntos = [fila[1] for fila in conn.execute("PRAGMA database_list") if fila[1].startswith("archivo_")]
+    for esquema in adjuntos:
+        if conn.execute(f"SELECT 1 FROM {esquema}.facturas WHERE id = ?", (factura_id,)).fetchone():
+            return esquema
+    for anio in reversed(anios_archivados(directorio, prefijo)):
+        esquema = nombre_esquema(anio)
+        if esquema in adjuntos:
+            continue
+        if len(adjuntos) >= conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - 1:
+            conn.execute("DETACH DATABASE " + adjuntos.pop(0))
+        adjuntar(conn, directorio, prefijo, [anio])
+        if conn.execute(f"SELECT 1 FROM {esquema}.facturas WHERE id = ?", (factura_id,)).fetchone():
+            return esquema
+        conn.execute("DETACH DATABASE " + esquema)
+    return None
+
+
+def _crear_tablas(conn, esquema):
+    # Las tablas del archivo tienen las mismas columnas que las de la base de datos
+    # principal (se leen de ella, así si se añade una columna también se archiva).
+    for tabla, _columna in TABLAS_ARCHIVO:
+        columnas_main = conn.execute(f"PRAGMA main.table_info({tabla})").fetchall()
+        existentes = {fila[1] for fila in conn.execute(f"PRAGMA {esquema}.table_info({tabla})")}
+        if not existentes:
+            definicion = ", ".join(f'"{nombre}" {tipo}' + (" PRIMARY KEY" if pk else "")
+                                   for _cid, nombre, tipo, _notnull, _defecto, pk in columnas_main)
+            conn.execute(f"CREATE TABLE {esquema}.{tabla} ({definicion})")
+        else:
+            for _cid, nombre, tipo, _notnull, _defecto, _pk in columnas_main:
+                if nombre not in existentes:
+                    conn.execute(f'ALTER TABLE {esquema}.{tabla} ADD COLUMN "{nombre}" {tipo}')
+    for indice in INDICES_ARCHIVO:
+        conn.execute(indice.format(esquema=esquema))
+
+
+def anios_archivables(conn, hasta_anio=None):
+    """(año, nº de facturas pagadas) de los años cerrados que aún tienen facturas pagadas sin archivar."""
+    hasta_anio = hasta_anio if hasta_anio is not None else datetime.now().year - 1
+    return conn.execute("""
+        SELECT CAST(substr(fecha, 1, 4) AS INTEGER) AS anio, COUNT(*)
+        FROM facturas
+        WHERE estado = ? AND fecha < ?
+        GROUP BY anio ORDER BY anio
+    """, (ESTADO_ARCHIVABLE, f"{int(hasta_anio) + 1:04d}-01-01")).fetchall()
+
+
+def archivar_anio(ruta_db, directorio, anio):
+    """
+    Pasa las facturas pagadas de `anio` (con sus líneas, cobros y huellas de PDF) a su
+    archivo y las borra de la base de datos principal. Devuelve cuántas facturas
+    se han archivado. Se puede repetir sin problema: si se cortó a medias, termina.
+    """
+    anio = int(anio)
+    if anio >= datetime.now().year:
+        raise ErrorArchivo(f"El ejercicio {anio} no está cerrado todavía.")
+    prefijo = Path(ruta_db).stem
+    os.makedirs(directorio, exist_ok=True)
+    esquema = nombre_esquema(anio)
+    condicion = "estado = ? AND fecha BETWEEN ? AND ?"
+    params = (ESTADO_ARCHIVABLE, f"{anio:04d}-01-01", f"{anio:04d}-12-31")
+
+    # Dos conexiones: `principal` bloquea las escrituras en la base de datos hasta
+    # el final (se puede seguir leyendo) y `copiador` escribe en el archivo.
+    with closing(sqlite3.connect(ruta_db, isolation_level=None)) as principal, \
+            closing(sqlite3.connect(ruta_db)) as copiador:
+        copiador.execute("ATTACH DATABASE ? AS " + esquema, (ruta_archivo(directorio, prefijo, anio),))
+        _crear_tablas(copiador, esquema)
+        copiador.commit()
+
+        principal.execute("BEGIN IMMEDIATE")
+        try:
+            # 1) Copiar al archivo y guardarlo. Una transacción con varias bases de datos
+            # en modo WAL no es atómica entre ellas, por eso va primero el archivo: si
+            # algo se corta después, las facturas quedan repetidas, nunca perdidas
+            # (y la siguiente vez que se archive ese año se termina de borrarlas).
+            ids = f"SELECT id FROM main.facturas WHERE {condicion}"
+            for tabla, columna in TABLAS_ARCHIVO:
+                nombres = ", ".join(f'"{fila[1]}"' for fila in copiador.execute(f"PRAGMA main.table_info({tabla})"))
+                copiador.execute(f"INSERT OR REPLACE INTO {esquema}.{tabla} ({nombres}) "
+                                 f"SELECT {nombres} FROM main.{tabla} WHERE {columna} IN ({ids})", params)
+            copiador.commit()
+
+            # 2) Borrar de la principal lo mismo (nadie ha podido cambiarlo mientras tanto).
+            # Las facturas van las últimas porque las demás tablas se borran a través de ellas.
+            for tabla, columna in reversed(TABLAS_ARCHIVO):
+                archivadas = principal.execute(f"DELETE FROM main.{tabla} WHERE {columna} IN ({ids})",
+                                               params).rowcount
+            principal.execute("COMMIT")
+        except BaseException:
+            principal.execute("ROLLBACK")
+            raise
+    return archivadas
+
+
+def main(argv=None):
+    from facturax.db import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Archivo de ejercicios cerrados de FacturaX.")
+    parser.add_argument("--db", help="Base de datos (por defecto database/facturacion.db).")
+    parser.add_argument("--listar", action="store_true", help="Años archivados y años que se pueden archivar.")
+    parser.add_argument("--anio", type=int, action="append", default=[], help="Año a archivar (se puede repetir).")
+    args = parser.parse_args(argv)
+    if not args.listar and not args.anio:
+        parser.error("Indica --listar o --anio AÑO.")
+
+    db_manager = DatabaseManager(args.db)
+    if not os.path.exists(db_manager.db_path):
+        parser.error(f"No existe la base de datos {db_manager.db_path}")
+
+    for anio in args.anio:
+        print(f"[Archivo] {anio}: {db_manager.archivar_anio(anio)} facturas archivadas")
+    if args.listar:
+        print(f"[Archivo] Archivados: {', '.join(map(str, db_manager.anios_archivados())) or 'ninguno'}")
+        for anio, cuantas in db_manager.anios_archivables():
+            print(f"[Archivo] Se puede archivar {anio}: {cuantas} facturas pagadas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# Servicio de autenticación: comprueba usuario/contraseña, guarda una sesión
+# corta en memoria y frena los intentos fallidos repetidos.
+#
+# La idea es gastar el tiempo de bcrypt solo cuando hace falta:
+# - Si un usuario falla muchas veces seguidas, se le hace esperar cada vez más
+#   (1s, 2s, 4s, ...) y durante la espera ni siquiera se calcula bcrypt.
+# - Tras un login correcto se crea un token de sesión que dura unos minutos, así
+#   las acciones delicadas pueden pedir la contraseña otra vez solo si ha caducado.
+import secrets
+import threading
+import time
+
+
+class ErrorAutenticacion(Exception):
+    """Error base de login."""
+
+
+class UsuarioNoExiste(ErrorAutenticacion):
+    pass
+
+
+class ContrasenaIncorrecta(ErrorAutenticacion):
+    pass
+
+
+class LoginBloqueado(ErrorAutenticacion):
+    """Demasiados intentos fallidos: hay que esperar `segundos` antes de volver a probar."""
+
+    def __init__(self, segundos):
+        super().__init__(f"Demasiados intentos fallidos. Espera {segundos:.0f} segundos.")
+        self.segundos = segundos
+
+
+class Sesion:
+    """Sesión de un usuario que ha hecho login correctamente."""
+
+    __slots__ = ("token", "usuario", "rol", "creada", "expira")
+
+    def __init__(self, token, usuario, rol, creada, expira):
+        self.token = token
+        self.usuario = usuario
+        self.rol = rol
+        self.creada = creada
+        self.expira = expira
+
+
+class ServicioAutenticacion:
+    """Login con sesiones en memoria y espera exponencial tras fallos repetidos."""
+
+    def __init__(self, db_manager, gestor_contrasenas, duracion_sesion=15 * 60,
+                 intentos_libres=3, espera_base=1.0, espera_max=300.0, reloj=time.monotonic):
+        self.db_manager = db_manager
+        self.gestor_contrasenas = gestor_contrasenas
+        self.duracion_sesion = duracion_sesion
+        self.intentos_libres = intentos_libres
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.reloj = reloj
+        # El login se ejecuta en los hilos de bcrypt, así que todo lo compartido va con candado.
+        self._lock = threading.Lock()
+        self._sesiones = {}   # token -> Sesion
+        self._fallos = {}     # usuario -> [nº de fallos seguidos, bloqueado hasta]
+
+    # ---------------- LOGIN ----------------
+
+    def autenticar(self, usuario, contrasena):
+        """
+        Comprueba las credenciales y devuelve una `Sesion` nueva.
+        Lanza LoginBloqueado, UsuarioNoExiste o ContrasenaIncorrecta si algo va mal.
+        """
+        espera = self.segundos_bloqueo(usuario)
+        if espera > 0:
+            raise LoginBloqueado(espera)
+
+        with self.db_manager.conexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT contraseña, rol FROM usuarios WHERE usuario = ?", (usuario,))
+            resultado = cursor.fetchone()
+
+        if not resultado:
+            self._registrar_fallo(usuario)
+            raise UsuarioNoExiste(usuario)
+
+        hash_guardado, rol = resultado
+        if not self.gestor_contrasenas.verificar(contrasena, hash_guardado):
+            self._registrar_fallo(usuario)
+            raise ContrasenaIncorrecta(usuario)
+
+        with self._lock:
+            self._fallos.pop(usuario, None)
+
+        # Si el hash se hizo con otro coste de bcrypt, se rehace ahora que tenemos
+        # la contraseña en claro. Es lo último que se hace y el usuario no lo nota.
+        if self.gestor_contrasenas.necesita_rehash(hash_guardado):
+            self.gestor_contrasenas.enviar(lambda: self.db_manager.actualizar_hash_contrasena(
+                usuario, hash_guardado, self.gestor_contrasenas.hash(contrasena)))
+
+        return self._abrir_sesion(usuario, rol)
+
+    def autenticar_async(self, usuario, contrasena):
+        """Igual que `autenticar` pero en segundo plano (devuelve un Future)."""
+        return self.gestor_contrasenas.enviar(self.autenticar, usuario, contrasena)
+
+    def reautenticar_async(self, sesion, contrasena):
+        """Vuelve a pedir la contraseña del usuario de una sesión (por ejemplo, si ha caducado)."""
+        return self.autenticar_async(sesion.usuario, contrasena)
+
+    # ---------------- SESIONES ----------------
+
+    def _abrir_sesion(self, usuario, rol):
+        ahora = self.reloj()
+        sesion = Sesion(secrets.token_urlsafe(32), usuario, rol, ahora, ahora + self.duracion_sesion)
+        with self._lock:
+            self._limpiar_sesiones_caducadas(ahora)
+            self._sesiones[sesion.token] = sesion
+        return sesion
+
+    def sesion_valida(self, token):
+        """Devuelve la sesión si el token existe y no ha caducado, o None."""
+        if token is None:
+            return None
+        ahora = self.reloj()
+        with self._lock:
+            sesion = self._sesiones.get(token)
+            if sesion is None:
+                return None
+            if sesion.expira <= ahora:
+                del self._sesiones[token]
+                return None
+            return sesion
+
+    def cerrar_sesion(self, token):
+        with self._lock:
+            self._sesiones.pop(token, None)
+
+    def _limpiar_sesiones_caducadas(self, ahora):
+        caducadas = [token for token, sesion in self._sesiones.items() if sesion.expira <= ahora]
+        for token in caducadas:
+            del self._sesiones[token]
+
+    # ---------------- INTENTOS FALLIDOS ----------------
+
+    def segundos_bloqueo(self, usuario):
+        """Segundos que le quedan a un usuario antes de poder intentar otra vez (0 si ninguno)."""
+        with self._lock:
+            estado = self._fallos.get(usuario)
+            if estado is None:
+                return 0.0
+            return max(0.0, estado[1] - self.reloj())
+
+    def _registrar_fallo(self, usuario):
+        ahora = self.reloj()
+        with self._lock:
+            if len(self._fallos) > 1000:
+                # No dejamos que el diccionario crezca sin límite con usuarios inventados.
+                self._fallos = {u: e for u, e in self._fallos.items() if e[1] > ahora - self.espera_max}
+            estado = self._fallos.setdefault(usuario, [0, 0.0])
+            estado[0] += 1
+            exceso = estado[0] - self.intentos_libres
+            if exceso >= 0:
+                estado[1] = ahora + min(self.espera_base * (2 ** min(exceso, 30)), self.espera_max)
@@ -0,0 +1,138 @@
+# Caché de resultados para las consultas de solo lectura que se repiten mucho
+# (clientes del combobox, productos de cada tipo, tasas de un producto...).
+#
+# Cada entrada guarda de qué tablas sale. Cuando alguien escribe en una tabla a
+# través del mismo DatabaseManager, se borran todas las entradas que dependen de
+# ella, así que después de editar algo en una ventana nunca se ven datos viejos.
+# El TTL es solo una red de seguridad para cambios hechos desde fuera (otro
+# programa abriendo la misma base de datos).
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Acciones del autorizador de SQLite que modifican una tabla (el argumento 1 es la tabla).
+_ESCRITURAS = {sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE,
+               sqlite3.SQLITE_DROP_TABLE, sqlite3.SQLITE_ALTER_TABLE}
+
+
+class CacheConsultas:
+    """Caché LRU con caducidad (TTL) e invalidación por tabla. Se puede usar desde varios hilos."""
+
+    def __init__(self, max_entradas=256, ttl=30.0, reloj=time.monotonic):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.reloj = reloj
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()    # clave -> (caduca, tablas, filas)
+        self._por_tabla = {}              # tabla -> claves que dependen de ella
+        self._version = {}                # tabla -> nº de escrituras (para no guardar lecturas viejas)
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    def obtener(self, clave, tablas, leer):
+        """
+        Devuelve las filas guardadas para `clave` o llama a `leer()` y las guarda.
+        `tablas` son las tablas de las que sale el resultado.
+        """
+        tablas = frozenset(t.lower() for t in tablas)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] > self.reloj():
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[2]
+            self.fallos += 1
+            versiones = [self._version.get(t, 0) for t in tablas]
+
+        filas = leer()
+
+        with self._lock:
+            # Si mientras se leía alguien ha escrito en esas tablas, no se guarda.
+            if versiones == [self._version.get(t, 0) for t in tablas]:
+                self._quitar(clave)
+                self._entradas[clave] = (self.reloj() + self.ttl, tablas, filas)
+                for tabla in tablas:
+                    self._por_tabla.setdefault(tabla, set()).add(clave)
+                while len(self._entradas) > self.max_entradas:
+                    self._quitar(next(iter(self._entradas)))
+        return filas
+
+    def invalidar(self, tablas):
+        """Borra todo lo que dependa de estas tablas."""
+        with self._lock:
+            for tabla in tablas:
+                tabla = tabla.lower()
+                self._version[tabla] = self._version.get(tabla, 0) + 1
+                for clave in list(self._por_tabla.pop(tabla, ())):
+                    self._quitar(clave)
+                    self.invalidaciones += 1
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._por_tabla.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {"entradas": len(self._entradas), "aciertos": self.aciertos, "fallos": self.fallos,
+                    "invalidaciones": self.invalidaciones,
+                    "porcentaje_aciertos": round(100 * self.aciertos / total, 1) if total else 0.0}
+
+    def _quitar(self, clave):
+        entrada = self._entradas.pop(clave, None)
+        if entrada is None:
+            return
+        for tabla in entrada[1]:
+            claves = self._por_tabla.get(tabla)
+            if claves is not None:
+                claves.discard(clave)
+
+
+class ConexionVigilada(sqlite3.Connection):
+    """
+    Conexión que apunta en qué tablas se escribe (con el autorizador de SQLite)
+    y avisa a la caché. Se invalida al escribir y otra vez al hacer commit, para
+    que nadie guarde en la caché lo que había antes del commit.
+    """
+
+    cache = None
+
+    def vigilar(self, cache):
+        self.cache = cache
+        self._escritas = set()
+        self.set_authorizer(self._autorizar)
+
+    def _autorizar(self, accion, arg1, arg2, base, origen):
+        if accion in _ESCRITURAS and arg1 and base != "temp":
+            tabla = arg1.lower()
+            if tabla not in self._escritas:
+                self._escritas.add(tabla)
+                self.cache.invalidar([tabla])
+        return sqlite3.SQLITE_OK
+
+    def _avisar(self):
+        # No se vacía `_escritas`: SQLite solo llama al autorizador al preparar una
+        # sentencia, y si se repite la misma en esta conexión no volvería a avisar.
+        if self.cache is not None and self._escritas:
+            self.cache.invalidar(self._escritas)
+
+    def commit(self):
+        super().commit()
+        self._avisar()
+
+    def rollback(self):
+        super().rollback()
+        self._avisar()
+
+    def close(self):
+        super().close()
+        self._avisar()
+
+    def __exit__(self, tipo, valor, traza):
+        # `with conn:` hace commit (o rollback) sin pasar por los métodos de arriba.
+        resultado = super().__exit__(tipo, valor, traza)
+        self._avisar()
+        return resultado
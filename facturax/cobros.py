@@ -0,0 +1,190 @@
+# Cobros de las facturas e informe de antigüedad de la deuda.
+#
+# Antes una factura estaba "Pagada" o "Pendiente" y se cambiaba a mano. Ahora
+# cada cobro (también los parciales) es una fila de `cobros`, y la factura lleva
+# dos columnas que se actualizan en la misma transacción que el cobro:
+# - `cobrado`: la suma de sus cobros,
+# - `pendiente`: lo que queda por cobrar (total - cobrado - lo abonado con
+#   rectificativas, ver facturax/rectificativas.py).
+# El estado sale de ahí: Pagada (no queda nada), Parcial (se ha cobrado algo) o
+# Pendiente. Así, saber lo que se debe no obliga a sumar los cobros de cada
+# factura: basta con leer `pendiente`.
+#
+# El informe de antigüedad (0-30, 31-60, 61-90 y más de 90 días desde la fecha
+# de la factura) es una sola consulta agregada sobre las facturas abiertas. El
+# índice parcial idx_facturas_abiertas solo tiene esas facturas, ordenadas por
+# cliente y con fecha y pendiente dentro: la consulta se resuelve entera con él,
+# sin leer la tabla ni ordenar para el GROUP BY.
+from datetime import date, datetime, timedelta
+
+from facturax.facturas import ESTADO_SEGUN_SALDO, empezar_escritura
+
+FORMAS_PAGO = ("Transferencia", "Domiciliación", "Tarjeta", "Efectivo")
+# Estados de las facturas que todavía deben algo.
+ESTADOS_ABIERTOS = ("Pendiente", "Parcial")
+# (desde, hasta) días de cada columna del informe de antigüedad; None = sin límite.
+TRAMOS = ((0, 30), (31, 60), (61, 90), (91, None))
+# Escrito tal cual (sin parámetros) porque es la condición del índice parcial.
+_FILTRO_ABIERTAS = "estado IN (" + ", ".join(f"'{estado}'" for estado in ESTADOS_ABIERTOS) + ")"
+# Por debajo de medio céntimo, el importe se da por saldado.
+MARGEN = 0.005
+
+
+def crear_tablas(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cobros (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            factura_id INTEGER NOT NULL,
+            fecha TEXT NOT NULL,
+            importe REAL NOT NULL,
+            forma TEXT,
+            nota TEXT,
+            FOREIGN KEY (factura_id) REFERENCES facturas(id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cobros_factura ON cobros(factura_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cobros_fecha ON cobros(fecha)")
+
+    # Bases de datos de antes de los cobros: a las facturas pagadas se les pone
+    # un cobro por lo que quedó después de las rectificativas (con la fecha de la
+    # factura) y a las demás, eso mismo pendiente. Las rectificativas, saldadas.
+    existentes = {descripcion[0].lower() for descripcion in conn.execute("SELECT * FROM facturas LIMIT 0").description}
+    if "pendiente" not in existentes:
+        conn.execute("ALTER TABLE facturas ADD COLUMN cobrado REAL NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE facturas ADD COLUMN pendiente REAL")
+        neto = "total + COALESCE((SELECT SUM(r.importe) FROM rectificaciones r WHERE r.original_id = facturas.id), 0)"
+        conn.execute(f"UPDATE facturas SET pendiente = CASE WHEN id IN (SELECT rectificativa_id FROM rectificaciones) "
+                     f"THEN 0 ELSE {neto} END")
+        conn.execute("INSERT INTO cobros (factura_id, fecha, importe, forma, nota) "
+                     "SELECT id, fecha, pendiente, NULL, 'Pagada antes de registrar cobros' FROM facturas "
+                     "WHERE estado = 'Pagada' AND pendiente > 0.005")
+        conn.execute("UPDATE facturas SET cobrado = CASE WHEN estado = 'Pagada' THEN pendiente ELSE 0 END, "
+                     "pendiente = CASE WHEN estado = 'Pagada' THEN 0 ELSE pendiente END")
+        conn.execute(f"UPDATE facturas SET estado = {ESTADO_SEGUN_SALDO.format(pendiente='pendiente', cobrado='cobrado')}")
+    # Para que se use el índice, la consulta tiene que llevar el mismo WHERE (ver antiguedad()).
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_facturas_abiertas ON facturas(cliente_id, fecha, pendiente, estado) "
+                 f"WHERE {_FILTRO_ABIERTAS}")
+
+
+def registrar_cobro(conn, factura_id, importe, fecha=None, forma=None, nota=""):
+    """
+    Apunta un cobro de `importe` a la factura, actualiza lo que le queda y su estado,
+    y devuelve el id del cobro. No hace commit. ValueError si el importe no es
+    positivo, si supera lo pendiente o si la factura no existe (o está archivada).
+    """
+    importe = round(float(importe), 2)
+    if importe <= 0:
+        raise ValueError("El importe del cobro tiene que ser mayor que cero.")
+    fecha = fecha or datetime.now().strftime("%Y-%m-%d")
+    datetime.strptime(fecha, "%Y-%m-%d")      # ValueError si la fecha no es válida
+    empezar_escritura(conn)
+    # La comprobación va en el mismo UPDATE: dos cobros a la vez no pueden pasarse de lo pendiente.
+    cursor = conn.execute(f"""
+        UPDATE facturas SET cobrado = cobrado + ?, pendiente = pendiente - ?, version = version + 1,
+               estado = {ESTADO_SEGUN_SALDO.format(pendiente="pendiente - ?", cobrado="cobrado + ?")}
+        WHERE id = ? AND pendiente >= ? - 0.005
+    """, (importe, importe, importe, importe, factura_id, importe))
+    if cursor.rowcount == 0:
+        fila = conn.execute("SELECT pendiente FROM facturas WHERE id = ?", (factura_id,)).fetchone()
+        if fila is None:
+            raise ValueError(f"La factura {factura_id} no existe o pertenece a un ejercicio archivado.")
+        raise ValueError(f"El cobro ({importe:.2f}€) es mayor que lo pendiente de la factura ({fila[0]:.2f}€).")
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO cobros (factura_id, fecha, importe, forma, nota) VALUES (?, ?, ?, ?, ?)",
+                   (factura_id, fecha, importe, forma, nota))
+    return cursor.lastrowid
+
+
+def cobrar_pendiente(conn, factura_id, fecha=None, forma=None):
+    """Cobra todo lo que le queda a la factura (lo que antes era "Marcar como Pagada"). Devuelve el importe."""
+    fila = conn.execute("SELECT pendiente FROM facturas WHERE id = ?", (factura_id,)).fetchone()
+    if fila is None:
+        raise ValueError(f"La factura {factura_id} no existe o pertenece a un ejercicio archivado.")
+    if fila[0] <= MARGEN:
+        return 0.0
+    registrar_cobro(conn, factura_id, fila[0], fecha, forma)
+    return round(fila[0], 2)
+
+
+def borrar_cobro(conn, cobro_id):
+    """Anula un cobro apuntado por error: la factura vuelve a deberlo. Devuelve su factura_id (o None). No hace commit."""
+    empezar_escritura(conn)
+    fila = conn.execute("DELETE FROM cobros WHERE id = ? RETURNING factura_id, importe", (cobro_id,)).fetchone()
+    if fila is None:
+        return None
+    factura_id, importe = fila
+    conn.execute(f"""
+        UPDATE facturas SET cobrado = cobrado - ?, pendiente = pendiente + ?, version = version + 1,
+               estado = {ESTADO_SEGUN_SALDO.format(pendiente="pendiente + ?", cobrado="cobrado - ?")}
+        WHERE id = ?
+    """, (importe, importe, importe, importe, factura_id))
+    return factura_id
+
+
+def anular_cobros(conn, factura_id):
+    """Anula todos los cobros de la factura (lo que antes era "Marcar como Pendiente"). No hace commit."""
+    ids = [fila[0] for fila in conn.execute("SELECT id FROM cobros WHERE factura_id = ?", (factura_id,))]
+    for cobro_id in ids:
+        borrar_cobro(conn, cobro_id)
+    return len(ids)
+
+
+def ajustar_pendiente(conn, factura_id, importe):
+    """Suma `importe` a lo pendiente (negativo para las rectificativas) y recalcula el estado. No hace commit."""
+    conn.execute(f"""
+        UPDATE facturas SET pendiente = pendiente + ?,
+               estado = {ESTADO_SEGUN_SALDO.format(pendiente="pendiente + ?", cobrado="cobrado")}
+        WHERE id = ?
+    """, (importe, importe, factura_id))
+
+
+def cobros_de(conn, factura_id):
+    """(id, fecha, importe, forma, nota) de los cobros de una factura, por fecha."""
+    return conn.execute("SELECT id, fecha, importe, forma, nota FROM cobros WHERE factura_id = ? "
+                        "ORDER BY fecha, id", (factura_id,)).fetchall()
+
+
+def limites_tramos(hoy):
+    """Fecha (AAAA-MM-DD) en la que empieza cada tramo de TRAMOS contando hacia atrás desde `hoy`."""
+    return [(hoy - timedelta(days=desde)).isoformat() for desde, _hasta in TRAMOS]
+
+
+def antiguedad(conn, hoy=None):
+    """
+    Informe de antigüedad de lo pendiente, por cliente: (cliente_id, cliente,
+    [importe de cada tramo de TRAMOS], total, nº de facturas, fecha de la más
+    antigua), de más a menos deuda. Solo cuentan las facturas con fecha hasta `hoy`.
+    """
+    hoy = hoy or date.today()
+    if isinstance(hoy, str):
+        hoy = date.fromisoformat(hoy)
+    # Tramo n: facturas con fecha <= inicios[n] y > inicios[n + 1] (el último, sin límite).
+    inicios = limites_tramos(hoy)
+    columnas, params = [], []
+    for n, inicio in enumerate(inicios):
+        if n + 1 < len(inicios):
+            columnas.append("SUM(CASE WHEN fecha <= ? AND fecha > ? THEN pendiente ELSE 0.0 END)")
+            params += [inicio, inicios[n + 1]]
+        else:
+            columnas.append("SUM(CASE WHEN fecha <= ? THEN pendiente ELSE 0.0 END)")
+            params.append(inicio)
+    filas = conn.execute(f"""
+        SELECT a.*, c.nombre || ' ' || COALESCE(c.apellido, '')
+        FROM (
+            SELECT cliente_id, SUM(pendiente), COUNT(*), MIN(fecha), {", ".join(columnas)}
+            FROM facturas
+            WHERE {_FILTRO_ABIERTAS} AND fecha <= ?
+            GROUP BY cliente_id
+        ) a
+        JOIN clientes c ON c.id = a.cliente_id
+    """, (*params, hoy.isoformat())).fetchall()
+    # PostgreSQL no tiene ROUND(double, int): se redondea aquí.
+    informe = [(cliente_id, nombre, [round(importe, 2) for importe in tramos], round(total, 2), facturas, str(mas_antigua))
+               for cliente_id, total, facturas, mas_antigua, *tramos, nombre in filas]
+    informe.sort(key=lambda fila: (-fila[3], fila[0]))
+    return informe
+
+
+def nombres_tramos():
+    """'0-30', '31-60', ... '+90' para las cabeceras del informe."""
+    return [f"{desde}-{hasta}" if hasta is not None else f"+{desde - 1}" for desde, hasta in TRAMOS]
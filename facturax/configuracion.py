@@ -0,0 +1,143 @@
+# Configuración de la empresa (nombre, CIF, dirección...) guardada en config.json,
+# y los filtros de facturas guardados por el usuario.
+#
+# El archivo se lee una vez y se guarda en memoria. Solo se vuelve a leer si ha
+# cambiado en el disco (se mira la fecha de modificación), y eso como mucho una
+# vez por segundo, así que generar cientos de PDFs seguidos no toca el disco.
+import json
+import os
+import tempfile
+import threading
+import time
+
+CONFIG_POR_DEFECTO = {
+    "nombre_empresa": "Mi Empresa S.L.",
+    "direccion_empresa": "Calle Falsa 123, 1ºA",
+    "ciudad_empresa": "Madrid",
+    "cp_empresa": "28001",
+    "cif_empresa": "B12345678",
+    "email_empresa": "empresa@ejemplo.com",
+    "telefono_empresa": "123 45 67 89"
+}
+
+# La máscara de permisos del proceso (solo se puede leer cambiándola: se hace
+# una vez al importar, antes de que haya otros hilos).
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class CompanyConfig:
+    """Gestiona la configuración de la empresa en un archivo JSON."""
+
+    def __init__(self, config_path="config.json", intervalo_comprobacion=1.0):
+        self.config_path = config_path
+        # Cada cuántos segundos, como mucho, se mira si el archivo ha cambiado.
+        self.intervalo_comprobacion = intervalo_comprobacion
+        self._config = None
+        self._firma = None                # (mtime, tamaño) del archivo cuando se leyó
+        self._ultima_comprobacion = 0.0
+        self._lock = threading.Lock()
+
+    def cargar_configuracion(self):
+        """Devuelve los datos de la empresa (de memoria si el archivo no ha cambiado)."""
+        with self._lock:
+            ahora = time.monotonic()
+            if self._config is not None and ahora - self._ultima_comprobacion < self.intervalo_comprobacion:
+                return dict(self._config)
+            self._ultima_comprobacion = ahora
+
+            try:
+                estado = os.stat(self.config_path)
+            except FileNotFoundError:
+                # No hay archivo: se crea uno con los datos por defecto.
+                self._escribir(CONFIG_POR_DEFECTO)
+                return dict(self._config)
+
+            firma = (estado.st_mtime_ns, estado.st_size)
+            if self._config is None or firma != self._firma:
+                with open(self.config_path, "r", encoding="utf-8") as f:
+                    leida = json.load(f)
+                # Si faltan claves (archivo antiguo o editado a mano) se usan las de por defecto.
+                self._config = {**CONFIG_POR_DEFECTO, **leida}
+                self._firma = firma
+            return dict(self._config)
+
+    def guardar_configuracion(self, config):
+        """Guarda los datos de la empresa en config.json."""
+        with self._lock:
+            self._escribir(config)
+
+    def _escribir(self, config):
+        escribir_json_atomico(self.config_path, config)
+        estado = os.stat(self.config_path)
+        self._config = dict(config)
+        self._firma = (estado.st_mtime_ns, estado.st_size)
+        self._ultima_comprobacion = time.monotonic()
+
+
+def copiar_permisos(ruta_temporal, ruta):
+    """
+    Da a `ruta_temporal` los permisos que tiene `ruta` (o los de un archivo nuevo
+    si no existe). mkstemp crea los temporales solo para el dueño (0600) y al
+    renombrar se quedarían así.
+    """
+    try:
+        modo = os.stat(ruta).st_mode & 0o777
+    except FileNotFoundError:
+        modo = 0o666 & ~_UMASK
+    os.chmod(ruta_temporal, modo)
+
+
+def escribir_json_atomico(ruta, datos):
+    """Guarda `datos` en un JSON sin que nadie pueda leerlo a medio escribir."""
+    # Se escribe en un archivo temporal de la misma carpeta y luego se renombra.
+    # El renombrado es atómico.
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    fd, ruta_temporal = tempfile.mkstemp(prefix="." + os.path.basename(ruta) + "-", suffix=".tmp", dir=carpeta)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(datos, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        copiar_permisos(ruta_temporal, ruta)
+        os.replace(ruta_temporal, ruta)
+    except BaseException:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+
+
+class FiltrosGuardados:
+    """Filtros de la tabla de facturas que el usuario ha guardado con un nombre (en un JSON)."""
+
+    def __init__(self, ruta="filtros_facturas.json"):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+    def _leer(self):
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def nombres(self):
+        with self._lock:
+            return sorted(self._leer())
+
+    def obtener(self, nombre):
+        """Devuelve el diccionario del filtro (ver FiltroFacturas.a_dict) o None."""
+        with self._lock:
+            return self._leer().get(nombre)
+
+    def guardar(self, nombre, datos):
+        with self._lock:
+            filtros = self._leer()
+            filtros[nombre] = datos
+            escribir_json_atomico(self.ruta, filtros)
+
+    def borrar(self, nombre):
+        with self._lock:
+            filtros = self._leer()
+            if filtros.pop(nombre, None) is not None:
+                escribir_json_atomico(self.ruta, filtros)
@@ -0,0 +1,301 @@
+# Consultas de lectura que usan las ventanas (tabla de facturas, buscador de
+# clientes...). Están aquí, separadas de Tkinter, para poder probarlas y medirlas
+# sin abrir la interfaz.
+from datetime import datetime
+
+
+# --- Ordenación y paginación ---
+#
+# El ORDER BY no se puede pasar como parámetro (?), así que solo se aceptan las
+# columnas de estas listas blancas: la clave es el nombre de la columna en el
+# Treeview y el valor, las expresiones SQL por las que se ordena. Al final
+# siempre se desempata por id para que las páginas no se solapen.
+
+TAMANO_PAGINA = 200
+
+ORDEN_FACTURAS = {
+    "id": ("f.id",),
+    "cliente": ("c.nombre", "c.apellido"),
+    "total": ("f.total",),
+    "estado": ("f.estado",),
+    "fecha": ("f.fecha",),
+    "numero": ("f.serie", "f.fecha", "f.numero"),
+}
+ORDEN_CLIENTES = {
+    "ID": ("id",), "Nombre": ("nombre",), "Apellido": ("apellido",), "Email": ("email",),
+    "Teléfono": ("telefono",), "Dirección": ("direccion",), "Ciudad": ("ciudad",), "CP": ("cp",), "CIF": ("cif",),
+}
+ORDEN_PRODUCTOS = {
+    "ID": ("id",), "Nombre": ("nombre",), "Descripción": ("descripcion",), "Precio": ("precio",),
+    "Tipo": ("tipo",), "IVA": ("iva_rate",), "IRPF": ("irpf_rate",),
+}
+ORDEN_USUARIOS = {"ID": ("id",), "Nombre": ("nombre",), "Usuario": ("usuario",), "Rol": ("rol",)}
+
+
+def ordenar_y_paginar(query, params, columnas, orden, descendente=False, pagina=None, tamano_pagina=TAMANO_PAGINA):
+    """
+    Añade a la consulta el ORDER BY de la columna `orden` (de la lista blanca
+    `columnas`) y, si se pide una página (empezando en 0), el LIMIT/OFFSET.
+    """
+    if orden not in columnas:
+        raise ValueError(f"No se puede ordenar por '{orden}'.")
+    direccion = "DESC" if descendente else "ASC"
+    expresiones = list(columnas[orden])
+    desempate = next(iter(columnas.values()))[0]   # la primera columna es siempre el id
+    if desempate not in expresiones:
+        expresiones.append(desempate)
+    query += " ORDER BY " + ", ".join(f"{e} {direccion}" for e in expresiones)
+    params = list(params)
+    if pagina is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [tamano_pagina, pagina * tamano_pagina]
+    return query, params
+
+
+def contar_filas(cursor, query, params):
+    cursor.execute(f"SELECT COUNT(*) FROM ({query}) AS t", tuple(params))
+    return cursor.fetchone()[0]
+
+
+# --- Filtros de la tabla de facturas ---
+
+ESTADOS_FACTURA = ("Pagada", "Parcial", "Pendiente")
+
+
+class ErrorFiltro(ValueError):
+    """Algún campo del filtro tiene un valor que no se entiende (el mensaje es para el usuario)."""
+
+
+def leer_fecha(texto):
+    """Convierte 'DD/MM/AAAA', 'AAAA-MM-DD' o 'AAAA/MM/DD' en 'AAAA-MM-DD' (o None si está vacío)."""
+    texto = (texto or "").strip()
+    if not texto:
+        return None
+    for formato in ("%d/%m/%Y", "%Y-%m-%d", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(texto, formato).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    raise ErrorFiltro(f"Fecha no válida: '{texto}' (usa DD/MM/AAAA).")
+
+
+def mostrar_fecha(fecha_iso):
+    """'AAAA-MM-DD' -> 'DD/MM/AAAA' (para enseñarla en la ventana)."""
+    if not fecha_iso:
+        return ""
+    return datetime.strptime(fecha_iso, "%Y-%m-%d").strftime("%d/%m/%Y")
+
+
+def leer_importe(texto):
+    """Convierte '1500', '1500.5' o '1500,5' en número (o None si está vacío)."""
+    texto = (texto or "").strip()
+    if not texto:
+        return None
+    try:
+        return float(texto.replace(",", "."))
+    except ValueError:
+        raise ErrorFiltro(f"Importe no válido: '{texto}'.") from None
+
+
+class FiltroFacturas:
+    """
+    Filtros de la tabla de facturas. Todos son opcionales y se combinan con AND.
+
+    La SQL que genera está pensada para usar los índices: las fechas se comparan
+    como texto ISO con BETWEEN, y el cliente y el producto se buscan con
+    subconsultas sobre su tabla en vez de concatenar nombres en cada fila.
+    """
+
+    CAMPOS = ("cliente", "cliente_id", "estados", "fecha_desde", "fecha_hasta",
+              "importe_min", "importe_max", "producto", "producto_id")
+
+    def __init__(self, cliente="", cliente_id=None, estados=(), fecha_desde=None, fecha_hasta=None,
+                 importe_min=None, importe_max=None, producto="", producto_id=None):
+        self.cliente = (cliente or "").strip()
+        self.cliente_id = cliente_id
+        self.estados = tuple(estados or ())
+        self.fecha_desde = fecha_desde
+        self.fecha_hasta = fecha_hasta
+        self.importe_min = importe_min
+        self.importe_max = importe_max
+        self.producto = (producto or "").strip()
+        self.producto_id = producto_id
+
+        if fecha_desde and fecha_hasta and fecha_desde > fecha_hasta:
+            raise ErrorFiltro("La fecha 'desde' es posterior a la fecha 'hasta'.")
+        if importe_min is not None and importe_max is not None and importe_min > importe_max:
+            raise ErrorFiltro("El importe mínimo es mayor que el máximo.")
+
+    @classmethod
+    def desde_texto(cls, cliente="", estados=(), fecha_desde="", fecha_hasta="", importe_min="",
+                    importe_max="", producto=""):
+        """Crea el filtro con lo que el usuario ha escrito en los campos de la ventana."""
+        return cls(cliente=cliente, estados=[e for e in estados if e and e != "Todos"],
+                   fecha_desde=leer_fecha(fecha_desde), fecha_hasta=leer_fecha(fecha_hasta),
+                   importe_min=leer_importe(importe_min), importe_max=leer_importe(importe_max),
+                   producto=producto)
+
+    def condiciones(self, esquema="main"):
+        """
+        Devuelve (lista de condiciones SQL, parámetros) sobre `facturas f`.
+        `esquema` es la base de datos de la que sale `f` (la principal o un archivo).
+        """
+        condiciones = []
+        params = []
+
+        if self.cliente_id is not None:
+            condiciones.append("f.cliente_id = ?")
+            params.append(self.cliente_id)
+        if self.cliente:
+            # Cada palabra tiene que aparecer en el nombre o en el apellido ("ana garcía").
+            palabras = self.cliente.split()
+            condiciones.append("f.cliente_id IN (SELECT id FROM clientes WHERE "
+                               + " AND ".join(["(nombre LIKE ? OR apellido LIKE ?)"] * len(palabras)) + ")")
+            for palabra in palabras:
+                params += [f"%{palabra}%", f"%{palabra}%"]
+
+        if self.estados:
+            condiciones.append(f"f.estado IN ({', '.join('?' * len(self.estados))})")
+            params += self.estados
+
+        for columna, desde, hasta in (("f.fecha", self.fecha_desde, self.fecha_hasta),
+                                      ("f.total", self.importe_min, self.importe_max)):
+            if desde is not None and hasta is not None:
+                condiciones.append(f"{columna} BETWEEN ? AND ?")
+                params += [desde, hasta]
+            elif desde is not None:
+                condiciones.append(f"{columna} >= ?")
+                params.append(desde)
+            elif hasta is not None:
+                condiciones.append(f"{columna} <= ?")
+                params.append(hasta)
+
+        if self.producto_id is not None:
+            condiciones.append(f"f.id IN (SELECT d.factura_id FROM {esquema}.detalles_factura d WHERE d.producto_id = ?)")
+            params.append(self.producto_id)
+        if self.producto:
+            condiciones.append(f"f.id IN (SELECT d.factura_id FROM {esquema}.detalles_factura d "
+                               "WHERE d.producto_id IN (SELECT id FROM productos WHERE nombre LIKE ?))")
+            params.append(f"%{self.producto}%")
+
+        return condiciones, params
+
+    def consulta(self, archivos=()):
+        """
+        Consulta completa de la tabla de facturas. Devuelve (query, params).
+        `archivos` son los esquemas de los años archivados (ya adjuntados a la
+        conexión, ver facturax/archivo.py) que también hay que mirar.
+        """
+        if not archivos:
+            condiciones, params = self.condiciones()
+            origen = "facturas f"
+        else:
+            # Se filtra cada base de datos por separado (cada una con sus índices) y
+            # luego se juntan; el JOIN con clientes y el ORDER BY van por fuera.
+            partes, params = [], []
+            for esquema in ("main", *archivos):
+                condiciones, params_esquema = self.condiciones(esquema)
+                partes.append(f"SELECT f.id, f.cliente_id, f.total, f.estado, f.fecha, f.serie, f.numero "
+                              f"FROM {esquema}.facturas f"
+                              + (" WHERE " + " AND ".join(condiciones) if condiciones else ""))
+                params += params_esquema
+            condiciones = []
+            origen = "(" + " UNION ALL ".join(partes) + ") f"
+        query = f"""
+            SELECT f.id, c.nombre || ' ' || c.apellido as cliente, f.total, f.estado, f.fecha, f.serie, f.numero
+            FROM {origen}
+            JOIN clientes c ON f.cliente_id = c.id
+        """
+        if condiciones:
+            query += " WHERE " + " AND ".join(condiciones)
+        return query, params
+
+    def a_dict(self):
+        """Para guardar el filtro en JSON (filtros guardados)."""
+        datos = {campo: getattr(self, campo) for campo in self.CAMPOS}
+        datos["estados"] = list(self.estados)
+        return datos
+
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(**{campo: valor for campo, valor in datos.items() if campo in cls.CAMPOS})
+
+
+def consulta_facturas(cliente="", estado="Todos", min_importe="", max_importe="", fecha=""):
+    """Consulta de la tabla de facturas con los filtros sencillos de antes (una fecha, un estado)."""
+    return FiltroFacturas.desde_texto(cliente=cliente, estados=[estado], fecha_desde=fecha, fecha_hasta=fecha,
+                                      importe_min=min_importe, importe_max=max_importe).consulta()
+
+
+def buscar_facturas(cursor, orden="id", descendente=False, pagina=None, tamano_pagina=TAMANO_PAGINA,
+                    filtro=None, archivos=(), **filtros):
+    """
+    Devuelve las filas (id, cliente, total, estado, fecha, serie, número) que cumplen los filtros.
+    Se le puede pasar un `FiltroFacturas` o los filtros sencillos de `consulta_facturas`.
+    Con `archivos` (solo con FiltroFacturas) se buscan también en esos años archivados.
+    """
+    query, params = filtro.consulta(archivos) if filtro is not None else consulta_facturas(**filtros)
+    query, params = ordenar_y_paginar(query, params, ORDEN_FACTURAS, orden, descendente, pagina, tamano_pagina)
+    cursor.execute(query, tuple(params))
+    return cursor.fetchall()
+
+
+def contar_facturas(cursor, filtro=None, archivos=(), **filtros):
+    query, params = filtro.consulta(archivos) if filtro is not None else consulta_facturas(**filtros)
+    return contar_filas(cursor, query, params)
+
+
+def consulta_clientes(nombre_filtro=""):
+    """Consulta de la tabla de clientes, filtrando por nombre o apellido si se indica."""
+    query = "SELECT id, nombre, apellido, email, telefono, direccion, ciudad, cp, cif FROM clientes"
+    params = []
+    # Si el usuario escribió algo en el buscador, filtramos
+    if nombre_filtro:
+        query += " WHERE nombre LIKE ? OR apellido LIKE ?"
+        params.append(f"%{nombre_filtro}%")
+        params.append(f"%{nombre_filtro}%")
+    return query, params
+
+
+def buscar_clientes(cursor, nombre_filtro="", orden="ID", descendente=False, pagina=None, tamano_pagina=TAMANO_PAGINA):
+    """Clientes para la tabla de clientes, filtrando por nombre o apellido si se indica."""
+    query, params = consulta_clientes(nombre_filtro)
+    query, params = ordenar_y_paginar(query, params, ORDEN_CLIENTES, orden, descendente, pagina, tamano_pagina)
+    cursor.execute(query, tuple(params))
+    return cursor.fetchall()
+
+
+def contar_clientes(cursor, nombre_filtro=""):
+    return contar_filas(cursor, *consulta_clientes(nombre_filtro))
+
+
+def consulta_productos(nombre_filtro="", tipo_filtro="Todos"):
+    """Consulta de la tabla de productos, por nombre y/o tipo."""
+    query = "SELECT id, nombre, descripcion, precio, tipo, iva_rate, irpf_rate FROM productos WHERE 1 = 1"
+    params = []
+    if nombre_filtro:
+        query += " AND nombre LIKE ?"
+        params.append(f"%{nombre_filtro}%")
+    if tipo_filtro and tipo_filtro != "Todos":
+        query += " AND tipo = ?"
+        params.append(tipo_filtro)
+    return query, params
+
+
+def buscar_productos(cursor, nombre_filtro="", tipo_filtro="Todos", orden="ID", descendente=False,
+                     pagina=None, tamano_pagina=TAMANO_PAGINA):
+    query, params = consulta_productos(nombre_filtro, tipo_filtro)
+    query, params = ordenar_y_paginar(query, params, ORDEN_PRODUCTOS, orden, descendente, pagina, tamano_pagina)
+    cursor.execute(query, tuple(params))
+    return cursor.fetchall()
+
+
+def contar_productos(cursor, nombre_filtro="", tipo_filtro="Todos"):
+    return contar_filas(cursor, *consulta_productos(nombre_filtro, tipo_filtro))
+
+
+def buscar_usuarios(cursor, orden="ID", descendente=False):
+    query, params = ordenar_y_paginar("SELECT id, nombre, usuario, rol FROM usuarios", [],
+                                      ORDEN_USUARIOS, orden, descendente)
+    cursor.execute(query, tuple(params))
+    return cursor.fetchall()
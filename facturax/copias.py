@@ -0,0 +1,176 @@
+# Copias de seguridad en caliente y checkpoints del WAL.
+#
+# La base de datos va en modo WAL (write-ahead log): los cambios se escriben
+# primero en facturacion.db-wal y se pasan al archivo principal en cada
+# "checkpoint". Así los que leen no bloquean a los que escriben, y una copia de
+# seguridad (que solo lee) puede durar lo que haga falta sin parar la facturación.
+#
+# Las copias usan la API de backup de SQLite: se copian `paginas` páginas cada
+# vez, soltando la base de datos entre un paso y otro, y se avisa del progreso.
+# Opcionalmente se comprimen con gzip y se borran las más antiguas.
+#
+# Para lanzarla desde el programador de tareas (sin abrir la ventana):
+#   python -m facturax.copias --destino D:/copias --comprimir --conservar 14
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+# Carpeta por defecto de las copias (al lado de la carpeta database/).
+DIRECTORIO_COPIAS = Path(__file__).resolve().parent.parent / "copias"
+
+# Si la base de datos cambia mientras se copia, SQLite vuelve a empezar la copia.
+# Después de tantos reinicios se copia todo de una vez (con WAL tampoco bloquea).
+MAX_REINICIOS = 3
+
+
+class _CopiaReiniciada(Exception):
+    pass
+
+
+def activar_wal(conn):
+    """Pone la base de datos en modo WAL (se queda guardado en el archivo). Devuelve el modo final."""
+    return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+
+
+def checkpoint(conn, modo="PASSIVE"):
+    """
+    Pasa el WAL al archivo principal. PASSIVE no espera a nadie: copia lo que
+    puede sin bloquear a los que leen o escriben. Devuelve (ocupado, páginas en
+    el WAL, páginas copiadas).
+    """
+    if modo not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"Modo de checkpoint no válido: {modo}")
+    return conn.execute(f"PRAGMA wal_checkpoint({modo})").fetchone()
+
+
+def copia_seguridad(origen, destino=None, comprimir=False, conservar=7, paginas=1024, progreso=None):
+    """
+    Hace una copia de la base de datos `origen` (ruta) en la carpeta `destino` y
+    devuelve la ruta del archivo creado. `progreso(copiadas, total)` se llama
+    después de cada paso (en páginas). Si `conservar` no es None, se borran las
+    copias más antiguas de esa carpeta y se dejan solo las `conservar` últimas.
+    """
+    destino = Path(destino or DIRECTORIO_COPIAS)
+    destino.mkdir(parents=True, exist_ok=True)
+    nombre = f"{Path(origen).stem}_{datetime.now():%Y%m%d_%H%M%S}"
+    final = destino / (nombre + (".db.gz" if comprimir else ".db"))
+    temporal = destino / (nombre + ".db.parcial")
+
+    try:
+        try:
+            _copiar(origen, temporal, paginas, progreso)
+        except _CopiaReiniciada:
+            # La base de datos se está modificando demasiado para copiarla a trozos.
+            _copiar(origen, temporal, -1, progreso)
+
+        if comprimir:
+            comprimido = temporal.with_suffix(".gz.parcial")
+            with open(temporal, "rb") as entrada, gzip.open(comprimido, "wb", compresslevel=6) as salida:
+                shutil.copyfileobj(entrada, salida, 1024 * 1024)
+            os.remove(temporal)
+            temporal = comprimido
+        # Solo aparece con su nombre definitivo cuando está completa.
+        os.replace(temporal, final)
+    finally:
+        for sobrante in (temporal, temporal.with_suffix(".gz.parcial")):
+            if sobrante.exists():
+                os.remove(sobrante)
+
+    if conservar is not None:
+        rotar_copias(destino, Path(origen).stem, conservar)
+    return str(final)
+
+
+def _copiar(origen, ruta_destino, paginas, progreso):
+    reinicios = 0
+    pendientes_antes = None
+
+    def al_avanzar(estado, pendientes, total):
+        nonlocal reinicios, pendientes_antes
+        # Si quedan más páginas que antes es que SQLite ha empezado otra vez.
+        if pendientes_antes is not None and pendientes > pendientes_antes:
+            reinicios += 1
+            if paginas > 0 and reinicios > MAX_REINICIOS:
+                raise _CopiaReiniciada()
+        pendientes_antes = pendientes
+        if progreso is not None:
+            progreso(total - pendientes, total)
+
+    if os.path.exists(ruta_destino):
+        os.remove(ruta_destino)
+    with closing(sqlite3.connect(origen)) as fuente, closing(sqlite3.connect(ruta_destino)) as copia:
+        fuente.backup(copia, pages=paginas, progress=al_avanzar, sleep=0.005)
+        # La copia es un solo archivo, sin -wal al lado (la original sigue en WAL).
+        copia.execute("PRAGMA journal_mode=DELETE")
+
+
+def listar_copias(destino=None, prefijo=""):
+    """(ruta, tamaño en bytes, fecha de modificación) de las copias, de la más nueva a la más antigua."""
+    destino = Path(destino or DIRECTORIO_COPIAS)
+    if not destino.is_dir():
+        return []
+    copias = [ruta for ruta in destino.iterdir()
+              if ruta.name.startswith(prefijo) and ruta.name.endswith((".db", ".db.gz"))]
+    copias.sort(key=lambda ruta: ruta.name, reverse=True)   # el nombre lleva la fecha
+    return [(str(ruta), ruta.stat().st_size, datetime.fromtimestamp(ruta.stat().st_mtime)) for ruta in copias]
+
+
+def rotar_copias(destino, prefijo, conservar):
+    """Borra las copias más antiguas y deja las `conservar` últimas. Devuelve las borradas."""
+    borradas = []
+    for ruta, _tamano, _fecha in listar_copias(destino, prefijo + "_")[max(conservar, 1):]:
+        os.remove(ruta)
+        borradas.append(ruta)
+    return borradas
+
+
+class PuntosControl(threading.Thread):
+    """Hilo que hace un checkpoint PASSIVE cada `intervalo` segundos para que el WAL no crezca."""
+
+    def __init__(self, db_manager, intervalo=300):
+        super().__init__(name="checkpoints-wal", daemon=True)
+        self.db_manager = db_manager
+        self.intervalo = intervalo
+        self.ultimo = None      # (ocupado, páginas en el WAL, páginas copiadas)
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.ultimo = self.db_manager.checkpoint()
+            except sqlite3.Error as e:
+                print(f"[DB] No se pudo hacer el checkpoint: {e}")
+
+    def parar(self):
+        self._parar.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copia de seguridad de la base de datos de FacturaX.")
+    parser.add_argument("--db", help="Base de datos a copiar (por defecto database/facturacion.db).")
+    parser.add_argument("--destino", default=str(DIRECTORIO_COPIAS), help="Carpeta donde dejar la copia.")
+    parser.add_argument("--comprimir", action="store_true", help="Comprime la copia con gzip.")
+    parser.add_argument("--conservar", type=int, default=7, help="Cuántas copias guardar (las demás se borran).")
+    parser.add_argument("--paginas", type=int, default=1024, help="Páginas que se copian en cada paso.")
+    args = parser.parse_args(argv)
+
+    origen = args.db or str(Path(__file__).resolve().parent.parent / "database" / "facturacion.db")
+    if not os.path.exists(origen):
+        parser.error(f"No existe la base de datos {origen}")
+
+    def mostrar(copiadas, total):
+        print(f"\r[Copia] {copiadas}/{total} páginas", end="", flush=True)
+
+    ruta = copia_seguridad(origen, args.destino, comprimir=args.comprimir, conservar=args.conservar,
+                           paginas=args.paginas, progreso=mostrar)
+    print(f"\n[Copia] Guardada en {ruta}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+# Base de datos de FacturaX: conexión y creación de las tablas.
+# Por defecto es un archivo de SQLite; con una URL postgresql://... los datos
+# están en un servidor PostgreSQL compartido (ver facturax/almacen.py).
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from facturax.seguridad import GestorContrasenas
+from facturax.perfil_sql import RegistroConsultas
+from facturax.cache import CacheConsultas
+from facturax.modelos import Producto, fabrica, columnas
+from facturax.almacen import URL_ENTORNO, ErrorAlmacen, MotorPostgres, MotorSQLite, es_url_postgres
+from facturax import archivo, cobros, copias, facturas, mantenimiento, rectificativas, recurrentes, tareas
+
+
+class DatabaseManager:
+    """Gestiona la conexión y la estructura de la base de datos."""
+
+    def __init__(self, db_path=None, gestor_contrasenas=None, url=None, motor=None):
+        base_dir = Path(__file__).resolve().parent.parent   # carpeta del proyecto (donde está app.py)
+        self.db_path = str((base_dir / "database" / "facturacion.db") if db_path is None else Path(db_path))
+        # Se encarga de los hashes de bcrypt (con el coste configurado).
+        self.gestor_contrasenas = gestor_contrasenas or GestorContrasenas()
+        # Perfilado de consultas SQL (None = desactivado, sin ningún coste).
+        self.registro_sql = None
+        # Un archivo por ejercicio cerrado (ver facturax/archivo.py).
+        self.directorio_archivo = os.path.join(os.path.dirname(self.db_path), "archivo")
+
+        # Motor de almacenamiento: el que se pase, el de la URL (o la de FACTURAX_DB_URL) o el archivo de SQLite.
+        url = url or (os.environ.get(URL_ENTORNO) if db_path is None and motor is None else None)
+        if url and not es_url_postgres(url):
+            raise ErrorAlmacen(f"URL de base de datos no soportada: {url}")
+        if motor is None and url:
+            motor = MotorPostgres(url)
+        if motor is not None and not motor.es_sqlite:
+            self.motor = motor
+            # Con varios puestos escribiendo, lo que cambian los demás solo se ve al caducar la caché.
+            self.cache = CacheConsultas(ttl=5.0)
+        else:
+            self.crear_directorio_db()
+            self.motor = motor or MotorSQLite(self.db_path)
+            # Caché de las consultas de solo lectura que más se repiten (ver consulta_cacheada).
+            self.cache = CacheConsultas()
+        print(f"[DB] Usando base de datos en: {self.motor}")  # ← deja este print para verificar
+
+    @property
+    def es_sqlite(self):
+        return self.motor.es_sqlite
+
+    def _solo_sqlite(self, que):
+        if not self.motor.es_sqlite:
+            raise ErrorAlmacen(f"{que} solo está disponible con SQLite; con PostgreSQL lo hace el servidor.")
+
+    def get_db_connection(self):
+        """Retorna una conexión a la base de datos."""
+        # Todas las conexiones avisan a la caché de las tablas en las que escriben.
+        conn = self.motor.conectar(self.registro_sql)
+        conn.vigilar(self.cache)
+        return conn
+
+    @contextmanager
+    def conexion(self):
+        """
+        Conexión para un `with`: commit si todo va bien, rollback si hay una
+        excepción y, al salir, se cierra. En PostgreSQL así vuelve al pool en ese
+        momento, aunque una traza guardada siga apuntando a la conexión.
+        """
+        conn = self.get_db_connection()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def consulta_cacheada(self, sql, params=(), tablas=(), row_factory=None):
+        """
+        Ejecuta una consulta de solo lectura y devuelve sus filas (una tupla).
+        Si se repite con los mismos parámetros sale de la caché hasta que alguien
+        escriba en alguna de las `tablas` de las que lee.
+        """
+        def leer():
+            with self.conexion() as conn:
+                conn.row_factory = row_factory
+                return tuple(conn.execute(sql, tuple(params)).fetchall())
+        return self.cache.obtener((sql, tuple(params), row_factory is not None), tablas, leer)
+
+    # --- Consultas pequeñas que las ventanas repiten muchas veces (van por la caché) ---
+
+    def clientes_para_combo(self):
+        """(id, nombre, apellido) de todos los clientes."""
+        return self.consulta_cacheada("SELECT id, nombre, apellido FROM clientes", tablas=("clientes",))
+
+    def productos_de_tipo(self, tipo):
+        """Productos (objetos Producto) de un tipo ('Producto' o 'Servicio')."""
+        return self.consulta_cacheada(f"SELECT {columnas(Producto)} FROM productos WHERE tipo = ?",
+                                      (tipo,), tablas=("productos",), row_factory=fabrica(Producto))
+
+    def tasas_producto(self, producto_id):
+        """(iva_rate, irpf_rate) de un producto, o None si no existe."""
+        filas = self.consulta_cacheada("SELECT iva_rate, irpf_rate FROM productos WHERE id = ?",
+                                       (producto_id,), tablas=("productos",))
+        return filas[0] if filas else None
+
+    def cabecera_factura(self, factura_id):
+        """(id, fecha, cliente_id, nombre, apellido, total, estado) de una factura, o None."""
+        filas = self.consulta_cacheada("""
+            SELECT f.id, f.fecha, f.cliente_id, c.nombre, c.apellido, f.total, f.estado
+            FROM facturas f JOIN clientes c ON c.id = f.cliente_id
+            WHERE f.id = ?
+        """, (factura_id,), tablas=("facturas", "clientes"))
+        return filas[0] if filas else None
+
+    def activar_perfilado_sql(self, umbral_ms=100.0, ruta_log=None):
+        """
+        Empieza a medir todas las consultas. Las que tarden más de `umbral_ms`
+        se apuntan con su plan en diagnostico/consultas_lentas.log (o en `ruta_log`).
+        """
+        self.desactivar_perfilado_sql()
+        self.registro_sql = RegistroConsultas(ruta_log, umbral_ms=umbral_ms)
+        return self.registro_sql
+
+    def desactivar_perfilado_sql(self):
+        if self.registro_sql is not None:
+            self.registro_sql.cerrar()
+            self.registro_sql = None
+
+    def activar_wal(self):
+        """Pone la base de datos en modo WAL (los que leen no bloquean a los que escriben)."""
+        self._solo_sqlite("El modo WAL")
+        with self.conexion() as conn:
+            modo = copias.activar_wal(conn)
+        if modo.lower() != "wal":
+            print(f"[DB] No se pudo activar el modo WAL (modo actual: {modo})")
+        return modo
+
+    def checkpoint(self, modo="PASSIVE"):
+        """Pasa el WAL a la base de datos. Devuelve (ocupado, páginas en el WAL, páginas copiadas)."""
+        self._solo_sqlite("El checkpoint del WAL")
+        with self.conexion() as conn:
+            return copias.checkpoint(conn, modo)
+
+    def copia_seguridad(self, destino=None, comprimir=False, conservar=7, progreso=None):
+        """Copia de seguridad en caliente (ver facturax/copias.py). Devuelve la ruta de la copia."""
+        self._solo_sqlite("La copia de seguridad")
+        return copias.copia_seguridad(self.db_path, destino, comprimir=comprimir, conservar=conservar,
+                                      progreso=progreso)
+
+    # --- Mantenimiento (ver facturax/mantenimiento.py); cada tarea apunta cuándo se hizo ---
+
+    def optimizar(self):
+        """PRAGMA optimize: actualiza las estadísticas que hagan falta para los planes de consulta."""
+        self._solo_sqlite("El mantenimiento")
+        with self.conexion() as conn:
+            mantenimiento.optimizar(conn)
+            mantenimiento.apuntar(conn, "optimizar")
+
+    def analizar(self):
+        """ANALYZE completo."""
+        self._solo_sqlite("El mantenimiento")
+        with self.conexion() as conn:
+            mantenimiento.analizar(conn)
+            mantenimiento.apuntar(conn, "analizar")
+
+    def comprobar(self, rapido=False):
+        """(errores de integridad, claves ajenas rotas)."""
+        self._solo_sqlite("El mantenimiento")
+        with self.conexion() as conn:
+            errores, rotas = mantenimiento.comprobar(conn, rapido=rapido)
+            mantenimiento.apuntar(conn, "comprobar", f"{len(errores)} errores, {len(rotas)} claves rotas")
+        return errores, rotas
+
+    def tamanos(self):
+        """(lista de tablas e índices con lo que ocupan, resumen del archivo)."""
+        self._solo_sqlite("El mantenimiento")
+        with self.conexion() as conn:
+            return mantenimiento.tamanos(conn)
+
+    def compactar(self, progreso=None):
+        """Compacta el archivo (VACUUM INTO + sustitución). Devuelve (bytes antes, bytes después)."""
+        self._solo_sqlite("El mantenimiento")
+        antes, despues = mantenimiento.compactar(self.db_path, progreso)
+        # El contenido es el mismo, pero la caché no se ha enterado de la sustitución.
+        self.cache.vaciar()
+        with self.conexion() as conn:
+            mantenimiento.apuntar(conn, "compactar", f"{antes} -> {despues} bytes")
+        return antes, despues
+
+    def ultimo_mantenimiento(self):
+        """{tarea: (fecha, resultado)} de la última vez que se hizo cada tarea."""
+        with self.conexion() as conn:
+            return mantenimiento.ultimas(conn)
+
+    # --- Archivo de ejercicios cerrados (ver facturax/archivo.py) ---
+
+    def anios_archivados(self):
+        if not self.motor.es_sqlite:
+            return []
+        return archivo.anios_archivados(self.directorio_archivo, Path(self.db_path).stem)
+
+    def anios_archivables(self):
+        """(año, nº de facturas pagadas) de los años cerrados que se pueden archivar."""
+        self._solo_sqlite("El archivo de ejercicios")
+        with self.conexion() as conn:
+            return archivo.anios_archivables(conn)
+
+    def archivar_anio(self, anio):
+        """Pasa las facturas pagadas de ese año a su archivo. Devuelve cuántas."""
+        self._solo_sqlite("El archivo de ejercicios")
+        archivadas = archivo.archivar_anio(self.db_path, self.directorio_archivo, anio)
+        self.cache.invalidar([tabla for tabla, _columna in archivo.TABLAS_ARCHIVO])
+        return archivadas
+
+    def adjuntar_archivos(self, conn, filtro):
+        """Adjunta a `conn` los años archivados a los que llega el filtro y devuelve sus esquemas."""
+        anios = archivo.anios_del_filtro(filtro, self.anios_archivados())
+        if not anios:
+            return []
+        return archivo.adjuntar(conn, self.directorio_archivo, Path(self.db_path).stem, anios)
+
+    def localizar_factura(self, conn, factura_id):
+        """'main', el esquema del archivo donde está la factura (queda adjuntado) o None."""
+        if not self.motor.es_sqlite:
+            return "main" if conn.execute("SELECT 1 FROM facturas WHERE id = ?", (factura_id,)).fetchone() else None
+        return archivo.localizar_factura(conn, self.directorio_archivo, Path(self.db_path).stem, factura_id)
+
+    # --- Cola de tareas largas (ver facturax/tareas.py) ---
+
+    def encolar_tarea(self, tipo, parametros, max_intentos=tareas.MAX_INTENTOS):
+        """Deja una tarea en la cola para que la haga el trabajador. Devuelve su id."""
+        with self.conexion() as conn:
+            tarea_id = tareas.encolar(conn, tipo, parametros, max_intentos)
+        return tarea_id
+
+    def tareas(self, limite=200):
+        with self.conexion() as conn:
+            return tareas.listar(conn, limite)
+
+    def cancelar_tarea(self, tarea_id):
+        with self.conexion() as conn:
+            return tareas.cancelar(conn, tarea_id)
+
+    def reintentar_tarea(self, tarea_id):
+        with self.conexion() as conn:
+            return tareas.reintentar(conn, tarea_id)
+
+    def borrar_tareas_terminadas(self):
+        with self.conexion() as conn:
+            return tareas.borrar_terminadas(conn)
+
+    # --- Facturas recurrentes (ver facturax/recurrentes.py) ---
+
+    def generar_recurrentes(self, hasta, empresa=None, bloque=500):
+        """
+        Crea las facturas de las plantillas hasta `hasta` (AAAA-MM-DD) y devuelve sus ids.
+        Con `empresa` deja también en la cola de tareas sus PDFs, en bloques de `bloque`
+        facturas (así varios procesos los pueden ir haciendo a la vez).
+        """
+        with self.conexion() as conn:
+            ids = recurrentes.generar_facturas(conn, hasta)
+        if empresa is not None:
+            for inicio in range(0, len(ids), bloque):
+                self.encolar_tarea("generar_pdfs", {"facturas": ids[inicio:inicio + bloque], "empresa": empresa})
+        return ids
+
+    def plantilla_desde_factura(self, factura_id, periodicidad, proxima, descripcion=""):
+        with self.conexion() as conn:
+            plantilla_id = recurrentes.plantilla_desde_factura(conn, factura_id, periodicidad, proxima, descripcion)
+        return plantilla_id
+
+    def plantillas(self):
+        with self.conexion() as conn:
+            return recurrentes.listar_plantillas(conn)
+
+    def activar_plantilla(self, plantilla_id, activa):
+        with self.conexion() as conn:
+            recurrentes.activar_plantilla(conn, plantilla_id, activa)
+
+    def borrar_plantilla(self, plantilla_id):
+        with self.conexion() as conn:
+            recurrentes.borrar_plantilla(conn, plantilla_id)
+
+    # --- Cobros e informe de antigüedad (ver facturax/cobros.py) ---
+
+    def registrar_cobro(self, factura_id, importe, fecha=None, forma=None, nota=""):
+        """Apunta un cobro (también parcial) y devuelve su id (ValueError si no se puede)."""
+        with self.conexion() as conn:
+            cobro_id = cobros.registrar_cobro(conn, factura_id, importe, fecha, forma, nota)
+        return cobro_id
+
+    def cobrar_pendiente(self, factura_id, fecha=None, forma=None):
+        with self.conexion() as conn:
+            importe = cobros.cobrar_pendiente(conn, factura_id, fecha, forma)
+        return importe
+
+    def borrar_cobro(self, cobro_id):
+        with self.conexion() as conn:
+            factura_id = cobros.borrar_cobro(conn, cobro_id)
+        return factura_id
+
+    def anular_cobros(self, factura_id):
+        with self.conexion() as conn:
+            anulados = cobros.anular_cobros(conn, factura_id)
+        return anulados
+
+    def saldo_cobro(self, factura_id):
+        """(cobrado, pendiente) de una factura, o None si no está en la base de datos principal."""
+        with self.conexion() as conn:
+            fila = conn.execute("SELECT cobrado, pendiente FROM facturas WHERE id = ?", (factura_id,)).fetchone()
+        return (round(fila[0], 2), round(fila[1], 2)) if fila else None
+
+    def cobros_factura(self, factura_id):
+        with self.conexion() as conn:
+            return cobros.cobros_de(conn, factura_id)
+
+    def antiguedad(self, hoy=None):
+        with self.conexion() as conn:
+            return cobros.antiguedad(conn, hoy)
+
+    # --- Facturas rectificativas (ver facturax/rectificativas.py) ---
+
+    def rectificar_factura(self, factura_id, cantidades=None, motivo="", fecha=None):
+        """Crea la rectificativa de una factura y devuelve su id (ValueError si no se puede)."""
+        with self.conexion() as conn:
+            rectificativa_id = rectificativas.rectificar_factura(conn, factura_id, cantidades, motivo, fecha)
+        return rectificativa_id
+
+    def borrar_factura(self, factura_id, version=None):
+        """Borra la última factura de su serie (ValueError si no se puede, ConflictoEdicion si ha cambiado)."""
+        with self.conexion() as conn:
+            facturas.borrar_factura(conn, factura_id, version)
+
+    def tiene_rectificaciones(self, factura_id):
+        with self.conexion() as conn:
+            return rectificativas.tiene_rectificaciones(conn, factura_id)
+
+    def saldo_factura(self, factura_id):
+        """(total, rectificado, neto) de la factura, esté en la principal o archivada."""
+        with self.conexion() as conn:
+            esquema = self.localizar_factura(conn, factura_id)
+            return rectificativas.saldo_factura(conn, factura_id, esquema) if esquema else None
+
+    def rectificaciones_periodo(self, desde, hasta):
+        with self.conexion() as conn:
+            return rectificativas.rectificaciones_periodo(conn, desde, hasta)
+
+    def crear_directorio_db(self):
+        """Crea la carpeta de la base de datos si no existe."""
+        # Se obtiene el nombre del directorio de la ruta completa de la base de datos.
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+    def crear_tablas(self):
+        """Crea las tablas si no están creadas."""
+        if self.motor.es_sqlite:
+            self.activar_wal()
+        with self.conexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS usuarios (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nombre TEXT NOT NULL,
+                    usuario TEXT NOT NULL UNIQUE,
+                    contraseña TEXT NOT NULL,
+                    rol TEXT NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS clientes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nombre TEXT NOT NULL,
+                    apellido TEXT,
+                    cif TEXT UNIQUE,
+                    direccion TEXT,
+                    ciudad TEXT,
+                    cp TEXT,
+                    email TEXT UNIQUE,
+                    telefono TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS productos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nombre TEXT NOT NULL,
+                    descripcion TEXT,
+                    precio REAL NOT NULL,
+                    tipo TEXT NOT NULL,
+                    iva_rate REAL NOT NULL DEFAULT 0.21,
+                    irpf_rate REAL NOT NULL DEFAULT 0.0
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS facturas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cliente_id INTEGER,
+                    total REAL NOT NULL DEFAULT 0.0,
+                    estado TEXT NOT NULL DEFAULT 'Pendiente',
+                    fecha DATE NOT NULL,
+                    serie TEXT,
+                    numero INTEGER,
+                    version INTEGER NOT NULL DEFAULT 1,
+                    cobrado REAL NOT NULL DEFAULT 0,
+                    pendiente REAL,
+                    FOREIGN KEY (cliente_id) REFERENCES clientes(id)
+                )
+            """)
+            # Bases de datos de antes de la numeración por series y del control de versiones.
+            self._anadir_columnas(cursor, "facturas", (("serie", "TEXT"), ("numero", "INTEGER"),
+                                                       ("version", "INTEGER NOT NULL DEFAULT 1")))
+            # Último número usado de cada serie en cada año (ver facturax/facturas.py).
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS series_factura (
+                    serie TEXT NOT NULL,
+                    anio INTEGER NOT NULL,
+                    ultimo INTEGER NOT NULL,
+                    PRIMARY KEY (serie, anio)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS detalles_factura (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    factura_id INTEGER,
+                    producto_id INTEGER,
+                    cantidad INTEGER NOT NULL,
+                    precio_unitario REAL NOT NULL,
+                    iva_rate_aplicado REAL NOT NULL,
+                    irpf_rate_aplicado REAL NOT NULL,
+                    FOREIGN KEY (factura_id) REFERENCES facturas(id),
+                    FOREIGN KEY (producto_id) REFERENCES productos(id)
+                )
+            """)
+            # Huella de cada PDF generado, para no repetir los que no han cambiado.
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS pdf_generados (
+                    factura_id INTEGER PRIMARY KEY,
+                    huella TEXT NOT NULL,
+                    ruta TEXT NOT NULL,
+                    generado TEXT NOT NULL,
+                    FOREIGN KEY (factura_id) REFERENCES facturas(id)
+                )
+            """)
+            # Índices para filtrar y ordenar las tablas sin recorrerlas enteras.
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_facturas_fecha ON facturas(fecha)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_facturas_total ON facturas(total)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_facturas_estado ON facturas(estado)")
+            # Por cliente y fecha (el extracto de cuenta); sustituye al que era solo por cliente.
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_facturas_cliente_fecha ON facturas(cliente_id, fecha)")
+            cursor.execute("DROP INDEX IF EXISTS idx_facturas_cliente")
+            # Un número no se puede repetir en la misma serie y año (las facturas antiguas no tienen número).
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_facturas_numero "
+                           "ON facturas(serie, (substr(fecha, 1, 4)), numero)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_detalles_factura ON detalles_factura(factura_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_detalles_producto ON detalles_factura(producto_id, factura_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_clientes_nombre ON clientes(nombre, apellido)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_clientes_apellido ON clientes(apellido)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos(nombre)")
+            mantenimiento.crear_tabla(conn)
+            tareas.crear_tabla(conn)
+            recurrentes.crear_tablas(conn)
+            rectificativas.crear_tablas(conn)
+            cobros.crear_tablas(conn)      # después de rectificaciones: la migración las tiene en cuenta
+
+    @staticmethod
+    def _anadir_columnas(cursor, tabla, columnas):
+        """Añade a `tabla` las columnas (nombre, definición) que le falten."""
+        cursor.execute(f"SELECT * FROM {tabla} LIMIT 0")
+        existentes = {descripcion[0].lower() for descripcion in cursor.description}
+        for nombre, definicion in columnas:
+            if nombre not in existentes:
+                cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {nombre} {definicion}")
+
+    def crear_usuario_inicial(self):
+        """Crea un usuario administrador por defecto si no existe."""
+        with self.conexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM usuarios")
+            if cursor.fetchone()[0] == 0:
+                nombre = "Admin"
+                usuario = "admin"
+                contrasena_hash = self.gestor_contrasenas.hash("admin")
+                rol = "administrador"
+                cursor.execute("INSERT INTO usuarios (nombre, usuario, contraseña, rol) VALUES (?, ?, ?, ?)",
+                               (nombre, usuario, contrasena_hash, rol))
+                print("Usuario administrador por defecto creado: 'admin' / 'admin'")
+
+    def actualizar_credenciales_usuario(self, usuario_actual, nuevo_usuario, nueva_contrasena, contrasena_hash=None):
+        """
+        Cambia usuario y contraseña. Devuelve True si se actualizó algún usuario.
+        Los errores de la base de datos (sqlite3.Error) se dejan pasar para que
+        la ventana que llama decida cómo mostrarlos.
+        """
+        # Encriptar la nueva contraseña (si no viene ya calculada en segundo plano)
+        if contrasena_hash is None:
+            contrasena_hash = self.gestor_contrasenas.hash(nueva_contrasena)
+
+        # Abrir conexión y cursor solo en este método
+        with self.conexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE usuarios SET usuario = ?, contraseña = ? WHERE usuario = ?",
+                (nuevo_usuario, contrasena_hash, usuario_actual)
+            )
+            return cursor.rowcount > 0  # True si se actualizó al menos 1 usuario
+
+    def actualizar_hash_contrasena(self, usuario, hash_anterior, hash_nuevo):
+        """Sustituye el hash de un usuario (solo si nadie lo ha cambiado mientras tanto)."""
+        with self.conexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE usuarios SET contraseña = ? WHERE usuario = ? AND contraseña = ?",
+                           (hash_nuevo, usuario, hash_anterior))
+            return cursor.rowcount > 0
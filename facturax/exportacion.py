@@ -0,0 +1,93 @@
+# Exportar muchas facturas de una vez: en un único PDF (con marcadores para
+# saltar de una factura a otra) o en un ZIP con un PDF por factura.
+#
+# En los dos casos se va factura por factura: nunca se tienen todas en memoria.
+# El PDF combinado usa el mismo diseño que `crear_pdf_factura` y el ZIP reutiliza
+# los PDFs que ya estaban generados si no han cambiado.
+import os
+import zipfile
+
+from reportlab.platypus import PageBreak
+from reportlab.platypus.flowables import Flowable
+
+from facturax.pdf import (StoryPerezosa, escribir_con_renombrado, nuevo_documento, leer_datos_factura, trozos_story,
+                          generar_pdf_factura)
+
+
+class Marcador(Flowable):
+    """Elemento invisible que añade una entrada al índice (marcadores) del PDF."""
+
+    def __init__(self, titulo, clave):
+        super().__init__()
+        self.titulo = titulo
+        self.clave = clave
+
+    def wrap(self, ancho_disponible, alto_disponible):
+        return 0, 0
+
+    def draw(self):
+        self.canv.bookmarkPage(self.clave)
+        self.canv.addOutlineEntry(self.titulo, self.clave, level=0, closed=True)
+
+
+def exportar_pdf_combinado(db_manager, facturas_ids, empresa, ruta, progreso=None):
+    """
+    Junta varias facturas en un solo PDF, cada una empezando en página nueva y
+    con su marcador. Devuelve cuántas facturas se han incluido.
+    `progreso(hechas, total)` se llama después de preparar cada factura.
+    """
+    facturas_ids = list(facturas_ids)
+    incluidas = [0]
+
+    def trozos(ancho):
+        # Una sola conexión para todo el lote; cada factura se lee justo antes de dibujarla.
+        with db_manager.conexion() as conn:
+            cursor = conn.cursor()
+            for n, factura_id in enumerate(facturas_ids, start=1):
+                esquema = db_manager.localizar_factura(conn, factura_id)
+                factura = leer_datos_factura(cursor, factura_id, esquema) if esquema else None
+                if factura is not None and (factura.productos or factura.servicios):
+                    inicio = [] if incluidas[0] == 0 else [PageBreak()]
+                    inicio.append(Marcador(f"Factura {factura.numero_completo} - {factura.cliente.nombre_completo}",
+                                           f"factura_{factura.id}"))
+                    incluidas[0] += 1
+                    # Las facturas grandes también van por trozos (ver trozos_story).
+                    for trozo in trozos_story(factura, empresa, ancho):
+                        yield inicio + trozo
+                        inicio = []
+                if progreso is not None:
+                    progreso(n, len(facturas_ids))
+
+    def escribir(ruta_temporal):
+        doc = nuevo_documento(ruta_temporal)
+        doc.title = f"Facturas ({len(facturas_ids)})"
+        # Que el visor abra el PDF con el panel de marcadores visible.
+        doc.build(StoryPerezosa(trozos(doc.width)), onFirstPage=lambda canv, _doc: canv.showOutline())
+        if incluidas[0] == 0:
+            raise ValueError("Ninguna de las facturas seleccionadas tiene líneas.")
+        return incluidas[0]
+
+    return escribir_con_renombrado(ruta, escribir)
+
+
+def exportar_zip(db_manager, facturas_ids, empresa, ruta, progreso=None):
+    """
+    Guarda el PDF de cada factura dentro de un ZIP, una detrás de otra.
+    Los PDFs que no han cambiado no se vuelven a generar. Devuelve cuántos se han añadido.
+    """
+    facturas_ids = list(facturas_ids)
+
+    def escribir(ruta_temporal):
+        añadidas = 0
+        with zipfile.ZipFile(ruta_temporal, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for n, factura_id in enumerate(facturas_ids, start=1):
+                ruta_pdf = generar_pdf_factura(db_manager, factura_id, empresa)
+                if ruta_pdf is not None:
+                    # `write` copia el archivo a trozos, no lo carga entero.
+                    zf.write(ruta_pdf, arcname=os.path.basename(ruta_pdf))
+                    añadidas += 1
+                if progreso is not None:
+                    progreso(n, len(facturas_ids))
+        return añadidas
+
+    return escribir_con_renombrado(ruta, escribir)
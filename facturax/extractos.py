@@ -0,0 +1,195 @@
+# Extracto de cuenta de un cliente: sus facturas, rectificativas y cobros de un
+# periodo, por fecha, con el saldo después de cada movimiento.
+#
+# - El saldo acumulado lo calcula la base de datos con una función de ventana
+#   (SUM(...) OVER (ORDER BY ...)) sobre las facturas del cliente, que se leen
+#   por el índice (cliente_id, fecha), y sus cobros, por su factura. Lo de antes
+#   del periodo es un solo número (el saldo anterior), otra consulta agregada.
+# - Las filas se van leyendo del cursor mientras ReportLab dibuja: el PDF se
+#   construye por trozos de FILAS_POR_TABLA movimientos con StoryPerezosa (ver
+#   facturax/pdf.py), así un cliente con miles de facturas no se carga
+#   entero en memoria.
+# - El diseño (cabecera con empresa y cliente, tablas azules, totales) es el
+#   mismo que el de las facturas (facturax/pdf.py).
+#
+# Las facturas archivadas (ver facturax/archivo.py) están todas cobradas y no
+# cambian el saldo; el extracto solo enumera los movimientos de la base de
+# datos principal.
+from datetime import datetime
+
+from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+
+from facturax.modelos import Cliente, columnas, numero_factura
+from facturax.pdf import (ESTILO_TABLA_LINEAS, ESTILO_TABLA_TOTALES, FILAS_POR_TABLA, StoryPerezosa,
+                          escribir_con_renombrado, estilos_factura, nuevo_documento, tabla_cabecera)
+# Fechas para los periodos sin principio o sin final.
+SIN_DESDE, SIN_HASTA = "0000-01-01", "9999-12-31"
+# Largo máximo del concepto (las celdas no parten el texto en líneas).
+LARGO_CONCEPTO = 32
+
+# Facturas (también las rectificativas, en negativo) y cobros (en negativo) del
+# cliente; `orden` pone las facturas de un día antes que sus cobros.
+_MOVIMIENTOS = """
+    SELECT f.fecha, 0 AS orden, f.id AS ref, f.id AS factura_id, f.serie, f.numero, f.fecha AS factura_fecha,
+           r.original_numero AS detalle, f.total AS importe
+    FROM facturas f
+    LEFT JOIN rectificaciones r ON r.rectificativa_id = f.id
+    WHERE f.cliente_id = ? AND f.fecha BETWEEN ? AND ?
+    UNION ALL
+    SELECT c.fecha, 1, c.id, f.id, f.serie, f.numero, f.fecha, c.forma, -c.importe
+    FROM facturas f
+    JOIN cobros c ON c.factura_id = f.id
+    WHERE f.cliente_id = ? AND c.fecha BETWEEN ? AND ?
+"""
+
+
+def _periodo(desde, hasta):
+    return desde or SIN_DESDE, hasta or SIN_HASTA
+
+
+def saldo_anterior(conn, cliente_id, desde):
+    """Lo que debía el cliente antes de `desde` (facturado menos cobrado). 0 si no hay `desde`."""
+    if not desde:
+        return 0.0
+    facturado, cobrado = conn.execute("""
+        SELECT (SELECT COALESCE(SUM(total), 0) FROM facturas WHERE cliente_id = ? AND fecha < ?),
+               (SELECT COALESCE(SUM(c.importe), 0) FROM facturas f JOIN cobros c ON c.factura_id = f.id
+                WHERE f.cliente_id = ? AND c.fecha < ?)
+    """, (cliente_id, desde, cliente_id, desde)).fetchone()
+    return round(facturado - cobrado, 2)
+
+
+def contar_movimientos(conn, cliente_id, desde=None, hasta=None):
+    desde, hasta = _periodo(desde, hasta)
+    return conn.execute(f"SELECT COUNT(*) FROM ({_MOVIMIENTOS}) m",
+                        (cliente_id, desde, hasta, cliente_id, desde, hasta)).fetchone()[0]
+
+
+def movimientos(conn, cliente_id, desde=None, hasta=None, saldo_inicial=0.0):
+    """
+    Va dando los movimientos del periodo (fechas AAAA-MM-DD incluidas; None = sin
+    límite) por orden: (fecha, documento, concepto, importe, saldo). El importe es
+    positivo si aumenta la deuda (factura) y negativo si la reduce (rectificativa,
+    cobro). Lee del cursor a medida que se piden: `conn` tiene que seguir abierta.
+    """
+    desde, hasta = _periodo(desde, hasta)
+    cursor = conn.execute(f"""
+        SELECT fecha, orden, factura_id, serie, numero, factura_fecha, detalle, importe,
+               SUM(importe) OVER (ORDER BY fecha, orden, ref ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+        FROM ({_MOVIMIENTOS}) m
+        ORDER BY fecha, orden, ref
+    """, (cliente_id, desde, hasta, cliente_id, desde, hasta))
+    for fecha, orden, factura_id, serie, numero, factura_fecha, detalle, importe, acumulado in cursor:
+        documento = numero_factura(factura_id, serie, numero, factura_fecha)
+        if orden == 1:
+            concepto = f"Cobro ({detalle})" if detalle else "Cobro"
+        elif detalle is not None:
+            concepto = f"Rectificativa de {detalle}"
+        else:
+            concepto = "Factura"
+        # PostgreSQL no tiene ROUND(double, int): se redondea aquí.
+        yield str(fecha), documento, concepto, round(importe, 2), round(saldo_inicial + acumulado, 2)
+
+
+def _tabla_movimientos(filas):
+    # Tabla con la cabecera azul de las facturas; si no cabe en la página, la cabecera se repite.
+    tabla = Table([["Fecha", "Documento", "Concepto", "Cargo", "Abono", "Saldo"]] + filas,
+                  colWidths=[70, 95, 145, 75, 75, 80], repeatRows=1)
+    tabla.setStyle(ESTILO_TABLA_LINEAS)
+    tabla.setStyle(TableStyle([
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('ALIGN', (1, 1), (2, -1), 'LEFT'),
+    ]))
+    return tabla
+
+
+def construir_extracto(cliente, empresa, ancho, movimientos, saldo_inicial=0.0, desde=None, hasta=None,
+                       progreso=None):
+    """
+    Va dando los trozos (listas de elementos de ReportLab) del extracto para
+    StoryPerezosa; `movimientos` (lo que da movimientos()) se consume poco a poco.
+    Al acabar devuelve (con `return`, se recoge con `yield from`) el resumen:
+    movimientos, cargos, abonos y saldo final. `progreso(hechos)` va por trozos.
+    """
+    styles = estilos_factura()
+    trozo = [Paragraph("<b>EXTRACTO DE CUENTA</b>", styles['FacturaTitle']), Spacer(1, 50),
+             tabla_cabecera(empresa, cliente, ancho), Spacer(1, 24)]
+    if desde or hasta:
+        periodo = " ".join(texto for texto in (desde and f"desde {desde}", hasta and f"hasta {hasta}") if texto)
+    else:
+        periodo = "todos los movimientos"
+    trozo.append(Table([
+        [Paragraph(f"<b>Periodo:</b> {periodo}", styles['NumFechaLeftIndent'])],
+        [Paragraph(f"<b>Fecha:</b> {datetime.now().strftime('%Y-%m-%d')}", styles['NumFechaLeftIndent'])],
+    ], hAlign='RIGHT'))
+    trozo.append(Spacer(1, 12))
+
+    filas = [[desde or "", "", "Saldo anterior", "", "", f"{saldo_inicial:.2f}€"]] if desde else []
+    cargos = abonos = 0.0
+    saldo = saldo_inicial
+    hechos = 0
+    for fecha, documento, concepto, importe, saldo in movimientos:
+        if importe >= 0:
+            cargos += importe
+        else:
+            abonos -= importe
+        filas.append([fecha, documento, concepto[:LARGO_CONCEPTO], f"{importe:.2f}€" if importe >= 0 else "",
+                      f"{-importe:.2f}€" if importe < 0 else "", f"{saldo:.2f}€"])
+        hechos += 1
+        if len(filas) == FILAS_POR_TABLA:
+            trozo.append(_tabla_movimientos(filas))
+            yield trozo
+            trozo, filas = [], []
+            if progreso is not None:
+                progreso(hechos)
+    if filas or hechos == 0:
+        trozo.append(_tabla_movimientos(filas))
+
+    totales = Table([
+        [Paragraph("<b>Total Cargos</b>", styles['RightAlign']), Paragraph(f"<b>{cargos:.2f}€</b>", styles['RightAlign'])],
+        [Paragraph("<b>Total Abonos</b>", styles['RightAlign']), Paragraph(f"<b>{abonos:.2f}€</b>", styles['RightAlign'])],
+        [Paragraph("<b>Saldo Final</b>", styles['RightAlign']), Paragraph(f"<b>{saldo:.2f}€</b>", styles['RightAlign'])],
+    ], colWidths=[140, 80])
+    totales.setStyle(ESTILO_TABLA_TOTALES)
+    totales_externa = Table([[totales]], colWidths=[550])
+    totales_externa.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP')
+    ]))
+    trozo += [Spacer(1, 40), totales_externa]
+    yield trozo
+    return {"movimientos": hechos, "cargos": round(cargos, 2), "abonos": round(abonos, 2), "saldo": round(saldo, 2)}
+
+
+def generar_extracto(db_manager, cliente_id, empresa, ruta, desde=None, hasta=None, progreso=None):
+    """
+    Guarda en `ruta` el PDF del extracto de cuenta del cliente y devuelve un
+    diccionario con el número de movimientos, el total de cargos, de abonos y el
+    saldo final. `progreso(hechos, total)` se llama cada FILAS_POR_TABLA movimientos.
+    ValueError si el cliente no existe.
+    """
+    resumen = {}
+
+    def trozos(ancho):
+        # La conexión se queda abierta mientras se dibuja: los movimientos se leen sobre la marcha.
+        with db_manager.conexion() as conn:
+            fila = conn.execute(f"SELECT {columnas(Cliente)} FROM clientes WHERE id = ?", (cliente_id,)).fetchone()
+            if fila is None:
+                raise ValueError(f"No existe el cliente {cliente_id}.")
+            total = contar_movimientos(conn, cliente_id, desde, hasta)
+            inicial = saldo_anterior(conn, cliente_id, desde)
+            avance = (lambda hechos: progreso(hechos, total)) if progreso is not None else None
+            resumen.update((yield from construir_extracto(
+                Cliente(*fila), empresa, ancho, movimientos(conn, cliente_id, desde, hasta, inicial),
+                inicial, desde, hasta, avance)))
+        if progreso is not None:
+            progreso(total, total)
+
+    def escribir(ruta_temporal):
+        doc = nuevo_documento(ruta_temporal)
+        doc.title = f"Extracto de cuenta del cliente {cliente_id}"
+        doc.build(StoryPerezosa(trozos(doc.width)))
+
+    # Se genera en un archivo temporal y luego se renombra, como los PDFs de las facturas.
+    escribir_con_renombrado(ruta, escribir)
+    return resumen
@@ -0,0 +1,170 @@
+# Operaciones de escritura sobre las facturas (crear / editar).
+#
+# Numeración: cada factura nueva coge el siguiente número de su serie y año
+# (F2024-00001, F2024-00002...) de la tabla series_factura, dentro de la misma
+# transacción que la factura. Si la transacción no llega al commit, el número
+# tampoco se gasta, así que la serie no tiene huecos aunque haya varios puestos.
+#
+# Edición: cada factura lleva una `version` que sube con cada cambio. Al guardar
+# una edición se comprueba que la versión sigue siendo la que se leyó al abrirla;
+# si otro puesto la ha cambiado entretanto, se avisa en vez de pisar sus cambios.
+# No se bloquea nada mientras la ventana de edición está abierta.
+#
+# Borrado: solo se puede borrar la última factura de su serie y año (y el
+# contador vuelve atrás en la misma transacción), así no quedan huecos. Las
+# demás se corrigen con una rectificativa (ver facturax/rectificativas.py).
+import sqlite3
+from datetime import datetime
+
+from facturax.modelos import LineaFactura
+
+SERIE_POR_DEFECTO = "F"
+# Estado de una factura según lo que le queda por cobrar y lo cobrado (expresiones
+# SQL de las dos cosas). Ver facturax/cobros.py.
+ESTADO_SEGUN_SALDO = ("CASE WHEN {pendiente} <= 0.005 THEN 'Pagada' "
+                      "WHEN {cobrado} > 0.005 THEN 'Parcial' ELSE 'Pendiente' END")
+
+
+class ConflictoEdicion(Exception):
+    """Otro puesto ha cambiado (o borrado) la factura desde que se abrió para editarla."""
+
+
+def empezar_escritura(conn):
+    """
+    En SQLite empieza la transacción con BEGIN IMMEDIATE: se coge el permiso de
+    escritura al principio (esperando si otro está escribiendo) en vez de
+    encontrarse la base de datos ocupada a mitad de la factura. En PostgreSQL no
+    hace falta: el UPDATE del contador ya bloquea solo su fila.
+    """
+    if isinstance(conn, sqlite3.Connection) and not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
+def reservar_numeros(conn, serie, anio, cuantos):
+    """
+    Reserva `cuantos` números seguidos de `serie` en `anio` y devuelve el primero.
+    Se gastan solo si se hace commit.
+    """
+    conn.execute("INSERT INTO series_factura (serie, anio, ultimo) VALUES (?, ?, 0) "
+                 "ON CONFLICT (serie, anio) DO NOTHING", (serie, anio))
+    ultimo = conn.execute("UPDATE series_factura SET ultimo = ultimo + ? WHERE serie = ? AND anio = ? "
+                          "RETURNING ultimo", (cuantos, serie, anio)).fetchall()[0][0]
+    return ultimo - cuantos + 1
+
+
+def siguiente_numero(conn, serie, anio):
+    """Reserva el siguiente número de `serie` en `anio`. Se gasta solo si se hace commit."""
+    return reservar_numeros(conn, serie, anio, 1)
+
+
+def _rectificada(conn, factura_id):
+    # La factura es una rectificativa o ya la ha rectificado otra (ver facturax/rectificativas.py).
+    return conn.execute("SELECT 1 FROM rectificaciones WHERE original_id = ? OR rectificativa_id = ?",
+                        (factura_id, factura_id)).fetchone() is not None
+
+
+def version_factura(conn, factura_id):
+    """Versión actual de la factura (None si no existe). Se lee antes que sus líneas al abrirla."""
+    fila = conn.execute("SELECT version FROM facturas WHERE id = ?", (factura_id,)).fetchone()
+    return fila[0] if fila else None
+
+
+def guardar_factura_db(conn, cliente_id, lineas, total, factura_id=None, fecha=None, tasas_producto=None,
+                       serie=SERIE_POR_DEFECTO, version=None):
+    """
+    Guarda una factura y sus líneas en la base de datos y devuelve su id.
+    `lineas` es una lista de LineaFactura (se guardan tal cual, con sus tasas) o de
+    tuplas (producto_id, cantidad, precio_unitario) (las tasas se cogen del producto).
+    Si `factura_id` es None se crea una factura nueva (con el siguiente número de
+    `serie`); si no, se sobrescribe esa, y si se pasa `version` solo si nadie la ha
+    cambiado desde entonces (si no, ConflictoEdicion). ValueError si el nuevo total
+    es menor que lo que ya se ha cobrado de la factura o si la factura tiene
+    rectificativas (o es una).
+    No hace commit: lo hace quien llama (así todo va en la misma transacción).
+    `tasas_producto` es una función producto_id -> (iva_rate, irpf_rate), por
+    ejemplo `DatabaseManager.tasas_producto` (cacheada); si no se pasa, se leen aquí.
+    """
+    cursor = conn.cursor()
+
+    if factura_id is None:
+        fecha_actual = fecha or datetime.now().strftime("%Y-%m-%d")
+        empezar_escritura(conn)
+        numero = siguiente_numero(conn, serie, int(fecha_actual[:4]))
+        cursor.execute("""
+            INSERT INTO facturas (fecha, cliente_id, total, serie, numero, pendiente)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (fecha_actual, cliente_id, total, serie, numero, total))
+        factura_id_guardada = cursor.lastrowid
+    else:
+        # Las rectificadas y las rectificativas no se editan: se corrigen con otra rectificativa.
+        if _rectificada(conn, factura_id):
+            raise ValueError(f"La factura {factura_id} tiene rectificativas (o es una) y no se puede modificar.")
+        # La versión se comprueba en el mismo UPDATE: si no coincide no cambia ninguna fila.
+        # Lo cobrado y lo abonado con rectificativas (en negativo) se mantienen: lo pendiente
+        # (y el estado) pasan a ser según el nuevo total, que no puede quedar por debajo
+        # de lo cobrado (lo pendiente sería negativo).
+        rectificado = "(SELECT COALESCE(SUM(r.importe), 0) FROM rectificaciones r WHERE r.original_id = facturas.id)"
+        pendiente = f"? + {rectificado} - cobrado"
+        cursor.execute(f"""
+            UPDATE facturas SET cliente_id = ?, total = ?, pendiente = {pendiente}, version = version + 1,
+                   estado = {ESTADO_SEGUN_SALDO.format(pendiente=pendiente, cobrado="cobrado")}
+            WHERE id = ? AND cobrado - {rectificado} <= ? + 0.005
+        """ + ("" if version is None else " AND version = ?"),
+            (cliente_id, total, total, total, factura_id, total) + (() if version is None else (version,)))
+        if cursor.rowcount == 0:
+            fila = conn.execute("SELECT version, cobrado FROM facturas WHERE id = ?", (factura_id,)).fetchone()
+            if fila is None:
+                raise ConflictoEdicion(f"La factura {factura_id} ya no existe: la ha borrado otro usuario.")
+            if version is not None and fila[0] != version:
+                raise ConflictoEdicion(f"Otro usuario ha modificado la factura {factura_id} mientras la editabas.")
+            raise ValueError(f"De la factura {factura_id} ya se han cobrado {fila[1]:.2f}€ y el nuevo total "
+                             f"({total:.2f}€) es menor. Anula antes los cobros que sobren.")
+        cursor.execute("DELETE FROM detalles_factura WHERE factura_id = ?", (factura_id,))
+        factura_id_guardada = factura_id
+
+    # Guardar detalles
+    for linea in lineas:
+        if isinstance(linea, LineaFactura):
+            producto_id, cantidad, precio_unitario = linea.producto_id, linea.cantidad, linea.precio_unitario
+            iva_rate_aplicado, irpf_rate_aplicado = linea.iva_rate, linea.irpf_rate
+        else:
+            producto_id, cantidad, precio_unitario = linea
+            if tasas_producto is not None:
+                iva_rate_aplicado, irpf_rate_aplicado = tasas_producto(producto_id)
+            else:
+                cursor.execute("SELECT iva_rate, irpf_rate FROM productos WHERE id = ?", (producto_id,))
+                iva_rate_aplicado, irpf_rate_aplicado = cursor.fetchone()
+
+        cursor.execute(
+            "INSERT INTO detalles_factura (factura_id, producto_id, cantidad, precio_unitario, iva_rate_aplicado, irpf_rate_aplicado) VALUES (?, ?, ?, ?, ?, ?)",
+            (factura_id_guardada, producto_id, cantidad, precio_unitario, iva_rate_aplicado, irpf_rate_aplicado))
+
+    return factura_id_guardada
+
+
+def borrar_factura(conn, factura_id, version=None):
+    """
+    Borra una factura con sus líneas, cobros y PDF generado. Si tiene número, solo
+    si es la última de su serie y año: el número se devuelve al contador. Si no,
+    ValueError. Con `version`, ConflictoEdicion si alguien la ha cambiado (o
+    borrado) desde que se leyó. No hace commit.
+    """
+    empezar_escritura(conn)
+    fila = conn.execute("SELECT serie, numero, fecha, version FROM facturas WHERE id = ?", (factura_id,)).fetchone()
+    if fila is None:
+        raise ConflictoEdicion(f"La factura {factura_id} ya no existe: la ha borrado otro usuario.")
+    serie, numero, fecha, version_actual = fila
+    if version is not None and version != version_actual:
+        raise ConflictoEdicion(f"Otro usuario ha modificado la factura {factura_id}. Vuelve a mirarla antes de borrarla.")
+    if _rectificada(conn, factura_id):
+        raise ValueError(f"La factura {factura_id} tiene rectificativas (o es una) y no se puede borrar.")
+    # Las facturas de antes de la numeración no tienen número y no dejan hueco.
+    if numero is not None:
+        cursor = conn.execute("UPDATE series_factura SET ultimo = ultimo - 1 WHERE serie = ? AND anio = ? AND ultimo = ?",
+                              (serie, int(str(fecha)[:4]), numero))
+        if cursor.rowcount == 0:
+            raise ValueError(f"Solo se puede borrar la última factura de la serie {serie} de {str(fecha)[:4]}; "
+                             "si no, quedaría un hueco en la numeración. Para corregirla, haz una rectificativa.")
+    for tabla in ("detalles_factura", "pdf_generados", "cobros"):
+        conn.execute(f"DELETE FROM {tabla} WHERE factura_id = ?", (factura_id,))
+    conn.execute("DELETE FROM facturas WHERE id = ?", (factura_id,))
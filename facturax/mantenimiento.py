@@ -0,0 +1,272 @@
+# Mantenimiento de la base de datos.
+#
+# - optimizar / analizar: SQLite elige los índices según las estadísticas de
+#   sqlite_stat1; si no se actualizan, con los años los planes dejan de ser buenos.
+#   `PRAGMA optimize` solo analiza lo que lo necesita, así que es barato y se
+#   lanza solo una vez al día (ver MantenimientoProgramado).
+# - compactar: cada vez que se edita una factura se borran y se vuelven a meter
+#   sus líneas, y el archivo se va llenando de huecos. `VACUUM INTO` escribe una
+#   copia limpia en otro archivo sin bloquear a nadie; se comprueba y luego se
+#   copia encima de la base de datos con la API de backup (así las conexiones
+#   abiertas ven el archivo nuevo sin problemas y nadie escribe a medias; si
+#   alguien guardó algo mientras se hacía la copia limpia, se vuelve a empezar).
+# - comprobar: integrity_check y foreign_key_check.
+# - tamanos: lo que ocupa cada tabla e índice (con la tabla virtual dbstat).
+#
+# Desde la línea de comandos:
+#   python -m facturax.mantenimiento --optimizar --comprobar --tamanos
+#   python -m facturax.mantenimiento --compactar
+import argparse
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime, timedelta
+
+# Veces que se intenta compactar si alguien escribe mientras se hace la copia limpia.
+# El último intento bloquea las escrituras mientras se hace (por eso es el último).
+INTENTOS_COMPACTAR = 3
+
+
+class ErrorMantenimiento(Exception):
+    """Una tarea de mantenimiento no se ha podido terminar (la base de datos queda como estaba)."""
+
+
+class _CopiaVieja(Exception):
+    pass
+
+
+def optimizar(conn, limite_analisis=1000):
+    """
+    `PRAGMA optimize`: analiza solo las tablas que lo necesitan. `limite_analisis`
+    es el número aproximado de filas que mira de cada índice (0 = todas).
+    """
+    conn.execute(f"PRAGMA analysis_limit={int(limite_analisis)}")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+
+
+def analizar(conn):
+    """ANALYZE completo de todas las tablas (más lento que optimizar)."""
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def comprobar(conn, rapido=False, max_errores=100):
+    """
+    Devuelve (errores de integridad, claves ajenas rotas). La primera es una lista
+    de textos (vacía si está bien) y la segunda de (tabla, rowid, tabla padre).
+    """
+    pragma = "quick_check" if rapido else "integrity_check"
+    errores = [fila[0] for fila in conn.execute(f"PRAGMA {pragma}({int(max_errores)})")]
+    if errores == ["ok"]:
+        errores = []
+    rotas = [(tabla, rowid, padre) for tabla, rowid, padre, _fk in conn.execute("PRAGMA foreign_key_check")]
+    return errores, rotas
+
+
+def tamanos(conn):
+    """
+    Lista de (nombre, tipo, tabla, bytes, filas o None) ordenada por tamaño, y el
+    resumen {"total", "libre", "tamano_pagina"} en bytes. Si SQLite no trae la
+    tabla dbstat, solo se dan las filas de cada tabla (los bytes quedan a None).
+    """
+    tamano_pagina = conn.execute("PRAGMA page_size").fetchone()[0]
+    resumen = {"total": conn.execute("PRAGMA page_count").fetchone()[0] * tamano_pagina,
+               "libre": conn.execute("PRAGMA freelist_count").fetchone()[0] * tamano_pagina,
+               "tamano_pagina": tamano_pagina}
+
+    objetos = conn.execute("""
+        SELECT name, type, tbl_name FROM sqlite_master
+        WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_autoindex%'
+    """).fetchall()
+    try:
+        bytes_por_objeto = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    except sqlite3.OperationalError:
+        bytes_por_objeto = None
+
+    filas = []
+    for nombre, tipo, tabla in objetos:
+        cuantas = None
+        if tipo == "table":
+            cuantas = conn.execute(f'SELECT COUNT(*) FROM "{nombre}"').fetchone()[0]
+        ocupa = bytes_por_objeto.get(nombre, 0) if bytes_por_objeto is not None else None
+        filas.append((nombre, tipo, tabla, ocupa, cuantas))
+    filas.sort(key=lambda fila: (fila[3] or 0, fila[4] or 0), reverse=True)
+    return filas, resumen
+
+
+def compactar(ruta_db, progreso=None):
+    """
+    Compacta la base de datos con VACUUM INTO y la sustituye por la copia limpia.
+    Devuelve (bytes antes, bytes después). Se puede seguir trabajando mientras
+    tanto; durante la sustitución final solo se bloquean las escrituras. Si no
+    para de haber cambios, el último intento las bloquea también mientras se
+    hace la copia limpia (mejor hacerlo fuera de horario).
+    """
+    antes = os.path.getsize(ruta_db)
+    temporal = ruta_db + ".compactando"
+    try:
+        for intento in range(1, INTENTOS_COMPACTAR + 1):
+            if _compactar_una_vez(ruta_db, temporal, progreso, bloquear=intento == INTENTOS_COMPACTAR):
+                break
+        else:
+            raise ErrorMantenimiento("La base de datos no ha dejado de cambiar mientras se compactaba. "
+                                     "Inténtalo cuando haya menos actividad.")
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return antes, os.path.getsize(ruta_db)
+
+
+def _compactar_una_vez(ruta_db, temporal, progreso, bloquear=False):
+    if os.path.exists(temporal):
+        os.remove(temporal)
+    with closing(sqlite3.connect(ruta_db, isolation_level=None)) as vigia:
+        # data_version cambia cuando otra conexión guarda algo; así se sabe si la
+        # copia limpia se ha quedado vieja antes de ponerla en su sitio.
+        version = vigia.execute("PRAGMA data_version").fetchone()[0]
+        if bloquear:
+            # Nadie puede escribir hasta el ROLLBACK; se hace la copia con otra conexión
+            # porque VACUUM no se puede lanzar dentro de una transacción.
+            vigia.execute("BEGIN IMMEDIATE")
+            with closing(sqlite3.connect(ruta_db)) as lector:
+                lector.execute("VACUUM INTO ?", (temporal,))
+        else:
+            vigia.execute("VACUUM INTO ?", (temporal,))
+
+        with closing(sqlite3.connect(temporal)) as limpia, closing(sqlite3.connect(ruta_db)) as destino:
+            errores, _rotas = comprobar(limpia, rapido=True)
+            if errores:
+                if bloquear:
+                    vigia.execute("ROLLBACK")
+                raise ErrorMantenimiento(f"La copia compactada no está bien: {errores[0]}")
+            paginas = limpia.execute("PRAGMA page_count").fetchone()[0]
+
+            primer_paso = True
+
+            def al_avanzar(estado, pendientes, total):
+                # Después del primer paso el backup ya tiene bloqueada la escritura
+                # en la base de datos (hasta que termine), así que si data_version no
+                # ha cambiado hasta aquí, ya no cambiará. Si ha cambiado, se cancela
+                # y no se guarda nada de lo copiado. (Luego cambia por el propio backup.)
+                nonlocal primer_paso
+                if primer_paso:
+                    primer_paso = False
+                    if vigia.execute("PRAGMA data_version").fetchone()[0] != version:
+                        raise _CopiaVieja()
+                if progreso is not None:
+                    progreso(total - pendientes, total)
+
+            if bloquear:
+                vigia.execute("ROLLBACK")
+            try:
+                # El primer paso no puede ser el último, o no daría tiempo a comprobarlo.
+                limpia.backup(destino, pages=max(1, min(4096, paginas - 1)), progress=al_avanzar)
+            except _CopiaVieja:
+                return False
+        vigia.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return True
+
+
+# --- Registro de cuándo se hizo cada tarea (tabla `mantenimiento`) ---
+
+def crear_tabla(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS mantenimiento (
+            tarea TEXT PRIMARY KEY,
+            ultima TEXT NOT NULL,
+            resultado TEXT
+        )
+    """)
+
+
+def apuntar(conn, tarea, resultado=""):
+    conn.execute("INSERT OR REPLACE INTO mantenimiento (tarea, ultima, resultado) VALUES (?, ?, ?)",
+                 (tarea, datetime.now().isoformat(timespec="seconds"), resultado))
+    conn.commit()
+
+
+def ultimas(conn):
+    """{tarea: (fecha, resultado)} de la última vez que se hizo cada tarea."""
+    return {tarea: (datetime.fromisoformat(ultima), resultado)
+            for tarea, ultima, resultado in conn.execute("SELECT tarea, ultima, resultado FROM mantenimiento")}
+
+
+class MantenimientoProgramado(threading.Thread):
+    """
+    Hilo que cada `revisar` segundos mira si hace más de `cada` que no se
+    optimiza la base de datos y, si es así, lanza `PRAGMA optimize`.
+    """
+
+    def __init__(self, db_manager, cada=timedelta(days=1), revisar=3600, espera_inicial=60):
+        super().__init__(name="mantenimiento-db", daemon=True)
+        self.db_manager = db_manager
+        self.cada = cada
+        self.revisar = revisar
+        self.espera_inicial = espera_inicial
+        self._parar = threading.Event()
+
+    def run(self):
+        espera = self.espera_inicial   # que no coincida con el arranque del programa
+        while not self._parar.wait(espera):
+            espera = self.revisar
+            try:
+                ultima = self.db_manager.ultimo_mantenimiento().get("optimizar")
+                if ultima is None or datetime.now() - ultima[0] >= self.cada:
+                    self.db_manager.optimizar()
+            except sqlite3.Error as e:
+                print(f"[DB] No se pudo optimizar la base de datos: {e}")
+
+    def parar(self):
+        self._parar.set()
+
+
+def main(argv=None):
+    from facturax.db import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos de FacturaX.")
+    parser.add_argument("--db", help="Base de datos (por defecto database/facturacion.db).")
+    parser.add_argument("--optimizar", action="store_true", help="PRAGMA optimize (rápido).")
+    parser.add_argument("--analizar", action="store_true", help="ANALYZE completo.")
+    parser.add_argument("--compactar", action="store_true", help="VACUUM INTO y sustituir la base de datos.")
+    parser.add_argument("--comprobar", action="store_true", help="integrity_check y foreign_key_check.")
+    parser.add_argument("--tamanos", action="store_true", help="Lo que ocupa cada tabla e índice.")
+    args = parser.parse_args(argv)
+    if not (args.optimizar or args.analizar or args.compactar or args.comprobar or args.tamanos):
+        parser.error("Indica al menos una tarea (--optimizar, --analizar, --compactar, --comprobar, --tamanos).")
+
+    db_manager = DatabaseManager(args.db)
+    if not os.path.exists(db_manager.db_path):
+        parser.error(f"No existe la base de datos {db_manager.db_path}")
+    db_manager.crear_tablas()
+
+    if args.comprobar:
+        errores, rotas = db_manager.comprobar()
+        print(f"[Comprobar] Integridad: {'ok' if not errores else ''}")
+        for error in errores:
+            print(f"  {error}")
+        print(f"[Comprobar] Claves ajenas rotas: {len(rotas)}")
+        for tabla, rowid, padre in rotas[:50]:
+            print(f"  {tabla} (rowid {rowid}) -> {padre}")
+    if args.analizar:
+        db_manager.analizar()
+        print("[Analizar] Hecho.")
+    if args.optimizar:
+        db_manager.optimizar()
+        print("[Optimizar] Hecho.")
+    if args.compactar:
+        antes, despues = db_manager.compactar(
+            progreso=lambda copiadas, total: print(f"\r[Compactar] {copiadas}/{total} páginas", end="", flush=True))
+        print(f"\n[Compactar] {antes / 1024 / 1024:.1f} MB -> {despues / 1024 / 1024:.1f} MB")
+    if args.tamanos:
+        filas, resumen = db_manager.tamanos()
+        print(f"[Tamaños] Total {resumen['total'] / 1024 / 1024:.1f} MB, libre {resumen['libre'] / 1024 / 1024:.1f} MB")
+        for nombre, tipo, tabla, ocupa, cuantas in filas:
+            texto_bytes = f"{ocupa / 1024:>10.0f} KB" if ocupa is not None else "         ? KB"
+            texto_filas = f"{cuantas} filas" if cuantas is not None else f"índice de {tabla}"
+            print(f"  {nombre:<30} {tipo:<6} {texto_bytes}  {texto_filas}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Medición de tiempos de las operaciones más habituales (abrir ventanas, recargar
+# tablas, guardar facturas, generar PDFs...).
+#
+# Cada operación tiene un histograma en memoria con cubetas de tamaño creciente
+# (cada una un 10% más grande que la anterior), así que ocupa lo mismo tanto si
+# se ha medido 10 veces como un millón, y de ahí salen la mediana (p50) y el p95.
+# Lo consulta la ventana "Rendimiento" y se puede exportar a JSON para soporte.
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+_MINIMO_MS = 0.01
+_FACTOR = 1.1
+_CUBETAS = 200   # de 0,01 ms hasta más de una hora
+
+
+def _cubeta(ms):
+    if ms <= _MINIMO_MS:
+        return 0
+    return min(_CUBETAS - 1, int(math.log(ms / _MINIMO_MS, _FACTOR)) + 1)
+
+
+def _limite_superior(cubeta):
+    return _MINIMO_MS * (_FACTOR ** cubeta)
+
+
+class Histograma:
+    """Histograma de tiempos (en ms) de una operación."""
+
+    __slots__ = ("cubetas", "cuenta", "suma", "maximo", "ultimo")
+
+    def __init__(self):
+        self.cubetas = [0] * _CUBETAS
+        self.cuenta = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+        self.ultimo = 0.0
+
+    def añadir(self, ms):
+        self.cubetas[_cubeta(ms)] += 1
+        self.cuenta += 1
+        self.suma += ms
+        self.ultimo = ms
+        if ms > self.maximo:
+            self.maximo = ms
+
+    def percentil(self, p):
+        """Percentil aproximado (con un error de como mucho un 10%)."""
+        if self.cuenta == 0:
+            return 0.0
+        objetivo = math.ceil(self.cuenta * p / 100)
+        acumulado = 0
+        for i, n in enumerate(self.cubetas):
+            acumulado += n
+            if acumulado >= objetivo:
+                return min(_limite_superior(i), self.maximo)
+        return self.maximo
+
+
+class Metricas:
+    """Guarda un histograma por operación. Se puede usar desde varios hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self.desde = datetime.now()
+        # Función opcional a la que se avisa al empezar cada operación; si devuelve
+        # un context manager, la operación se ejecuta dentro (lo usa el perfilador).
+        self.observador = None
+
+    def registrar(self, nombre, ms):
+        with self._lock:
+            histograma = self._histogramas.get(nombre)
+            if histograma is None:
+                histograma = self._histogramas[nombre] = Histograma()
+            histograma.añadir(ms)
+
+    @contextmanager
+    def medir(self, nombre):
+        """Mide lo que tarda el bloque `with`."""
+        extra = self.observador(nombre) if self.observador is not None else None
+        if extra is not None:
+            with extra:
+                with self.medir(nombre):
+                    yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nombre, (time.perf_counter() - inicio) * 1000)
+
+    def medido(self, nombre):
+        """Decorador: mide cada llamada a la función."""
+        def decorador(funcion):
+            @wraps(funcion)
+            def envoltorio(*args, **kwargs):
+                with self.medir(nombre):
+                    return funcion(*args, **kwargs)
+            return envoltorio
+        return decorador
+
+    def resumen(self):
+        """Lista de (operación, veces, p50, p95, máximo, última) en ms, ordenada por p95."""
+        with self._lock:
+            filas = [(nombre, h.cuenta, h.percentil(50), h.percentil(95), h.maximo, h.ultimo)
+                     for nombre, h in self._histogramas.items()]
+        filas.sort(key=lambda f: f[3], reverse=True)
+        return filas
+
+    def exportar_json(self, ruta):
+        """Guarda el resumen y los histogramas en un archivo JSON."""
+        with self._lock:
+            operaciones = {
+                nombre: {
+                    "veces": h.cuenta,
+                    "p50_ms": round(h.percentil(50), 3),
+                    "p95_ms": round(h.percentil(95), 3),
+                    "max_ms": round(h.maximo, 3),
+                    "media_ms": round(h.suma / h.cuenta, 3) if h.cuenta else 0.0,
+                    # Solo las cubetas con algo: {límite superior en ms: veces}
+                    "histograma": {f"{_limite_superior(i):.3f}": n for i, n in enumerate(h.cubetas) if n},
+                }
+                for nombre, h in self._histogramas.items()
+            }
+        datos = {"desde": self.desde.isoformat(timespec="seconds"),
+                 "exportado": datetime.now().isoformat(timespec="seconds"),
+                 "operaciones": operaciones}
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos, f, indent=4, ensure_ascii=False)
+
+    def reiniciar(self):
+        with self._lock:
+            self._histogramas.clear()
+            self.desde = datetime.now()
+
+
+# Instancia compartida por toda la aplicación.
+metricas = Metricas()
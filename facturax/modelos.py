@@ -0,0 +1,147 @@
+# Modelos de datos: facturas, líneas, clientes y productos.
+#
+# Son dataclasses con __slots__ (ocupan menos memoria que un diccionario por
+# objeto y no dejan añadir atributos por error). Los campos van en el mismo
+# orden que las columnas de su tabla, así una fila de SQLite se convierte
+# directamente en el objeto con `fabrica(Clase)` como row_factory del cursor.
+from dataclasses import dataclass, field
+
+
+def fabrica(clase):
+    """row_factory que convierte cada fila en un objeto de `clase` (columnas en el orden de sus campos)."""
+    def crear(cursor, fila):
+        return clase(*fila)
+    return crear
+
+
+def columnas(clase, alias=""):
+    """'c.id, c.nombre, ...' con los campos de la tabla de `clase`, para el SELECT."""
+    prefijo = f"{alias}." if alias else ""
+    return ", ".join(prefijo + nombre for nombre in clase.COLUMNAS)
+
+
+@dataclass(slots=True)
+class Cliente:
+    COLUMNAS = ("id", "nombre", "apellido", "cif", "direccion", "ciudad", "cp", "email", "telefono")
+
+    id: int
+    nombre: str
+    apellido: str = ""
+    cif: str = ""
+    direccion: str = ""
+    ciudad: str = ""
+    cp: str = ""
+    email: str = ""
+    telefono: str = ""
+
+    @property
+    def nombre_completo(self):
+        return f"{self.nombre} {self.apellido}"
+
+
+@dataclass(slots=True)
+class Producto:
+    COLUMNAS = ("id", "nombre", "descripcion", "precio", "tipo", "iva_rate", "irpf_rate")
+
+    id: int
+    nombre: str
+    descripcion: str
+    precio: float
+    tipo: str
+    iva_rate: float = 0.21
+    irpf_rate: float = 0.0
+
+
+@dataclass(slots=True)
+class LineaFactura:
+    """Una línea de factura con las tasas que se le aplican. Los importes se redondean a 2 decimales."""
+
+    producto_id: int
+    nombre: str
+    cantidad: int
+    precio_unitario: float
+    iva_rate: float
+    irpf_rate: float
+    tipo: str = "Producto"
+
+    @property
+    def subtotal(self):
+        return round(self.cantidad * self.precio_unitario, 2)
+
+    @property
+    def iva(self):
+        return round(self.subtotal * self.iva_rate, 2)
+
+    @property
+    def irpf(self):
+        return round(self.subtotal * self.irpf_rate, 2)
+
+    @property
+    def total(self):
+        subtotal = self.subtotal
+        return round(subtotal + round(subtotal * self.iva_rate, 2) - round(subtotal * self.irpf_rate, 2), 2)
+
+    @classmethod
+    def de_producto(cls, producto, cantidad):
+        return cls(producto.id, producto.nombre, cantidad, producto.precio, producto.iva_rate,
+                   producto.irpf_rate, producto.tipo)
+
+
+# Para leer las líneas de una factura con `fabrica(LineaFactura)`. Con
+# `SELECT_LINEAS_DE.format(esquema=...)` se leen las de una factura archivada.
+SELECT_LINEAS_DE = """
+    SELECT df.producto_id, p.nombre, df.cantidad, df.precio_unitario, df.iva_rate_aplicado,
+           df.irpf_rate_aplicado, p.tipo
+    FROM {esquema}.detalles_factura df
+    JOIN productos p ON df.producto_id = p.id
+    WHERE df.factura_id = ?
+    ORDER BY df.id
+"""
+SELECT_LINEAS = SELECT_LINEAS_DE.format(esquema="main")
+
+
+def numero_factura(factura_id, serie, numero, fecha):
+    """Número que sale en la factura ('F2024-00012'); las de antes de las series llevan su id."""
+    if numero is None:
+        return str(factura_id)
+    return f"{serie}{fecha[:4]}-{numero:05d}"
+
+
+@dataclass(slots=True)
+class Factura:
+    COLUMNAS = ("id", "cliente_id", "total", "estado", "fecha", "serie", "numero")
+
+    id: int
+    cliente_id: int
+    total: float
+    estado: str
+    fecha: str
+    serie: str = None
+    numero: int = None
+    # Se rellenan solo cuando hacen falta (por ejemplo, para el PDF).
+    cliente: Cliente = None
+    lineas: list = field(default_factory=list)
+    # Si es una rectificativa, (número, fecha) de la original y el motivo; si la
+    # han rectificado, (número, fecha, importe, motivo) de cada rectificativa.
+    rectifica: tuple = None
+    rectificaciones: list = field(default_factory=list)
+
+    @property
+    def numero_completo(self):
+        return numero_factura(self.id, self.serie, self.numero, self.fecha)
+
+    @property
+    def productos(self):
+        return [linea for linea in self.lineas if linea.tipo == "Producto"]
+
+    @property
+    def servicios(self):
+        return [linea for linea in self.lineas if linea.tipo == "Servicio"]
+
+    def calcular_total(self):
+        return round(sum(linea.total for linea in self.lineas), 2)
+
+    @property
+    def neto(self):
+        """Total menos lo que se ha abonado con rectificativas."""
+        return round(self.total + sum(importe for _numero, _fecha, importe, _motivo in self.rectificaciones), 2)
@@ -0,0 +1,520 @@
+# Generación del PDF de una factura con ReportLab.
+#
+# Antes esto estaba entero dentro de `crear_pdf_factura` en app.py. Se ha
+# separado en trozos (leer datos, construir el contenido, guardar el archivo)
+# para poder reutilizar el diseño en otros sitios y para no volver a generar un
+# PDF que no ha cambiado: cada PDF guarda una "huella" (hash) de todo lo que
+# sale impreso, y si la huella es la misma se devuelve el archivo que ya existe.
+#
+# Las facturas muy grandes (miles de líneas) se hacen en un "modo grande": celdas
+# de texto simple en vez de un Paragraph por celda, tablas de FILAS_POR_TABLA
+# líneas, y cada tabla se crea cuando ReportLab llega a ella (StoryPerezosa).
+# Así la memoria que hace falta no depende del número de líneas
+# (benchmarks/bench_pdf_grande.py).
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from facturax.configuracion import copiar_permisos
+from facturax.modelos import Factura, Cliente, LineaFactura, SELECT_LINEAS_DE, fabrica, columnas
+from facturax.rectificativas import rectificaciones_de
+
+# Súbelo cada vez que cambie el diseño del PDF: así todas las facturas se
+# vuelven a generar aunque sus datos no hayan cambiado.
+VERSION_PLANTILLA = 1
+
+DIRECTORIO_FACTURAS = "facturas"
+
+# Las facturas con más líneas que esto se hacen en el "modo grande" (ver trozos_story).
+UMBRAL_FACTURA_GRANDE = 200
+# Líneas por tabla en el modo grande (y movimientos por tabla en el extracto de cuenta).
+FILAS_POR_TABLA = 100
+
+# Tablas con cabecera azul (productos, servicios; también el extracto de cuenta).
+ESTILO_TABLA_LINEAS = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#00427c')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (0, 0), 'CENTER'),
+    ('ALIGN', (1, 0), (-1, 0), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#00427c')),
+    ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+    ('ALIGN', (0, 1), (0, -1), 'LEFT')
+])
+# Las mismas tablas en el modo grande: las celdas son texto simple, en letra más pequeña.
+ESTILO_TABLA_GRANDE = TableStyle([('FONTSIZE', (0, 1), (-1, -1), 10)], parent=ESTILO_TABLA_LINEAS)
+# Tabla de totales (la última fila en negrita).
+ESTILO_TABLA_TOTALES = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('BACKGROUND', (0, 0), (-1, -1), colors.white),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#00427c')),
+])
+
+
+@lru_cache(maxsize=1)
+def estilos_factura():
+    """
+    Crea los estilos de texto del PDF. Se crean una sola vez y se reutilizan
+    (antes se volvían a crear con cada factura).
+    """
+    # Coge los estilos de texto predefinidos de la librería `reportlab`.
+    styles = getSampleStyleSheet()
+
+    # Aquí se crean todos los estilos de texto que se van a usar en el PDF.
+    # Es como crear plantillas para los títulos, subtítulos, el texto normal,
+    # y cómo se alinean los párrafos (a la izquierda, derecha o centro).
+    styles.add(ParagraphStyle(name='FacturaHeading1', fontSize=12, fontName='Helvetica-Bold'))
+    styles.add(ParagraphStyle(name='FacturaNormal', fontSize=12, fontName='Helvetica'))
+    styles.add(ParagraphStyle(name='RightAlign', alignment=TA_RIGHT, fontSize=12, fontName='Helvetica'))
+    styles.add(ParagraphStyle(name='LeftAlign', alignment=TA_LEFT, fontSize=12, fontName='Helvetica'))
+    styles.add(ParagraphStyle(name='NormalRight', alignment=TA_RIGHT, fontSize=12, fontName='Helvetica'))
+    styles.add(ParagraphStyle(name='FacturaLeftAlign', alignment=TA_LEFT, fontSize=10, fontName='Helvetica'))
+    styles.add(ParagraphStyle(name='FacturaRightAlign', alignment=TA_RIGHT, fontSize=12, fontName='Helvetica'))
+
+    # Concepto largo de una línea en el modo grande (lo demás va en texto simple, ver _celdas)
+    styles.add(ParagraphStyle(name='FacturaCelda', alignment=TA_LEFT, fontSize=10, leading=12, fontName='Helvetica'))
+
+    # Estilo para la palabra FACTURA
+    styles.add(ParagraphStyle(name='FacturaTitle', alignment=TA_CENTER, fontSize=18, fontName='Helvetica-Bold'))
+
+    # Estilo para datos de empresa
+    styles.add(ParagraphStyle(name='EmpresaLeftAlign', alignment=TA_LEFT, fontSize=10, fontName='Helvetica', leftIndent=20))
+
+    # Estilos de fuente para los datos del cliente
+    styles.add(ParagraphStyle(name='FacturaClienteNormal', fontSize=10, fontName='Helvetica'))
+    styles.add(ParagraphStyle(name='FacturaClienteLeftAlign', alignment=TA_LEFT, fontSize=10, fontName='Helvetica'))
+    styles.add(ParagraphStyle(name='FacturaClienteRightAlign', alignment=TA_RIGHT, fontSize=10, fontName='Helvetica'))
+    styles.add(ParagraphStyle(name='FacturaClienteCentre', alignment=TA_CENTER, fontSize=10, fontName='Helvetica', leftIndent=53))
+    styles.add(ParagraphStyle(name='FacturaClienteLeftIndent', alignment=TA_LEFT, fontSize=10, fontName='Helvetica', leftIndent=110))
+
+    # Estilos para Número de factura y fecha
+    styles.add(ParagraphStyle(name='NumFechaLeftIndent', alignment=TA_LEFT, fontSize=10, fontName='Helvetica', leftIndent=370))
+    return styles
+
+
+def nuevo_documento(ruta):
+    """Documento con el tamaño de página y los márgenes de las facturas."""
+    return SimpleDocTemplate(ruta, pagesize=letter, leftMargin=0.5 * inch, rightMargin=0.5 * inch)
+
+
+def leer_datos_factura(cursor, factura_id, esquema="main"):
+    """
+    Lee de la base de datos todo lo que sale en el PDF de una factura.
+    Devuelve un objeto Factura (con su cliente y sus líneas) o None si la factura no existe.
+    `esquema` es donde está la factura: "main" o el de su archivo (ya adjuntado).
+    """
+    # Coge todos los datos del cliente y la factura de la base de datos
+    # (cada fila se convierte directamente en objetos, sin tuplas intermedias).
+    n = len(Factura.COLUMNAS)
+    cursor.row_factory = lambda _cursor, fila: Factura(*fila[:n], cliente=Cliente(*fila[n:]))
+    cursor.execute(f"""
+        SELECT {columnas(Factura, "f")}, {columnas(Cliente, "c")}
+        FROM {esquema}.facturas f
+        JOIN clientes c ON f.cliente_id = c.id
+        WHERE f.id = ?
+    """, (factura_id,))
+    factura = cursor.fetchone()
+    if factura is None:
+        cursor.row_factory = None
+        return None
+
+    # Coge los productos y servicios de la factura.
+    cursor.row_factory = fabrica(LineaFactura)
+    factura.lineas = cursor.execute(SELECT_LINEAS_DE.format(esquema=esquema), (factura_id,)).fetchall()
+    cursor.row_factory = None
+
+    # Rectificativas: la tabla de enlaces está siempre en la principal (ver facturax/rectificativas.py).
+    for rectificativa_id, numero, fecha, importe, motivo, original_numero, original_fecha in \
+            rectificaciones_de(cursor, factura_id):
+        if rectificativa_id == factura.id:
+            factura.rectifica = (original_numero, original_fecha, motivo)
+        else:
+            factura.rectificaciones.append((numero, fecha, importe, motivo))
+    return factura
+
+
+def calcular_huella(factura, empresa):
+    """
+    Hash de todo lo que aparece en el PDF: cabecera, líneas, datos del cliente,
+    datos de la empresa y versión del diseño. Si no cambia, el PDF tampoco.
+    """
+    cliente = factura.cliente
+    cabecera = [factura.id, factura.numero_completo, factura.fecha, cliente.nombre, cliente.apellido,
+                cliente.direccion, cliente.ciudad, cliente.cp, cliente.email, cliente.telefono, cliente.cif]
+
+    def lineas(tipo):
+        return [[l.nombre, l.cantidad, l.precio_unitario, l.iva_rate, l.irpf_rate]
+                for l in factura.lineas if l.tipo == tipo]
+
+    contenido = [VERSION_PLANTILLA, cabecera, lineas("Producto"), lineas("Servicio"), sorted(empresa.items())]
+    # Solo se añade si hay algo: las facturas sin rectificar conservan su huella (y su PDF).
+    if factura.rectifica or factura.rectificaciones:
+        contenido.append([factura.rectifica, factura.rectificaciones])
+    # Igual con el modo grande (otro diseño de las tablas): solo cambia la huella de esas facturas.
+    if es_factura_grande(factura):
+        contenido.append("grande")
+    texto = json.dumps(contenido, ensure_ascii=False, default=str, separators=(",", ":"))
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class StoryPerezosa(list):
+    """
+    Lista de elementos para `doc.build` que se rellena sobre la marcha.
+    ReportLab va sacando elementos por delante y pregunta `len()` para saber si
+    quedan; cuando se vacía, pedimos el siguiente trozo (la siguiente factura,
+    las siguientes líneas...).
+    """
+
+    def __init__(self, trozos):
+        super().__init__()
+        self._trozos = iter(trozos)
+
+    def __len__(self):
+        n = super().__len__()
+        while n == 0 and self._trozos is not None:
+            try:
+                self.extend(next(self._trozos))
+            except StopIteration:
+                self._trozos = None
+            n = super().__len__()
+        return n
+
+
+def tabla_cabecera(empresa, cliente, ancho):
+    """Tabla de arriba del PDF: datos de la empresa a la izquierda y del cliente a la derecha."""
+    styles = estilos_factura()
+
+    # Se crea la tabla de datos de la empresa con su estilo.
+    data_empresa = [
+        [Paragraph("<b>DATOS DE LA EMPRESA</b>", styles['EmpresaLeftAlign'])],
+        [Paragraph(f"<b>{empresa['nombre_empresa']}</b>", styles['EmpresaLeftAlign'])],
+        [Paragraph(f"<b>Dirección:</b> {empresa['direccion_empresa']}", styles['EmpresaLeftAlign'])],
+        [Paragraph(f"<b>C.P.:</b> {empresa['cp_empresa']}, {empresa['ciudad_empresa']}", styles['EmpresaLeftAlign'])],
+        [Paragraph(f"<b>CIF:</b> {empresa['cif_empresa']}", styles['EmpresaLeftAlign'])],
+        [Paragraph(f"<b>Email:</b> {empresa['email_empresa']}", styles['EmpresaLeftAlign'])],
+        [Paragraph(f"<b>Teléfono:</b> {empresa['telefono_empresa']}", styles['EmpresaLeftAlign'])]
+    ]
+
+    # Se crea la tabla y se le aplica un estilo.
+    table_empresa = Table(data_empresa, colWidths=[ancho / 2.0])
+    table_empresa.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2)
+    ]))
+
+    # Se crea la tabla de datos del cliente con su estilo.
+    data_cliente = [
+        # Puedes usar un estilo con sangría también para el título si quieres
+        [Paragraph("<b>DATOS DEL CLIENTE</b>", styles['FacturaClienteCentre'])],
+        [Paragraph(f"<b>Nombre:</b> {cliente.nombre_completo}", styles['FacturaClienteLeftIndent'])],
+        [Paragraph(f"<b>Dirección:</b> {cliente.direccion}", styles['FacturaClienteLeftIndent'])],
+        [Paragraph(f"<b>C.P.:</b> {cliente.cp}, {cliente.ciudad}", styles['FacturaClienteLeftIndent'])],
+        [Paragraph(f"<b>CIF:</b> {cliente.cif}", styles['FacturaClienteLeftIndent'])],
+        [Paragraph(f"<b>Email:</b> {cliente.email}", styles['FacturaClienteLeftIndent'])],
+        [Paragraph(f"<b>Teléfono:</b> {cliente.telefono}", styles['FacturaClienteLeftIndent'])]
+    ]
+
+    table_cliente = Table(data_cliente, colWidths=[ancho / 2.0])
+    table_cliente.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2)
+    ]))
+
+    # Tabla principal con empresa a la izquierda y cliente a la derecha.
+    # Se unen las dos tablas de arriba en una sola para que salgan una al lado de la otra.
+    data_header_main = [
+        [table_empresa, table_cliente]
+    ]
+
+    # Definimos la tabla principal del encabezado.
+    table_header_main = Table(data_header_main, colWidths=[ancho / 2.0, ancho / 2.0])
+    table_header_main.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 0)
+    ]))
+    return table_header_main
+
+
+def es_factura_grande(factura):
+    return len(factura.lineas) > UMBRAL_FACTURA_GRANDE
+
+
+def _celdas(textos, ancho_concepto, grande):
+    """
+    Celdas de una línea de la factura: el concepto a la izquierda y el resto a la
+    derecha. Normalmente un Paragraph por celda. En el modo grande, texto simple
+    (mucho más ligero), salvo el concepto si no cabe en su columna: ese sí
+    necesita un Paragraph para partirse en varias líneas.
+    """
+    styles = estilos_factura()
+    concepto, *numeros = textos
+    if not grande:
+        return [Paragraph(concepto, styles['LeftAlign'])] + [Paragraph(texto, styles['RightAlign']) for texto in numeros]
+    if stringWidth(concepto, "Helvetica", 10) > ancho_concepto - 12:
+        concepto = Paragraph(concepto, styles['FacturaCelda'])
+    return [concepto] + numeros
+
+
+def _tablas_lineas(cabecera, filas, anchos, grande):
+    """
+    Tablas de productos o de servicios a partir de `filas` (textos de cada línea).
+    Normalmente una sola tabla. En el modo grande, una por cada FILAS_POR_TABLA
+    líneas (con la cabecera repetida si salta de página), y cada una se crea
+    cuando ReportLab la pide: no se tienen todas las celdas a la vez.
+    """
+    if not grande:
+        tabla = Table([cabecera] + [_celdas(textos, anchos[0], False) for textos in filas], colWidths=anchos)
+        tabla.setStyle(ESTILO_TABLA_LINEAS)
+        yield tabla
+        return
+    filas = iter(filas)
+    while True:
+        trozo = [_celdas(textos, anchos[0], True) for textos in islice(filas, FILAS_POR_TABLA)]
+        if not trozo:
+            return
+        tabla = Table([cabecera] + trozo, colWidths=anchos, repeatRows=1)
+        tabla.setStyle(ESTILO_TABLA_GRANDE)
+        yield tabla
+
+
+def trozos_story(factura, empresa, ancho):
+    """
+    Va dando por trozos (listas) los elementos (tablas, párrafos...) de una
+    factura (un objeto Factura con su cliente y sus líneas), para StoryPerezosa.
+    `ancho` es el ancho útil de la página (doc.width).
+    Las facturas de más de UMBRAL_FACTURA_GRANDE líneas van en el modo grande
+    (ver _tablas_lineas): así la memoria no crece con el número de líneas.
+    """
+    styles = estilos_factura()
+    cliente = factura.cliente
+    productos = factura.productos
+    servicios = factura.servicios
+    grande = es_factura_grande(factura)
+
+    story = []
+    # Aquí se empieza a "construir" el contenido.
+    titulo = "FACTURA RECTIFICATIVA" if factura.rectifica else "FACTURA"
+    story.append(Paragraph(f"<b>{titulo}</b>", styles['FacturaTitle']))
+    story.append(Spacer(1, 50))
+
+    story.append(tabla_cabecera(empresa, cliente, ancho))
+    story.append(Spacer(1, 24))
+
+    # Tabla del número de factura y fecha, alineada a la derecha
+    # Se añaden la fecha y el número de factura.
+    factura_info_data = [
+        [Paragraph(f"<b>Número de Factura:</b> {factura.numero_completo}", styles['NumFechaLeftIndent'])],
+        [Paragraph(f"<b>Fecha:</b> {factura.fecha}", styles['NumFechaLeftIndent'])]
+    ]
+    if factura.rectifica:
+        original_numero, original_fecha, motivo = factura.rectifica
+        factura_info_data.append(
+            [Paragraph(f"<b>Rectifica a:</b> {original_numero} ({original_fecha})", styles['NumFechaLeftIndent'])])
+        if motivo:
+            factura_info_data.append([Paragraph(f"<b>Motivo:</b> {motivo}", styles['NumFechaLeftIndent'])])
+    factura_info_table = Table(factura_info_data, hAlign='RIGHT')
+    story.append(factura_info_table)
+    story.append(Spacer(1, 12))
+
+    # Se suman la base imponible, el IVA y el IRPF de productos y servicios antes
+    # de hacer las tablas (en el modo grande las filas se crean más tarde).
+    base_imponible_productos = 0.0
+    iva_total_productos = 0.0
+    for producto in productos:
+        base_imponible_productos += producto.subtotal
+        iva_total_productos += producto.iva
+    base_imponible_servicios = 0.0
+    iva_total_servicios = 0.0
+    irpf_total_servicios = 0.0
+    for servicio in servicios:
+        base_imponible_servicios += servicio.subtotal
+        iva_total_servicios += servicio.iva
+        irpf_total_servicios += servicio.irpf
+
+    # Tabla de productos
+    # Comprueba si hay productos para crear la tabla, si no, se la salta.
+    if productos:
+        story.append(Paragraph("<b>Productos</b>", styles['FacturaHeading1']))
+        story.append(Spacer(1, 20))
+
+        # Textos de cada producto: concepto, cantidad, precio, subtotal, IVA y total.
+        filas = ([producto.nombre, f"{producto.cantidad}", f"{producto.precio_unitario:.2f}€",
+                  f"{producto.subtotal:.2f}€", f"{producto.iva:.2f}€",
+                  f"{round(producto.subtotal + producto.iva, 2):.2f}€"] for producto in productos)
+        cabecera = ["Concepto", "Cantidad", "Precio Unitario", "Subtotal", "IVA", "Total Item"]
+        for tabla in _tablas_lineas(cabecera, filas, [122, 83, 85, 83, 83, 83], grande):
+            story.append(tabla)
+            yield story
+            story = []
+        story.append(Spacer(1, 40))
+
+    # Tabla de servicios
+    # Mismo proceso para los servicios (con el IRPF).
+    if servicios:
+        story.append(Paragraph("<b>Servicios</b>", styles['FacturaHeading1']))
+        story.append(Spacer(1, 20))
+
+        filas = ([servicio.nombre, f"{servicio.cantidad}", f"{servicio.precio_unitario:.2f}€",
+                  f"{servicio.subtotal:.2f}€", f"{servicio.iva:.2f}€",
+                  f"{-servicio.irpf:.2f}€" if servicio.irpf else "0.00€", f"{servicio.total:.2f}€"]
+                 for servicio in servicios)
+        cabecera = ["Concepto", "Cantidad", "Precio Unitario", "Subtotal", "IVA", "IRPF", "Total Item"]
+        for tabla in _tablas_lineas(cabecera, filas, [117, 60, 85, 73, 68, 68, 68], grande):
+            story.append(tabla)
+            yield story
+            story = []
+        story.append(Spacer(1, 40))
+
+    # Tabla de totales
+    # Sumamos todos los totales para la factura final
+    base_imponible_total = base_imponible_productos + base_imponible_servicios
+    iva_total = iva_total_productos + iva_total_servicios
+    irpf_total = irpf_total_servicios
+    total_factura = base_imponible_total + iva_total - irpf_total
+
+    # Se crea la tabla final con los totales.
+    data_totales = [
+        [Paragraph("<b>Base Imponible</b>", styles['RightAlign']),
+         Paragraph(f"<b>{base_imponible_total:.2f}€</b>", styles['RightAlign'])],
+        [Paragraph("<b>Total IVA (21%)</b>", styles['RightAlign']),
+         Paragraph(f"<b>{iva_total:.2f}€</b>", styles['RightAlign'])],
+        [Paragraph("<b>Total IRPF (7%)</b>", styles['RightAlign']),
+         Paragraph(f"<b>{-irpf_total:.2f}€</b>", styles['RightAlign'])],
+        [Paragraph("<b>Total Factura</b>", styles['RightAlign']),
+         Paragraph(f"<b>{total_factura:.2f}€</b>", styles['RightAlign'])]
+    ]
+    # Si la han rectificado, debajo va cada rectificativa y lo que queda de la factura.
+    for numero, fecha, importe, _motivo in factura.rectificaciones:
+        data_totales.append([Paragraph(f"Rectificativa {numero} ({fecha})", styles['RightAlign']),
+                             Paragraph(f"{importe:.2f}€", styles['RightAlign'])])
+    if factura.rectificaciones:
+        data_totales.append([Paragraph("<b>Importe Neto</b>", styles['RightAlign']),
+                             Paragraph(f"<b>{factura.neto:.2f}€</b>", styles['RightAlign'])])
+
+    # Se le aplica un estilo.
+    tabla_totales_interna = Table(data_totales, colWidths=[140, 80])
+    tabla_totales_interna.setStyle(ESTILO_TABLA_TOTALES)
+
+    tabla_totales_externa = Table([[tabla_totales_interna]], colWidths=[550])
+    tabla_totales_externa.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP')
+    ]))
+
+    story.append(Spacer(1, 60))
+    story.append(tabla_totales_externa)
+    yield story
+
+
+def construir_story(factura, empresa, ancho):
+    """
+    Devuelve la lista con todos los elementos de una factura de una vez (ver
+    trozos_story; para las facturas grandes es mejor ir trozo a trozo).
+    """
+    return [elemento for trozo in trozos_story(factura, empresa, ancho) for elemento in trozo]
+
+
+def ruta_pdf_factura(factura_id, directorio=DIRECTORIO_FACTURAS):
+    return os.path.join(directorio, f"Factura_{factura_id}.pdf")
+
+
+def escribir_con_renombrado(ruta, escribir):
+    """
+    Llama a `escribir(ruta_temporal)` y, si acaba bien, renombra el temporal a
+    `ruta` (así nunca queda un archivo a medias). Devuelve lo que devuelva `escribir`.
+    El temporal es único en la misma carpeta: dos procesos que generan el mismo
+    archivo a la vez no se pisan (gana el último en renombrar).
+    """
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    if not os.path.exists(carpeta):
+        os.makedirs(carpeta, exist_ok=True)
+    nombre, extension = os.path.splitext(os.path.basename(ruta))
+    fd, ruta_temporal = tempfile.mkstemp(prefix=f".{nombre}-", suffix=extension, dir=carpeta)
+    os.close(fd)
+    try:
+        resultado = escribir(ruta_temporal)
+        copiar_permisos(ruta_temporal, ruta)
+        os.replace(ruta_temporal, ruta)
+    finally:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+    return resultado
+
+
+def generar_pdf_factura(db_manager, factura_id, empresa, directorio=DIRECTORIO_FACTURAS, forzar=False):
+    """
+    Genera (o reutiliza) el PDF de una factura y devuelve su ruta.
+    Si la factura no ha cambiado desde la última vez y el archivo sigue ahí,
+    se devuelve el PDF existente sin volver a construirlo. Con `forzar=True`
+    se genera siempre. Devuelve None si la factura no existe o está vacía.
+    """
+    # Comprueba si existe la carpeta de las facturas. Si no, la crea.
+    if not os.path.exists(directorio):
+        os.makedirs(directorio, exist_ok=True)
+    ruta_completa = ruta_pdf_factura(factura_id, directorio)
+
+    # Obtener los datos de la factura y los detalles de los items
+    with db_manager.conexion() as conn:
+        cursor = conn.cursor()
+        # Si la factura está archivada, se adjunta su archivo y se lee de allí.
+        esquema = db_manager.localizar_factura(conn, factura_id) or "main"
+        factura = leer_datos_factura(cursor, factura_id, esquema)
+        # Si no encuentra la factura, avisa con un error.
+        if factura is None:
+            print(f"Error: No se encontró la factura con ID {factura_id}")
+            return None
+        if not factura.productos and not factura.servicios:
+            print("Advertencia: La factura no tiene productos ni servicios.")
+            return None
+
+        huella = calcular_huella(factura, empresa)
+        if not forzar and os.path.exists(ruta_completa):
+            cursor.execute(f"SELECT huella, ruta FROM {esquema}.pdf_generados WHERE factura_id = ?", (factura_id,))
+            guardado = cursor.fetchone()
+            if guardado and guardado[0] == huella and guardado[1] == ruta_completa:
+                # Nada ha cambiado: el PDF que ya hay sirve.
+                return ruta_completa
+
+    # Se genera en un archivo temporal y luego se renombra, así nunca queda
+    # un PDF a medias con la huella de uno completo.
+    def escribir(ruta_temporal):
+        doc = nuevo_documento(ruta_temporal)
+        doc.build(StoryPerezosa(trozos_story(factura, empresa, doc.width)))
+
+    escribir_con_renombrado(ruta_completa, escribir)
+
+    with db_manager.conexion() as conn:
+        if esquema != "main":
+            db_manager.localizar_factura(conn, factura_id)
+        conn.execute(f"""
+            INSERT INTO {esquema}.pdf_generados (factura_id, huella, ruta, generado) VALUES (?, ?, ?, ?)
+            ON CONFLICT(factura_id) DO UPDATE SET huella = excluded.huella, ruta = excluded.ruta,
+                                                  generado = excluded.generado
+        """, (factura_id, huella, ruta_completa, datetime.now().isoformat(timespec="seconds")))
+        conn.commit()
+    print(f"PDF de la factura {factura_id} generado correctamente en {ruta_completa}")
+    return ruta_completa
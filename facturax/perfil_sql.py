@@ -0,0 +1,215 @@
+# Perfilado de las consultas SQL.
+#
+# Cuando está activado, las conexiones de `DatabaseManager` miden cuánto tarda
+# cada sentencia (incluyendo leer las filas) y cuántas filas devuelve. Las que
+# pasan del umbral se apuntan en un log rotativo junto con su EXPLAIN QUERY PLAN,
+# para ver si les falta un índice.
+#
+# Cuando está desactivado no se usa nada de esto: `get_db_connection` devuelve
+# una conexión normal de sqlite3, sin ningún coste extra.
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+# Carpeta donde se guardan los logs y perfiles para soporte.
+DIRECTORIO_DIAGNOSTICO = Path(__file__).resolve().parent.parent / "diagnostico"
+
+# Sentencias a las que no tiene sentido pedirles el plan.
+_SIN_PLAN = ("PRAGMA", "EXPLAIN", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE",
+             "CREATE", "DROP", "ALTER", "ATTACH", "DETACH", "VACUUM", "ANALYZE")
+
+
+def _normalizar(sql):
+    # Misma sentencia con distintos espacios = misma entrada en las estadísticas.
+    return " ".join(sql.split())
+
+
+def _params_para_log(params):
+    # No queremos hashes de contraseñas ni binarios en el log.
+    if isinstance(params, dict):
+        return {k: _params_para_log([v])[0] for k, v in params.items()}
+    limpios = []
+    for p in params or ():
+        if isinstance(p, (bytes, bytearray, memoryview)) or (isinstance(p, str) and p.startswith("$2")):
+            limpios.append("***")
+        elif isinstance(p, str) and len(p) > 200:
+            limpios.append(p[:200] + "...")
+        else:
+            limpios.append(p)
+    return limpios
+
+
+class RegistroConsultas:
+    """Acumula tiempos por sentencia y apunta las lentas en un log rotativo."""
+
+    def __init__(self, ruta_log=None, umbral_ms=100.0, max_bytes=1_000_000, copias=5, max_sentencias=500):
+        self.ruta_log = Path(ruta_log) if ruta_log else DIRECTORIO_DIAGNOSTICO / "consultas_lentas.log"
+        self.umbral_ms = umbral_ms
+        self.max_sentencias = max_sentencias
+        self._lock = threading.Lock()
+        self._estadisticas = {}   # sql -> [veces, ms totales, ms máximo, filas totales]
+
+        self.ruta_log.parent.mkdir(parents=True, exist_ok=True)
+        self._handler = RotatingFileHandler(self.ruta_log, maxBytes=max_bytes, backupCount=copias,
+                                            encoding="utf-8", delay=True)
+        self._logger = logging.getLogger(f"facturax.sql.{id(self)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(self._handler)
+
+    def registrar(self, conn, sql, params, duracion_ms, filas):
+        clave = _normalizar(sql)
+        with self._lock:
+            estadistica = self._estadisticas.get(clave)
+            # Si ya hay demasiadas sentencias distintas, las nuevas solo van al log.
+            if estadistica is None and len(self._estadisticas) < self.max_sentencias:
+                estadistica = self._estadisticas[clave] = [0, 0.0, 0.0, 0]
+            if estadistica is not None:
+                estadistica[0] += 1
+                estadistica[1] += duracion_ms
+                estadistica[2] = max(estadistica[2], duracion_ms)
+                estadistica[3] += filas
+        self._quizas_log(conn, clave, sql, params, duracion_ms, filas)
+
+    def _quizas_log(self, conn, clave, sql, params, duracion_ms, filas):
+        if duracion_ms < self.umbral_ms:
+            return
+        entrada = {
+            "fecha": datetime.now().isoformat(timespec="milliseconds"),
+            "ms": round(duracion_ms, 3),
+            "filas": filas,
+            "sql": clave,
+            "params": _params_para_log(params),
+            "plan": self._plan(conn, sql, params),
+        }
+        self._logger.info(json.dumps(entrada, ensure_ascii=False, default=str))
+
+    @staticmethod
+    def _plan(conn, sql, params):
+        if clave_inicial(sql) in _SIN_PLAN:
+            return None
+        try:
+            # Cursor normal (sin medir) para no perfilar el propio EXPLAIN.
+            cursor = sqlite3.Cursor(conn)
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params or ())
+            return [fila[-1] for fila in cursor.fetchall()]
+        except sqlite3.Error as e:
+            return f"sin plan: {e}"
+
+    def resumen(self, limite=20):
+        """Sentencias que más tiempo han consumido en total: (sql, veces, ms total, ms medio, ms máx, filas)."""
+        with self._lock:
+            filas = [(sql, e[0], round(e[1], 3), round(e[1] / e[0], 3), round(e[2], 3), e[3])
+                     for sql, e in self._estadisticas.items()]
+        filas.sort(key=lambda f: f[2], reverse=True)
+        return filas[:limite]
+
+    def cerrar(self):
+        self._logger.removeHandler(self._handler)
+        self._handler.close()
+
+
+def clave_inicial(sql):
+    partes = sql.lstrip().split(None, 1)
+    return partes[0].upper() if partes else ""
+
+
+class CursorPerfilado(sqlite3.Cursor):
+    """Cursor que mide cada sentencia desde el execute hasta que se han leído sus filas."""
+
+    _medida = None   # [sql, params, segundos, filas]
+
+    def execute(self, sql, parameters=()):
+        self._cerrar_medida()
+        inicio = time.perf_counter()
+        super().execute(sql, parameters)
+        self._medida = [sql, parameters, time.perf_counter() - inicio, 0]
+        if self.description is None:
+            # INSERT/UPDATE/DELETE...: no hay filas que leer, se apunta ya.
+            self._medida[3] = max(self.rowcount, 0)
+            self._cerrar_medida()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._cerrar_medida()
+        inicio = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._medida = [sql, (), time.perf_counter() - inicio, max(self.rowcount, 0)]
+        self._cerrar_medida()
+        return self
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        fila = super().fetchone()
+        self._sumar(inicio, 0 if fila is None else 1, terminado=fila is None)
+        return fila
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        filas = super().fetchmany(self.arraysize if size is None else size)
+        self._sumar(inicio, len(filas), terminado=not filas)
+        return filas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        filas = super().fetchall()
+        self._sumar(inicio, len(filas), terminado=True)
+        return filas
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            fila = super().__next__()
+        except StopIteration:
+            self._sumar(inicio, 0, terminado=True)
+            raise
+        self._sumar(inicio, 1, terminado=False)
+        return fila
+
+    def close(self):
+        self._cerrar_medida()
+        super().close()
+
+    def __del__(self):
+        # Si nadie leyó todas las filas, se apunta lo que haya cuando el cursor desaparece.
+        try:
+            self._cerrar_medida()
+        except Exception:
+            pass
+
+    def _sumar(self, inicio, filas, terminado):
+        if self._medida is None:
+            return
+        self._medida[2] += time.perf_counter() - inicio
+        self._medida[3] += filas
+        if terminado:
+            self._cerrar_medida()
+
+    def _cerrar_medida(self):
+        medida, self._medida = self._medida, None
+        if medida is None:
+            return
+        registro = getattr(self.connection, "registro", None)
+        if registro is not None:
+            sql, params, segundos, filas = medida
+            registro.registrar(self.connection, sql, params, segundos * 1000, filas)
+
+
+class ConexionPerfilada(sqlite3.Connection):
+    """Conexión cuyos cursores (y `conn.execute`) pasan por `CursorPerfilado`."""
+
+    registro = None
+
+    def cursor(self, factory=CursorPerfilado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,168 @@
+# Perfilador para cuando un usuario dice "esto va lento".
+#
+# Junta dos cosas a la vez:
+# - cProfile sobre el hilo que arranca el perfil (normalmente el de la ventana),
+#   que se guarda en un .pstats (se abre con `python -m pstats` o snakeviz) y en
+#   un resumen de texto,
+# - un muestreador que cada pocos milisegundos mira la pila de todos los hilos
+#   (como hace py-spy, pero sin instalar nada) y la guarda en formato "collapsed
+#   stacks": una línea "hilo;módulo:función;... veces" por pila, que se convierte
+#   en flamegraph con flamegraph.pl o se arrastra tal cual a speedscope.app.
+#
+# Se puede perfilar durante N segundos o solo la próxima vez que se ejecute una
+# operación de las que mide facturax.metricas (por ejemplo "recarga.facturas").
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from facturax.metricas import metricas
+from facturax.perfil_sql import DIRECTORIO_DIAGNOSTICO
+
+
+class PerfiladorOcupado(Exception):
+    """Ya hay un perfil en marcha (Python solo deja tener un cProfile activo)."""
+
+
+def _nombre_marco(frame):
+    codigo = frame.f_code
+    modulo = os.path.splitext(os.path.basename(codigo.co_filename))[0]
+    return f"{modulo}:{codigo.co_name}"
+
+
+class Muestreador(threading.Thread):
+    """Hilo que apunta cada `intervalo` segundos la pila de todos los demás hilos."""
+
+    def __init__(self, intervalo=0.005):
+        super().__init__(name="muestreador-perfil", daemon=True)
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self.muestras = 0
+        self._parar = threading.Event()
+
+    def run(self):
+        propio = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            nombres = {h.ident: h.name for h in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                pila = []
+                while frame is not None:
+                    pila.append(_nombre_marco(frame))
+                    frame = frame.f_back
+                pila.append(nombres.get(ident, f"hilo-{ident}"))
+                self.pilas[";".join(reversed(pila))] += 1
+            self.muestras += 1
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+class Perfilador:
+    """
+    Arranca y para los perfiles y guarda los resultados en la carpeta de diagnóstico.
+    Solo puede haber uno en marcha a la vez.
+    """
+
+    def __init__(self, directorio=None, intervalo_muestreo=0.005):
+        self.directorio = directorio or DIRECTORIO_DIAGNOSTICO
+        self.intervalo_muestreo = intervalo_muestreo
+        self._lock = threading.Lock()
+        self._perfil = None
+        self._muestreador = None
+        self._nombre = None
+        self._inicio = None
+        self.operacion_armada = None
+        self.ultimos_archivos = None
+
+    @property
+    def activo(self):
+        return self._perfil is not None
+
+    def iniciar(self, nombre="sesion"):
+        """Empieza a perfilar el hilo actual (y a muestrear todos los hilos)."""
+        with self._lock:
+            if self._perfil is not None:
+                raise PerfiladorOcupado("Ya hay un perfil en marcha.")
+            self._perfil = cProfile.Profile()
+            self._nombre = nombre
+        self._inicio = time.perf_counter()
+        self._muestreador = Muestreador(self.intervalo_muestreo)
+        self._muestreador.start()
+        self._perfil.enable()
+
+    def detener(self):
+        """Para el perfil y devuelve las rutas de (pstats, resumen de texto, pilas colapsadas)."""
+        with self._lock:
+            perfil, self._perfil = self._perfil, None
+        if perfil is None:
+            return None
+        perfil.disable()
+        self._muestreador.parar()
+        duracion = time.perf_counter() - self._inicio
+        self.ultimos_archivos = self._guardar(perfil, self._muestreador, duracion)
+        self._muestreador = None
+        return self.ultimos_archivos
+
+    @contextmanager
+    def perfilar(self, nombre):
+        """Perfila lo que se ejecute dentro del bloque `with`."""
+        self.iniciar(nombre)
+        try:
+            yield
+        finally:
+            archivos = self.detener()
+            print(f"[Perfil] {nombre} guardado en {archivos[0]}")
+
+    def armar(self, operacion):
+        """Perfila la próxima vez que se ejecute `operacion` (un nombre de facturax.metricas)."""
+        self.operacion_armada = operacion
+        metricas.observador = self._observar
+
+    def desarmar(self):
+        self.operacion_armada = None
+        if metricas.observador == self._observar:
+            metricas.observador = None
+
+    def _observar(self, nombre):
+        # Lo llama metricas.medir() al empezar cada operación.
+        if nombre != self.operacion_armada or self.activo:
+            return None
+        self.desarmar()
+        return self.perfilar(nombre)
+
+    def _guardar(self, perfil, muestreador, duracion):
+        os.makedirs(self.directorio, exist_ok=True)
+        base = os.path.join(self.directorio,
+                            f"perfil_{self._nombre.replace('.', '_')}_{datetime.now():%Y%m%d_%H%M%S}")
+
+        ruta_pstats = base + ".pstats"
+        perfil.dump_stats(ruta_pstats)
+
+        texto = io.StringIO()
+        texto.write(f"Perfil '{self._nombre}': {duracion:.2f} s, {muestreador.muestras} muestras\n\n")
+        estadisticas = pstats.Stats(perfil, stream=texto)
+        estadisticas.sort_stats("cumulative").print_stats(40)
+        estadisticas.sort_stats("tottime").print_stats(20)
+        ruta_texto = base + ".txt"
+        with open(ruta_texto, "w", encoding="utf-8") as f:
+            f.write(texto.getvalue())
+
+        ruta_pilas = base + ".collapsed.txt"
+        with open(ruta_pilas, "w", encoding="utf-8") as f:
+            for pila, veces in muestreador.pilas.most_common():
+                f.write(f"{pila} {veces}\n")
+
+        return ruta_pstats, ruta_texto, ruta_pilas
+
+
+# Instancia compartida por toda la aplicación.
+perfilador = Perfilador()
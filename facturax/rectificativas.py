@@ -0,0 +1,158 @@
+# Facturas rectificativas (abonos).
+#
+# Una factura emitida no se cambia: si hay que corregirla (devolución, error de
+# precio, descuento después de facturar...) se hace otra factura, de la serie R,
+# con las cantidades en negativo, que apunta a la original. La original y la
+# rectificativa ya no se pueden editar ni borrar.
+#
+# La tabla `rectificaciones` une cada rectificativa con su original (una fila
+# por rectificativa, con índice por original y por fecha) y guarda además los
+# números y el importe de las dos (una factura no cambia de número y la
+# rectificativa no se puede editar). Así:
+# - el importe neto de una factura es su total más la suma de sus filas aquí,
+#   una consulta por índice, sin leer las líneas de las rectificativas,
+# - las rectificaciones de un periodo salen solo de esta tabla, por su fecha,
+# - y da igual que la original o la rectificativa se archiven después: la
+#   tabla se queda en la base de datos principal y sigue teniendo todo lo que
+#   sale en los PDF (por eso no lleva FOREIGN KEY a facturas).
+from datetime import datetime
+
+from facturax.cobros import ajustar_pendiente
+from facturax.facturas import empezar_escritura, guardar_factura_db
+from facturax.modelos import Factura, LineaFactura, SELECT_LINEAS, fabrica, numero_factura
+
+SERIE_RECTIFICATIVA = "R"
+
+
+def crear_tablas(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rectificaciones (
+            rectificativa_id INTEGER PRIMARY KEY,
+            original_id INTEGER NOT NULL,
+            numero TEXT NOT NULL,
+            fecha TEXT NOT NULL,
+            importe REAL NOT NULL,
+            original_numero TEXT NOT NULL,
+            original_fecha TEXT NOT NULL,
+            motivo TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rectificaciones_original ON rectificaciones(original_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rectificaciones_fecha ON rectificaciones(fecha)")
+
+
+def tiene_rectificaciones(conn, factura_id):
+    """True si la factura es una rectificativa o ya la ha rectificado otra (entonces no se toca)."""
+    return conn.execute("SELECT 1 FROM rectificaciones WHERE rectificativa_id = ? UNION ALL "
+                        "SELECT 1 FROM rectificaciones WHERE original_id = ? LIMIT 1",
+                        (factura_id, factura_id)).fetchone() is not None
+
+
+def rectificar_factura(conn, original_id, cantidades=None, motivo="", fecha=None):
+    """
+    Crea la rectificativa de `original_id` y devuelve su id. `cantidades` dice
+    cuánto se abona de cada línea de la original (en su orden, 0 = nada); sin
+    `cantidades` se abona la factura entera. No hace commit.
+    ValueError si la factura no existe (o está archivada), si es una rectificativa,
+    si se abonaría más de lo que queda por abonar o más de lo que queda por cobrar
+    (entonces hay que anular antes los cobros que sobren).
+    """
+    fecha = fecha or datetime.now().strftime("%Y-%m-%d")
+    datetime.strptime(fecha, "%Y-%m-%d")      # ValueError si la fecha no es válida
+    # El UPDATE que no cambia nada bloquea la original (en SQLite, toda la escritura)
+    # hasta el commit: dos rectificativas a la vez no pueden abonar dos veces lo mismo.
+    empezar_escritura(conn)
+    conn.execute("UPDATE facturas SET version = version WHERE id = ?", (original_id,))
+    fila = conn.execute("SELECT cliente_id, fecha, serie, numero, pendiente FROM facturas WHERE id = ?",
+                        (original_id,)).fetchone()
+    if fila is None:
+        raise ValueError(f"La factura {original_id} no existe o pertenece a un ejercicio archivado.")
+    cliente_id, original_fecha, serie, numero, pendiente = fila
+    if fecha < original_fecha:
+        raise ValueError("La rectificativa no puede tener fecha anterior a la factura que rectifica.")
+    if conn.execute("SELECT 1 FROM rectificaciones WHERE rectificativa_id = ?", (original_id,)).fetchone():
+        raise ValueError(f"La factura {original_id} ya es una rectificativa.")
+
+    cursor = conn.cursor()
+    cursor.row_factory = fabrica(LineaFactura)
+    lineas = cursor.execute(SELECT_LINEAS, (original_id,)).fetchall()
+    if cantidades is None:
+        cantidades = [linea.cantidad for linea in lineas]
+    if len(cantidades) != len(lineas):
+        raise ValueError("Hay que indicar la cantidad a abonar de cada línea de la factura.")
+    abonos = []
+    for linea, cantidad in zip(lineas, cantidades):
+        if not 0 <= cantidad <= linea.cantidad:
+            raise ValueError(f"No se pueden abonar {cantidad} de '{linea.nombre}' (la factura tiene {linea.cantidad}).")
+        if cantidad:
+            abonos.append(LineaFactura(linea.producto_id, linea.nombre, -cantidad, linea.precio_unitario,
+                                       linea.iva_rate, linea.irpf_rate, linea.tipo))
+    if not abonos:
+        raise ValueError("La rectificativa no abona nada.")
+
+    rectificativa = Factura(None, cliente_id, 0.0, "Pendiente", fecha, SERIE_RECTIFICATIVA, lineas=abonos)
+    rectificativa.total = rectificativa.calcular_total()
+    neto = saldo_factura(conn, original_id)[2]
+    if neto + rectificativa.total < -0.005:
+        raise ValueError(f"Se abonarían {-rectificativa.total:.2f}€ y de la factura solo quedan {neto:.2f}€.")
+    # Lo ya cobrado no se puede abonar: lo pendiente quedaría negativo (un pago de más
+    # que no saldría en ningún informe). Primero se anulan los cobros que sobren.
+    if pendiente + rectificativa.total < -0.005:
+        raise ValueError(f"Se abonarían {-rectificativa.total:.2f}€ y de la factura solo quedan {pendiente:.2f}€ "
+                         "por cobrar. Anula antes los cobros que sobren.")
+
+    rectificativa.id = guardar_factura_db(conn, cliente_id, abonos, rectificativa.total, fecha=fecha,
+                                          serie=SERIE_RECTIFICATIVA)
+    rectificativa.numero = conn.execute("SELECT numero FROM facturas WHERE id = ?", (rectificativa.id,)).fetchone()[0]
+    conn.execute("""
+        INSERT INTO rectificaciones (rectificativa_id, original_id, numero, fecha, importe, original_numero,
+                                     original_fecha, motivo)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (rectificativa.id, original_id, rectificativa.numero_completo, fecha, rectificativa.total,
+          numero_factura(original_id, serie, numero, original_fecha), original_fecha, motivo))
+    # Lo abonado se descuenta de lo que le queda por cobrar a la original; la
+    # rectificativa en sí no se cobra (queda saldada).
+    ajustar_pendiente(conn, original_id, rectificativa.total)
+    ajustar_pendiente(conn, rectificativa.id, -rectificativa.total)
+    return rectificativa.id
+
+
+def saldo_factura(conn, factura_id, esquema="main"):
+    """(total, total rectificado, importe neto) de una factura, o None si no está en `esquema`."""
+    fila = conn.execute(f"""
+        SELECT f.total, COALESCE(SUM(r.importe), 0)
+        FROM {esquema}.facturas f
+        LEFT JOIN rectificaciones r ON r.original_id = f.id
+        WHERE f.id = ?
+        GROUP BY f.id, f.total
+    """, (factura_id,)).fetchone()
+    if fila is None:
+        return None
+    return fila[0], round(fila[1], 2), round(fila[0] + fila[1], 2)
+
+
+def rectificaciones_de(conn, factura_id):
+    """
+    Las filas de `rectificaciones` en las que sale la factura, como original o como
+    rectificativa: (rectificativa_id, número, fecha, importe, motivo, número de la
+    original, fecha de la original), por fecha.
+    """
+    return conn.execute("""
+        SELECT rectificativa_id, numero, fecha, importe, motivo, original_numero, original_fecha
+        FROM rectificaciones
+        WHERE original_id = ? OR rectificativa_id = ?
+        ORDER BY fecha, rectificativa_id
+    """, (factura_id, factura_id)).fetchall()
+
+
+def rectificaciones_periodo(conn, desde, hasta):
+    """
+    (rectificativa_id, número, fecha, importe, original_id, número de la original, motivo)
+    de las rectificativas con fecha entre `desde` y `hasta` (AAAA-MM-DD, incluidas).
+    """
+    return conn.execute("""
+        SELECT rectificativa_id, numero, fecha, importe, original_id, original_numero, motivo
+        FROM rectificaciones
+        WHERE fecha BETWEEN ? AND ?
+        ORDER BY fecha, rectificativa_id
+    """, (desde, hasta)).fetchall()
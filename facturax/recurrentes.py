@@ -0,0 +1,212 @@
+# Facturas recurrentes: clientes a los que se les factura lo mismo cada mes
+# (cuotas, mantenimientos, alquileres...).
+#
+# Una plantilla guarda el cliente, las líneas y cada cuánto se factura; `proxima`
+# es la fecha de la siguiente factura. generar_facturas() crea de una vez todas
+# las que tocan hasta una fecha:
+# - las plantillas que tocan y sus líneas se leen con una sola consulta,
+# - los números se reservan en bloque (un UPDATE por serie y año, no uno por factura),
+# - las facturas, sus líneas y las nuevas fechas se escriben con executemany,
+# todo en la misma transacción: o se crean todas o ninguna. Como `proxima`
+# avanza en esa misma transacción, lanzarlo dos veces no duplica facturas.
+# Si una plantilla se ha quedado atrás (nadie generó las del mes pasado) se
+# crean también las que faltan, cada una con su fecha.
+#
+# Los totales se calculan con LineaFactura/Factura, igual que en la ventana.
+# Si la línea no tiene precio fijo se usa el precio del producto del momento;
+# las tasas (IVA, IRPF) son siempre las del producto.
+#
+# Desde la línea de comandos (por ejemplo, el día 1 de cada mes):
+#   python -m facturax.recurrentes --hasta 2024-05-31 --pdf
+import argparse
+import calendar
+from collections import Counter
+from datetime import date, datetime
+from itertools import groupby
+
+from facturax.facturas import SERIE_POR_DEFECTO, empezar_escritura, reservar_numeros
+from facturax.modelos import Factura, LineaFactura
+
+# Meses entre una factura y la siguiente.
+PERIODICIDADES = {"mensual": 1, "trimestral": 3, "semestral": 6, "anual": 12}
+# Como mucho se ponen al día tantos periodos atrasados de una plantilla en cada pasada.
+MAX_ATRASADAS = 24
+
+
+def crear_tablas(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS plantillas_factura (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cliente_id INTEGER NOT NULL,
+            descripcion TEXT,
+            periodicidad TEXT NOT NULL,
+            dia INTEGER NOT NULL,
+            proxima TEXT NOT NULL,
+            serie TEXT NOT NULL,
+            activa INTEGER NOT NULL DEFAULT 1,
+            FOREIGN KEY (cliente_id) REFERENCES clientes(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS lineas_plantilla (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plantilla_id INTEGER NOT NULL,
+            producto_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            precio_unitario REAL,
+            FOREIGN KEY (plantilla_id) REFERENCES plantillas_factura(id),
+            FOREIGN KEY (producto_id) REFERENCES productos(id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_plantillas_proxima ON plantillas_factura(activa, proxima)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_lineas_plantilla ON lineas_plantilla(plantilla_id)")
+
+
+def sumar_meses(fecha, meses, dia):
+    """'2024-01-31' + 1 mes con día 31 -> '2024-02-29' (y el siguiente vuelve a ser el 31)."""
+    anio, mes = int(fecha[:4]), int(fecha[5:7]) + meses
+    anio, mes = anio + (mes - 1) // 12, (mes - 1) % 12 + 1
+    return date(anio, mes, min(dia, calendar.monthrange(anio, mes)[1])).isoformat()
+
+
+def crear_plantilla(conn, cliente_id, lineas, periodicidad, proxima, serie=SERIE_POR_DEFECTO, descripcion=""):
+    """
+    Crea una plantilla y devuelve su id. `lineas` son tuplas (producto_id, cantidad,
+    precio_unitario o None para usar el precio del producto). `proxima` es la fecha
+    (AAAA-MM-DD) de la primera factura; su día se mantiene en las siguientes.
+    No hace commit.
+    """
+    if periodicidad not in PERIODICIDADES:
+        raise ValueError(f"Periodicidad no válida: {periodicidad}")
+    if not lineas:
+        raise ValueError("La plantilla necesita al menos una línea.")
+    datetime.strptime(proxima, "%Y-%m-%d")      # ValueError si la fecha no es válida
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO plantillas_factura (cliente_id, descripcion, periodicidad, dia, proxima, serie) "
+                   "VALUES (?, ?, ?, ?, ?, ?)", (cliente_id, descripcion, periodicidad, int(proxima[8:10]), proxima, serie))
+    plantilla_id = cursor.lastrowid
+    cursor.executemany("INSERT INTO lineas_plantilla (plantilla_id, producto_id, cantidad, precio_unitario) "
+                       "VALUES (?, ?, ?, ?)", [(plantilla_id, *linea) for linea in lineas])
+    return plantilla_id
+
+
+def plantilla_desde_factura(conn, factura_id, periodicidad, proxima, descripcion=""):
+    """Plantilla con el cliente, la serie y las líneas (con sus precios) de una factura. No hace commit."""
+    fila = conn.execute("SELECT cliente_id, serie FROM facturas WHERE id = ?", (factura_id,)).fetchone()
+    if fila is None:
+        raise ValueError(f"No existe la factura {factura_id}.")
+    lineas = conn.execute("SELECT producto_id, cantidad, precio_unitario FROM detalles_factura "
+                          "WHERE factura_id = ? ORDER BY id", (factura_id,)).fetchall()
+    return crear_plantilla(conn, fila[0], lineas, periodicidad, proxima, fila[1] or SERIE_POR_DEFECTO, descripcion)
+
+
+def listar_plantillas(conn):
+    """(id, cliente, descripción, periodicidad, próxima, activa, nº de líneas, base imponible) de cada plantilla."""
+    return conn.execute("""
+        SELECT p.id, c.nombre || ' ' || COALESCE(c.apellido, ''), p.descripcion, p.periodicidad, p.proxima,
+               p.activa, COUNT(l.id), SUM(l.cantidad * COALESCE(l.precio_unitario, pr.precio))
+        FROM plantillas_factura p
+        JOIN clientes c ON c.id = p.cliente_id
+        LEFT JOIN lineas_plantilla l ON l.plantilla_id = p.id
+        LEFT JOIN productos pr ON pr.id = l.producto_id
+        GROUP BY p.id, c.nombre, c.apellido, p.descripcion, p.periodicidad, p.proxima, p.activa
+        ORDER BY p.proxima, p.id
+    """).fetchall()
+
+
+def activar_plantilla(conn, plantilla_id, activa):
+    conn.execute("UPDATE plantillas_factura SET activa = ? WHERE id = ?", (1 if activa else 0, plantilla_id))
+    conn.commit()
+
+
+def borrar_plantilla(conn, plantilla_id):
+    """Borra la plantilla (las facturas que ya se generaron con ella se quedan)."""
+    conn.execute("DELETE FROM lineas_plantilla WHERE plantilla_id = ?", (plantilla_id,))
+    conn.execute("DELETE FROM plantillas_factura WHERE id = ?", (plantilla_id,))
+    conn.commit()
+
+
+def generar_facturas(conn, hasta):
+    """
+    Crea todas las facturas de las plantillas activas con fecha hasta `hasta`
+    (AAAA-MM-DD, incluida) y devuelve sus ids. No hace commit: lo hace quien llama.
+    """
+    empezar_escritura(conn)
+    filas = conn.execute("""
+        SELECT p.id, p.cliente_id, p.periodicidad, p.dia, p.proxima, p.serie,
+               l.producto_id, pr.nombre, l.cantidad, COALESCE(l.precio_unitario, pr.precio),
+               pr.iva_rate, pr.irpf_rate, pr.tipo
+        FROM plantillas_factura p
+        JOIN lineas_plantilla l ON l.plantilla_id = p.id
+        JOIN productos pr ON pr.id = l.producto_id
+        WHERE p.activa = 1 AND p.proxima <= ?
+        ORDER BY p.id, l.id
+    """, (hasta,)).fetchall()
+
+    nuevas = []             # Factura (sin id ni número todavía)
+    proximas = []           # (nueva fecha, plantilla_id)
+    for plantilla_id, grupo in groupby(filas, key=lambda fila: fila[0]):
+        grupo = list(grupo)
+        _id, cliente_id, periodicidad, dia, proxima, serie = grupo[0][:6]
+        lineas = [LineaFactura(*fila[6:]) for fila in grupo]
+        for _ in range(MAX_ATRASADAS):
+            if proxima > hasta:
+                break
+            factura = Factura(None, cliente_id, 0.0, "Pendiente", proxima, serie, lineas=lineas)
+            factura.total = factura.calcular_total()
+            nuevas.append(factura)
+            proxima = sumar_meses(proxima, PERIODICIDADES[periodicidad], dia)
+        proximas.append((proxima, plantilla_id))
+    if not nuevas:
+        return []
+
+    # Los números van por orden de fecha dentro de cada serie y año.
+    nuevas.sort(key=lambda factura: factura.fecha)
+    primeros = {(serie, anio): reservar_numeros(conn, serie, anio, cuantas)
+                for (serie, anio), cuantas in Counter((f.serie, int(f.fecha[:4])) for f in nuevas).items()}
+    siguiente = dict(primeros)
+    for factura in nuevas:
+        clave = (factura.serie, int(factura.fecha[:4]))
+        factura.numero, siguiente[clave] = siguiente[clave], siguiente[clave] + 1
+
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO facturas (fecha, cliente_id, total, serie, numero, pendiente) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       [(f.fecha, f.cliente_id, f.total, f.serie, f.numero, f.total) for f in nuevas])
+    # executemany no da los ids: se leen por (serie, año, número), que no se repite.
+    ids = {}
+    for (serie, anio), primero in primeros.items():
+        cursor.execute("SELECT numero, id FROM facturas WHERE serie = ? AND substr(fecha, 1, 4) = ? "
+                       "AND numero BETWEEN ? AND ?", (serie, str(anio), primero, siguiente[(serie, anio)] - 1))
+        ids.update(((serie, anio, numero), factura_id) for numero, factura_id in cursor.fetchall())
+    for factura in nuevas:
+        factura.id = ids[(factura.serie, int(factura.fecha[:4]), factura.numero)]
+
+    cursor.executemany(
+        "INSERT INTO detalles_factura (factura_id, producto_id, cantidad, precio_unitario, iva_rate_aplicado, "
+        "irpf_rate_aplicado) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f.id, l.producto_id, l.cantidad, l.precio_unitario, l.iva_rate, l.irpf_rate) for f in nuevas for l in f.lineas])
+    cursor.executemany("UPDATE plantillas_factura SET proxima = ? WHERE id = ?", proximas)
+    return [factura.id for factura in nuevas]
+
+
+def main(argv=None):
+    from facturax.configuracion import CompanyConfig
+    from facturax.db import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Genera las facturas recurrentes de FacturaX.")
+    parser.add_argument("--db", help="Base de datos (por defecto database/facturacion.db o FACTURAX_DB_URL).")
+    parser.add_argument("--hasta", default=date.today().isoformat(), help="Fecha hasta la que generar (AAAA-MM-DD).")
+    parser.add_argument("--pdf", action="store_true", help="Deja en la cola de tareas la generación de sus PDFs.")
+    args = parser.parse_args(argv)
+
+    db_manager = DatabaseManager(args.db)
+    db_manager.crear_tablas()
+    ids = db_manager.generar_recurrentes(args.hasta, CompanyConfig().cargar_configuracion() if args.pdf else None)
+    print(f"[Recurrentes] {len(ids)} facturas generadas hasta {args.hasta}")
+    if args.pdf and ids:
+        print("[Recurrentes] PDFs en la cola de tareas (python -m facturax.tareas --trabajar)")
+
+
+if __name__ == "__main__":
+    main()
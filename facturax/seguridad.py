@@ -0,0 +1,76 @@
+# Todo lo relacionado con las contraseñas de los usuarios.
+# `bcrypt` es lento a propósito (para que sea caro adivinar contraseñas), así que
+# aquí se decide el coste del hash y se ejecuta el trabajo en un hilo aparte
+# para que la interfaz no se quede congelada mientras tanto.
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# Coste por defecto de bcrypt (el mismo que usa `bcrypt.gensalt()`).
+# Se puede cambiar con la variable de entorno FACTURAX_BCRYPT_ROUNDS.
+BCRYPT_ROUNDS_POR_DEFECTO = 12
+BCRYPT_ROUNDS_MIN = 4
+BCRYPT_ROUNDS_MAX = 31
+
+
+def rounds_configurados():
+    """Devuelve el coste de bcrypt configurado (o el de por defecto si no es válido)."""
+    valor = os.environ.get("FACTURAX_BCRYPT_ROUNDS", "")
+    try:
+        rounds = int(valor)
+    except ValueError:
+        return BCRYPT_ROUNDS_POR_DEFECTO
+    if rounds < BCRYPT_ROUNDS_MIN or rounds > BCRYPT_ROUNDS_MAX:
+        return BCRYPT_ROUNDS_POR_DEFECTO
+    return rounds
+
+
+def _a_bytes(valor):
+    # En la base de datos hay hashes guardados como texto y otros como bytes.
+    return valor.encode('utf-8') if isinstance(valor, str) else valor
+
+
+def rounds_del_hash(hash_guardado):
+    """Lee el coste con el que se creó un hash de bcrypt ($2b$<coste>$...)."""
+    try:
+        return int(_a_bytes(hash_guardado).split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class GestorContrasenas:
+    """Calcula y comprueba hashes de bcrypt con un coste configurable."""
+
+    def __init__(self, rounds=None, max_hilos=2):
+        self.rounds = rounds_configurados() if rounds is None else rounds
+        # Hilos para el trabajo pesado. bcrypt suelta el GIL mientras calcula,
+        # así que la ventana de Tkinter sigue respondiendo.
+        self.ejecutor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="bcrypt")
+
+    def hash(self, contrasena):
+        """Devuelve el hash de la contraseña como texto."""
+        return bcrypt.hashpw(contrasena.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+
+    def verificar(self, contrasena, hash_guardado):
+        """Comprueba si la contraseña coincide con el hash guardado."""
+        try:
+            return bcrypt.checkpw(contrasena.encode('utf-8'), _a_bytes(hash_guardado))
+        except ValueError:
+            # Hash corrupto o con un formato que bcrypt no entiende.
+            return False
+
+    def necesita_rehash(self, hash_guardado):
+        """True si el hash se creó con un coste distinto al configurado ahora."""
+        return rounds_del_hash(hash_guardado) != self.rounds
+
+    # Versiones en segundo plano: devuelven un `Future` en vez del resultado.
+    def enviar(self, funcion, *args):
+        """Ejecuta cualquier función en los hilos de bcrypt."""
+        return self.ejecutor.submit(funcion, *args)
+
+    def hash_async(self, contrasena):
+        return self.ejecutor.submit(self.hash, contrasena)
+
+    def verificar_async(self, contrasena, hash_guardado):
+        return self.ejecutor.submit(self.verificar, contrasena, hash_guardado)
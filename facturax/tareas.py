@@ -0,0 +1,372 @@
+# Cola de tareas largas (exportar cientos de facturas, regenerar PDFs...) guardada
+# en la propia base de datos, en la tabla `tareas`.
+#
+# - Encolar una tarea es solo un INSERT: la ventana no espera a que termine.
+# - El TrabajadorTareas (un hilo) va cogiendo tareas pendientes y las ejecuta en
+#   un grupo de procesos, así no se pelean por el GIL con la ventana.
+# - Coger una tarea es un solo UPDATE ... RETURNING que la pasa de 'pendiente' a
+#   'en_curso'; si dos trabajadores (dos puestos con PostgreSQL, o la ventana y
+#   `python -m facturax.tareas`) van a por la misma, solo uno la consigue.
+# - Mientras se ejecuta, el trabajador renueva su `plazo`. Si el programa se
+#   cierra o se cuelga a mitad, el plazo caduca y la tarea vuelve a la cola; las
+#   pendientes siguen ahí al volver a abrir el programa.
+# - Si falla se reintenta más tarde (30 s, 1 min, 2 min... hasta `max_intentos`).
+#   Los ValueError son datos de la tarea que están mal y no se reintentan.
+#
+# Cada tipo de tarea es una función `(db_manager, parametros, avance) -> texto`
+# registrada con @tipo_tarea. `parametros` es un diccionario (se guarda como JSON)
+# y `avance(hechas, total)` apunta el progreso para que se vea en la ventana.
+#
+# Para dejar un trabajador toda la noche sin abrir la ventana:
+#   python -m facturax.tareas --trabajar
+#   python -m facturax.tareas --listar
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+PENDIENTE, EN_CURSO, HECHA, FALLIDA, CANCELADA = "pendiente", "en_curso", "hecha", "fallida", "cancelada"
+ESTADOS_TAREA = (PENDIENTE, EN_CURSO, HECHA, FALLIDA, CANCELADA)
+
+MAX_INTENTOS = 3
+ESPERA_REINTENTO = 30           # segundos antes del primer reintento (luego se dobla)
+ESPERA_REINTENTO_MAXIMA = 3600
+PLAZO = 300                     # segundos sin noticias del trabajador para dar una tarea por perdida
+
+# nombre -> (función, descripción para la ventana)
+TIPOS = {}
+
+
+def tipo_tarea(nombre, descripcion):
+    """Registra una función como tipo de tarea."""
+    def registrar(funcion):
+        TIPOS[nombre] = (funcion, descripcion)
+        return funcion
+    return registrar
+
+
+def descripcion_tipo(nombre):
+    return TIPOS[nombre][1] if nombre in TIPOS else nombre
+
+
+def _ahora(mas_segundos=0):
+    return (datetime.now() + timedelta(seconds=mas_segundos)).isoformat(timespec="seconds")
+
+
+def crear_tabla(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tareas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            parametros TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            intentos INTEGER NOT NULL DEFAULT 0,
+            max_intentos INTEGER NOT NULL DEFAULT 3,
+            disponible TEXT NOT NULL,
+            creada TEXT NOT NULL,
+            empezada TEXT,
+            terminada TEXT,
+            trabajador TEXT,
+            plazo TEXT,
+            hechas INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            resultado TEXT,
+            error TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tareas_estado ON tareas(estado, disponible)")
+
+
+def encolar(conn, tipo, parametros, max_intentos=MAX_INTENTOS, cuando=None):
+    """Añade una tarea a la cola y devuelve su id. `cuando` (datetime) la retrasa. No hace commit."""
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de tarea desconocido: {tipo}")
+    ahora = _ahora()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO tareas (tipo, parametros, max_intentos, disponible, creada) VALUES (?, ?, ?, ?, ?)",
+                   (tipo, json.dumps(parametros, ensure_ascii=False), max_intentos,
+                    cuando.isoformat(timespec="seconds") if cuando else ahora, ahora))
+    return cursor.lastrowid
+
+
+def reclamar(conn, trabajador, plazo=PLAZO):
+    """
+    Coge la tarea pendiente más antigua que ya se pueda ejecutar y la marca como
+    en curso para `trabajador`. Devuelve (id, tipo, parametros, intentos, max_intentos) o None.
+    """
+    ahora = _ahora()
+    # El estado se vuelve a mirar fuera de la subconsulta: si otro trabajador se la
+    # ha llevado entretanto, el UPDATE no cambia nada y aquí no se coge.
+    filas = conn.execute("""
+        UPDATE tareas SET estado = 'en_curso', intentos = intentos + 1, trabajador = ?, plazo = ?,
+                          empezada = ?, error = NULL
+        WHERE id = (SELECT id FROM tareas WHERE estado = 'pendiente' AND disponible <= ? ORDER BY id LIMIT 1)
+          AND estado = 'pendiente'
+        RETURNING id, tipo, parametros, intentos, max_intentos
+    """, (trabajador, _ahora(plazo), ahora, ahora)).fetchall()
+    conn.commit()
+    if not filas:
+        return None
+    tarea_id, tipo, parametros, intentos, max_intentos = filas[0]
+    return tarea_id, tipo, json.loads(parametros), intentos, max_intentos
+
+
+def renovar(conn, trabajador, ids, plazo=PLAZO):
+    """Alarga el plazo de las tareas que `trabajador` tiene en marcha."""
+    if ids:
+        conn.execute(f"UPDATE tareas SET plazo = ? WHERE trabajador = ? AND estado = 'en_curso' "
+                     f"AND id IN ({', '.join('?' * len(ids))})", (_ahora(plazo), trabajador, *ids))
+        conn.commit()
+
+
+def recuperar_caducadas(conn):
+    """Devuelve a la cola (o da por fallidas) las tareas cuyo trabajador dejó de dar señales."""
+    cursor = conn.execute("""
+        UPDATE tareas SET estado = CASE WHEN intentos >= max_intentos THEN 'fallida' ELSE 'pendiente' END,
+                          error = 'El programa se cerró (o dejó de responder) a mitad de la tarea.',
+                          trabajador = NULL, plazo = NULL
+        WHERE estado = 'en_curso' AND plazo < ?
+    """, (_ahora(),))
+    conn.commit()
+    return cursor.rowcount
+
+
+def terminar(conn, tarea_id, trabajador, resultado):
+    conn.execute("UPDATE tareas SET estado = 'hecha', resultado = ?, terminada = ?, plazo = NULL "
+                 "WHERE id = ? AND trabajador = ?", (resultado, _ahora(), tarea_id, trabajador))
+    conn.commit()
+
+
+def fallar(conn, tarea_id, trabajador, intentos, max_intentos, error, reintentar=True):
+    """Apunta el error y, si quedan intentos, la vuelve a dejar pendiente un rato más tarde."""
+    if reintentar and intentos < max_intentos:
+        espera = min(ESPERA_REINTENTO * 2 ** (intentos - 1), ESPERA_REINTENTO_MAXIMA)
+        conn.execute("UPDATE tareas SET estado = 'pendiente', disponible = ?, error = ?, trabajador = NULL, "
+                     "plazo = NULL WHERE id = ? AND trabajador = ?", (_ahora(espera), error, tarea_id, trabajador))
+    else:
+        conn.execute("UPDATE tareas SET estado = 'fallida', error = ?, terminada = ?, plazo = NULL "
+                     "WHERE id = ? AND trabajador = ?", (error, _ahora(), tarea_id, trabajador))
+    conn.commit()
+
+
+def cancelar(conn, tarea_id):
+    """Cancela una tarea que aún no ha empezado. Devuelve False si ya estaba en marcha o terminada."""
+    cursor = conn.execute("UPDATE tareas SET estado = 'cancelada', terminada = ? WHERE id = ? AND estado = 'pendiente'",
+                          (_ahora(), tarea_id))
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+def reintentar(conn, tarea_id):
+    """Vuelve a poner en la cola una tarea fallida o cancelada, con los intentos a cero."""
+    cursor = conn.execute("""
+        UPDATE tareas SET estado = 'pendiente', intentos = 0, disponible = ?, error = NULL, resultado = NULL,
+                          terminada = NULL, hechas = 0, total = 0
+        WHERE id = ? AND estado IN ('fallida', 'cancelada')
+    """, (_ahora(), tarea_id))
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+def borrar_terminadas(conn):
+    """Borra las tareas hechas y canceladas. Devuelve cuántas."""
+    cursor = conn.execute("DELETE FROM tareas WHERE estado IN ('hecha', 'cancelada')")
+    conn.commit()
+    return cursor.rowcount
+
+
+def listar(conn, limite=200):
+    """Las últimas tareas: (id, tipo, estado, intentos, max_intentos, hechas, total, creada, terminada, resultado, error)."""
+    return conn.execute("""
+        SELECT id, tipo, estado, intentos, max_intentos, hechas, total, creada, terminada, resultado, error
+        FROM tareas ORDER BY id DESC LIMIT ?
+    """, (limite,)).fetchall()
+
+
+# --- Lo que se ejecuta en los procesos ---
+# Cada proceso abre su propio DatabaseManager una sola vez (al arrancar).
+
+_db_proceso = None
+
+
+def _iniciar_proceso(db_path, url, esquema):
+    global _db_proceso
+    from facturax.almacen import MotorPostgres
+    from facturax.db import DatabaseManager
+    motor = MotorPostgres(url, minimo=0, maximo=2, esquema=esquema) if url else None
+    _db_proceso = DatabaseManager(db_path, motor=motor)
+
+
+def _ejecutar(funcion, tarea_id, parametros):
+    with _db_proceso.conexion() as conn:
+        ultimo = [0.0]
+
+        def avance(hechas, total):
+            # Como mucho una escritura por segundo (y siempre la última).
+            if hechas < total and time.monotonic() - ultimo[0] < 1.0:
+                return
+            ultimo[0] = time.monotonic()
+            conn.execute("UPDATE tareas SET hechas = ?, total = ? WHERE id = ?", (hechas, total, tarea_id))
+            conn.commit()
+
+        return funcion(_db_proceso, parametros, avance)
+
+
+class TrabajadorTareas(threading.Thread):
+    """
+    Hilo que cada `intervalo` segundos recoge las tareas terminadas y, si hay
+    procesos libres, coge más de la cola. Ejecuta hasta `procesos` a la vez.
+    """
+
+    def __init__(self, db_manager, procesos=2, intervalo=1.0, plazo=PLAZO):
+        super().__init__(name="tareas-cola", daemon=True)
+        self.db_manager = db_manager
+        self.procesos = procesos
+        self.intervalo = intervalo
+        self.plazo = plazo
+        # Nombre único (los puestos comparten la tabla con PostgreSQL).
+        self.nombre = f"{socket.gethostname()}-{os.getpid()}"
+        self._en_marcha = {}        # futuro -> (id, intentos, max_intentos)
+        self._pool = None
+        self._parar = threading.Event()
+
+    def _nuevo_pool(self):
+        motor = self.db_manager.motor
+        # "spawn": los procesos no heredan los hilos ni las conexiones abiertas de la ventana.
+        return ProcessPoolExecutor(
+            max_workers=self.procesos, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_iniciar_proceso,
+            initargs=(self.db_manager.db_path, getattr(motor, "url", None), getattr(motor, "esquema", None)))
+
+    def run(self):
+        self._pool = self._nuevo_pool()
+        ultima_renovacion = 0.0
+        with self.db_manager.conexion() as conn:
+            while not self._parar.is_set():
+                try:
+                    self._recoger(conn)
+                    if time.monotonic() - ultima_renovacion > self.plazo / 3:
+                        renovar(conn, self.nombre, [tarea_id for tarea_id, _i, _m in self._en_marcha.values()], self.plazo)
+                        recuperar_caducadas(conn)
+                        ultima_renovacion = time.monotonic()
+                    while len(self._en_marcha) < self.procesos and not self._parar.is_set():
+                        tarea = reclamar(conn, self.nombre, self.plazo)
+                        if tarea is None:
+                            break
+                        self._lanzar(conn, *tarea)
+                except sqlite3.Error as e:
+                    print(f"[Tareas] Error con la base de datos: {e}")
+                    conn.rollback()
+                self._parar.wait(self.intervalo)
+
+    def _lanzar(self, conn, tarea_id, tipo, parametros, intentos, max_intentos):
+        if tipo not in TIPOS:
+            # Encolada por una versión del programa que conoce tipos que esta no tiene.
+            fallar(conn, tarea_id, self.nombre, intentos, max_intentos, f"Tipo de tarea desconocido: {tipo}", False)
+            return
+        try:
+            futuro = self._pool.submit(_ejecutar, TIPOS[tipo][0], tarea_id, parametros)
+        except BrokenProcessPool:
+            self._pool = self._nuevo_pool()
+            futuro = self._pool.submit(_ejecutar, TIPOS[tipo][0], tarea_id, parametros)
+        self._en_marcha[futuro] = (tarea_id, intentos, max_intentos)
+
+    def _recoger(self, conn):
+        roto = False
+        for futuro in [f for f in self._en_marcha if f.done()]:
+            tarea_id, intentos, max_intentos = self._en_marcha.pop(futuro)
+            try:
+                terminar(conn, tarea_id, self.nombre, str(futuro.result() or ""))
+            except BrokenProcessPool:
+                roto = True
+                fallar(conn, tarea_id, self.nombre, intentos, max_intentos, "El proceso de la tarea se cerró de golpe.")
+            except ValueError as e:
+                fallar(conn, tarea_id, self.nombre, intentos, max_intentos, str(e), reintentar=False)
+            except Exception as e:
+                fallar(conn, tarea_id, self.nombre, intentos, max_intentos, f"{type(e).__name__}: {e}")
+        if roto and not self._en_marcha:
+            self._pool = self._nuevo_pool()
+
+    def parar(self):
+        """Deja de coger tareas. Las que estén en marcha vuelven a la cola cuando caduque su plazo."""
+        self._parar.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Tipos de tarea ---
+
+@tipo_tarea("exportar_pdf", "Exportar facturas a un PDF")
+def _exportar_pdf(db_manager, parametros, avance):
+    from facturax.exportacion import exportar_pdf_combinado
+    incluidas = exportar_pdf_combinado(db_manager, parametros["facturas"], parametros["empresa"],
+                                       parametros["ruta"], avance)
+    return f"{incluidas} facturas en {parametros['ruta']}"
+
+
+@tipo_tarea("exportar_zip", "Exportar facturas a un ZIP")
+def _exportar_zip(db_manager, parametros, avance):
+    from facturax.exportacion import exportar_zip
+    añadidas = exportar_zip(db_manager, parametros["facturas"], parametros["empresa"], parametros["ruta"], avance)
+    return f"{añadidas} facturas en {parametros['ruta']}"
+
+
+@tipo_tarea("extracto_cliente", "Extracto de cuenta de un cliente")
+def _extracto_cliente(db_manager, parametros, avance):
+    from facturax.extractos import generar_extracto
+    resumen = generar_extracto(db_manager, parametros["cliente"], parametros["empresa"], parametros["ruta"],
+                               parametros.get("desde"), parametros.get("hasta"), avance)
+    return f"{resumen['movimientos']} movimientos, saldo {resumen['saldo']:.2f}€, en {parametros['ruta']}"
+
+
+@tipo_tarea("generar_pdfs", "Generar los PDFs de las facturas")
+def _generar_pdfs(db_manager, parametros, avance):
+    from facturax.pdf import generar_pdf_factura
+    facturas_ids = parametros["facturas"]
+    generados = 0
+    for n, factura_id in enumerate(facturas_ids, start=1):
+        if generar_pdf_factura(db_manager, factura_id, parametros["empresa"], forzar=parametros.get("forzar", False)):
+            generados += 1
+        avance(n, len(facturas_ids))
+    return f"{generados} de {len(facturas_ids)} PDFs generados"
+
+
+def main(argv=None):
+    from facturax.db import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Cola de tareas de FacturaX.")
+    parser.add_argument("--db", help="Base de datos (por defecto database/facturacion.db o FACTURAX_DB_URL).")
+    parser.add_argument("--trabajar", action="store_true", help="Ejecuta las tareas pendientes hasta que se pare (Ctrl+C).")
+    parser.add_argument("--procesos", type=int, default=2, help="Tareas a la vez.")
+    parser.add_argument("--listar", action="store_true", help="Muestra las últimas tareas.")
+    args = parser.parse_args(argv)
+    if not (args.trabajar or args.listar):
+        parser.error("Indica --trabajar o --listar.")
+
+    db_manager = DatabaseManager(args.db)
+    db_manager.crear_tablas()
+
+    if args.listar:
+        for tarea_id, tipo, estado, intentos, max_intentos, hechas, total, creada, _t, resultado, error in db_manager.tareas():
+            print(f"  {tarea_id:>6} {descripcion_tipo(tipo):<35} {estado:<10} {intentos}/{max_intentos} "
+                  f"{hechas}/{total}  {creada}  {error or resultado or ''}")
+    if args.trabajar:
+        trabajador = TrabajadorTareas(db_manager, procesos=args.procesos)
+        trabajador.start()
+        print(f"[Tareas] Trabajando como {trabajador.nombre} con {args.procesos} procesos (Ctrl+C para parar)")
+        try:
+            while trabajador.is_alive():
+                trabajador.join(1)
+        except KeyboardInterrupt:
+            trabajador.parar()
+
+
+if __name__ == "__main__":
+    main()